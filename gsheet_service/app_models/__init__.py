@@ -1,11 +1,59 @@
+import datetime
+import hashlib
+import json
+import uuid
+
 import databases
 import orm
 import sqlalchemy
+from gspread import utils
+from gspread.exceptions import NoValidUrlKeyFound
 from orm.exceptions import NoMatch
 
+from gsheet_service.local_cache import TTLCache
+
 from .caches import RequestCache
 
 
+def request_key(obj, secret: str) -> str:
+    """Fixed width cache key of a request payload. The payload is dumped as
+    canonical JSON so the order of its keys does not matter."""
+    value = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.blake2b(
+        value.encode("utf-8"), digest_size=32, key=secret.encode("utf-8")[:64]
+    )
+    return digest.hexdigest()
+
+
+def content_etag(data) -> str:
+    """Strong ETag of a response `data`, equal data always gets the same one."""
+    value = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+# worksheet tag of responses that may read several worksheets, and of rows
+# cached before responses were tagged per worksheet. They are dropped along
+# with the responses of any worksheet of their link
+ANY_SHEET = "*"
+
+
+def cache_tags(link, sheet=None):
+    """The spreadsheet and worksheet a cached response belongs to, writes
+    drop only the responses carrying their own tags."""
+    try:
+        link = utils.extract_id_from_url(link)
+    except (NoValidUrlKeyFound, TypeError):
+        pass
+    return link, sheet.strip().lower() if sheet else None
+
+
+def generation_key(sheet_link: str) -> str:
+    """Key of the row holding the invalidation generation of `sheet_link`."""
+    digest = hashlib.blake2b(str(sheet_link).encode("utf-8"), digest_size=16)
+    return f"generation:{digest.hexdigest()}"
+
+
 def queryable(model, database, metadata, root=None):
 
     attributes = model.__dict__.copy()
@@ -67,28 +115,117 @@ class ServiceAPI:
         else:
             await self.database.disconnect()
 
+    @property
+    def table(self) -> sqlalchemy.Table:
+        return self.RequestCache.__table__
+
+    def live(self, now=None):
+        now = now or datetime.datetime.utcnow()
+        expires_at = self.table.c.expires_at
+        return sqlalchemy.or_(expires_at.is_(None), expires_at > now)
+
+    async def get_entry(self, request_id: str):
+        table = self.table
+        query = sqlalchemy.select(
+            [
+                table.c.data,
+                table.c.sheet_link,
+                table.c.sheet_name,
+                table.c.revision,
+                table.c.created_at,
+                table.c.expires_at,
+            ]
+        ).where(sqlalchemy.and_(table.c.request_id == request_id, self.live()))
+        return await self.database.fetch_one(query)
+
     async def get_record(self, request_id: str):
-        try:
-            result = await self.RequestCache.objects.filter(
-                request_id=request_id
-            ).first()
-            return result.data
-        except NoMatch as e:
-            return None
+        result = await self.get_entry(request_id)
+        if result:
+            return result["data"]
+        return None
 
-    async def update_record(self, request_id: str, data):
-        # check if it exists if it does, update else create
-        try:
-            result = await self.RequestCache.objects.filter(
-                request_id=request_id
-            ).first()
-            result.data = data
-            await result.save()
-        except NoMatch as e:
-            await self.RequestCache.objects.create(request_id=request_id, data=data)
+    async def update_record(
+        self,
+        request_id: str,
+        data,
+        sheet_link: str = None,
+        sheet_name: str = None,
+        ttl: int = None,
+        revision: str = None,
+    ):
+        """Inserts or replaces the cached response of `request_id` with a
+        single statement, concurrent misses can not add duplicate rows."""
+        table = self.table
+        now = datetime.datetime.utcnow()
+        expires_at = now + datetime.timedelta(seconds=ttl) if ttl else None
+        # ON CONFLICT is understood by both postgres and sqlite
+        query = sqlalchemy.text(
+            f"INSERT INTO {table.name} "
+            "(request_id, data, sheet_link, sheet_name, revision, created_at, "
+            "expires_at) VALUES (:request_id, :data, :sheet_link, :sheet_name, "
+            ":revision, :created_at, :expires_at) "
+            "ON CONFLICT (request_id) DO UPDATE SET "
+            "data = excluded.data, sheet_link = excluded.sheet_link, "
+            "sheet_name = excluded.sheet_name, revision = excluded.revision, "
+            "created_at = excluded.created_at, expires_at = excluded.expires_at"
+        )
+        values = dict(
+            request_id=request_id,
+            data=data,
+            sheet_link=sheet_link,
+            sheet_name=sheet_name,
+            revision=revision,
+            created_at=now,
+            expires_at=expires_at,
+        )
+        # typed parameters so `data` goes through the JSON column processor
+        query = query.bindparams(
+            *[
+                sqlalchemy.bindparam(x, value=y, type_=table.c[x].type)
+                for x, y in values.items()
+            ]
+        )
+        await self.database.execute(query)
+
+    async def touch(self, request_id: str, ttl: int = None):
+        """Restarts the lifetime of a cached response that was found to be
+        unchanged."""
+        table = self.table
+        now = datetime.datetime.utcnow()
+        expires_at = now + datetime.timedelta(seconds=ttl) if ttl else None
+        query = (
+            table.update()
+            .where(table.c.request_id == request_id)
+            .values(created_at=now, expires_at=expires_at)
+        )
+        await self.database.execute(query)
+
+    async def delete_tagged(self, sheet_link: str, sheet_name: str = None) -> int:
+        table = self.table
+        condition = table.c.sheet_link == sheet_link
+        if sheet_name:
+            names = table.c.sheet_name.in_([sheet_name, ANY_SHEET])
+            condition = sqlalchemy.and_(condition, names)
+        query = sqlalchemy.select([sqlalchemy.func.count()]).where(condition)
+        count = await self.database.fetch_val(query)
+        if count:
+            await self.database.execute(table.delete().where(condition))
+        await self.update_record(generation_key(sheet_link), uuid.uuid4().hex)
+        return count
+
+    async def generation(self, sheet_link: str) -> str:
+        """Token replaced on every invalidation of `sheet_link`, processes
+        sharing the table compare it to notice the ones made by the others."""
+        result = await self.get_entry(generation_key(sheet_link))
+        return result["data"] if result else ""
+
+    async def reap_expired(self):
+        table = self.table
+        query = table.delete().where(table.c.expires_at <= datetime.datetime.utcnow())
+        await self.database.execute(query)
 
     async def purge_db(self):
-        await self.RequestCache.objects.filter(id__gt=-1).delete()
+        await self.database.execute(self.table.delete())
 
     async def delete_record(self, request_id: str):
         try:
@@ -101,4 +238,148 @@ class ServiceAPI:
             return None
 
 
+def freshness(created_at, fresh: int, stale: int, max_age: float = None) -> str:
+    """Whether an entry fetched at `created_at` can be served as is ("fresh"),
+    served while it is refreshed ("stale") or has to be fetched again
+    ("expired"). A `fresh` of 0 never goes stale, a `max_age` given by the
+    caller rules out serving stale entries."""
+    age = (datetime.datetime.utcnow() - created_at).total_seconds()
+    if max_age is not None and age > max_age:
+        return "expired"
+    if not fresh or age <= fresh:
+        return "fresh"
+    if max_age is None and age <= fresh + stale:
+        return "stale"
+    return "expired"
+
+
+def is_fresh(entry, fresh: float = None) -> bool:
+    return freshness(entry["created_at"], fresh, 0) == "fresh"
+
+
+def entry_size(entry) -> int:
+    return len(json.dumps(entry["data"], default=str))
+
+
+class TieredCache:
+    """In-process LRU in front of the `ServiceAPI` table. Hits on the local
+    tier skip the database and the JSON decoding of the stored response.
+    Writes go through to both tiers and invalidations are applied to both.
+    Local entries past their freshness window are checked against the
+    backend again, which is how invalidations made by other processes are
+    seen."""
+
+    def __init__(self, local: TTLCache, backend: ServiceAPI = None):
+        self.local = local
+        self.backend = backend
+        self.counters = {"hits": 0, "misses": 0}
+
+    @property
+    def stats(self):
+        local = {**self.local.stats, "entries": len(self.local)}
+        return {
+            "local": {**local, "bytes": self.local.bytes},
+            "database": dict(self.counters),
+        }
+
+    def local_ttl(self, ttl=None):
+        return min(self.local.ttl, ttl) if ttl else self.local.ttl
+
+    async def get_record(self, request_id: str):
+        entry = await self.get_entry(request_id)
+        if entry is not None:
+            return entry["data"]
+        return None
+
+    async def get_entry(self, request_id: str, fresh: float = None):
+        """Returns the cached `data` of `request_id` along with the time it
+        was fetched at. A local entry older than `fresh` seconds is only
+        served if the backend still holds it."""
+        entry = self.local.get(request_id)
+        if entry is not None and (not self.backend or is_fresh(entry, fresh)):
+            return entry
+        if not self.backend:
+            return None
+        result = await self.backend.get_entry(request_id)
+        if not result:
+            self.local.delete(request_id)
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        ttl = None
+        if result["expires_at"]:
+            ttl = (result["expires_at"] - datetime.datetime.utcnow()).total_seconds()
+        entry = {
+            "data": result["data"],
+            "tags": (result["sheet_link"], result["sheet_name"]),
+            "revision": result["revision"],
+            "etag": content_etag(result["data"]),
+            "created_at": result["created_at"] or datetime.datetime.utcnow(),
+        }
+        self.local.set(request_id, entry, ttl=self.local_ttl(ttl))
+        return entry
+
+    async def update_record(
+        self,
+        request_id: str,
+        data,
+        sheet_link: str = None,
+        sheet_name: str = None,
+        ttl: int = None,
+        revision: str = None,
+    ):
+        entry = {
+            "data": data,
+            "tags": (sheet_link, sheet_name),
+            "revision": revision,
+            "etag": content_etag(data),
+            "created_at": datetime.datetime.utcnow(),
+        }
+        self.local.set(request_id, entry, ttl=self.local_ttl(ttl))
+        if self.backend:
+            await self.backend.update_record(
+                request_id, data, sheet_link, sheet_name, ttl=ttl, revision=revision
+            )
+        return entry
+
+    async def touch(self, request_id: str, entry, ttl: int = None):
+        entry = {**entry, "created_at": datetime.datetime.utcnow()}
+        self.local.set(request_id, entry, ttl=self.local_ttl(ttl))
+        if self.backend:
+            await self.backend.touch(request_id, ttl=ttl)
+
+    async def delete_tagged(self, sheet_link: str, sheet_name: str = None) -> int:
+        def tagged(key, entry):
+            link, name = entry["tags"]
+            return link == sheet_link and (
+                not sheet_name or name in (sheet_name, ANY_SHEET)
+            )
+
+        count = self.local.delete_where(tagged)
+        if self.backend:
+            count = await self.backend.delete_tagged(sheet_link, sheet_name)
+        return count
+
+    async def generation(self, sheet_link: str):
+        """Invalidation generation of `sheet_link` in the backend, None when
+        the backend is not shared with other processes."""
+        if self.backend:
+            return await self.backend.generation(sheet_link)
+        return None
+
+    def forget_local(self, sheet_link: str) -> int:
+        return self.local.delete_where(
+            lambda key, entry: entry["tags"][0] == sheet_link
+        )
+
+    async def purge_db(self):
+        self.local.clear()
+        if self.backend:
+            await self.backend.purge_db()
+
+    async def reap_expired(self):
+        if self.backend:
+            await self.backend.reap_expired()
+
+
 # service = ServiceAPI(settings.DATABASE_URL)
@@ -18,5 +18,14 @@ def new_timezone():
 class RequestCache(object):
     __tablename__ = "sheet_request_cache"
     id = orm.Integer(primary_key=True)
-    request_id = orm.Text()
+    # hex digest from `request_key`, see migration e6b1c47d2f90
+    request_id = orm.String(max_length=64, index=True, unique=True)
     data = orm.JSON(default={})
+    # cache tags, see `sheet_service.sheet_tags`
+    sheet_link = orm.Text(allow_null=True)
+    sheet_name = orm.Text(allow_null=True)
+    # Drive revision of the spreadsheet when the response was fetched
+    revision = orm.String(max_length=64, allow_null=True)
+    created_at = orm.DateTime(default=datetime.datetime.utcnow)
+    # rows past `expires_at` are ignored on read and reaped in the background
+    expires_at = orm.DateTime(allow_null=True, index=True)
@@ -0,0 +1,499 @@
+import asyncio
+import typing
+from urllib.parse import quote
+
+import httpx
+from gspread import utils
+from gspread.exceptions import CellNotFound
+from gspread.models import Cell
+
+from gsheet_service import models
+
+SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+
+_http_client: typing.Optional[httpx.AsyncClient] = None
+http_options = {"http2": True, "max_connections": 100, "max_keepalive": 20}
+
+
+def http_client() -> httpx.AsyncClient:
+    """Shared keep-alive connection pool used by every async interface."""
+    global _http_client
+    if _http_client is None:
+        limits = httpx.Limits(
+            max_connections=http_options["max_connections"],
+            max_keepalive_connections=http_options["max_keepalive"],
+        )
+        _http_client = httpx.AsyncClient(
+            http2=http_options["http2"], limits=limits, timeout=30
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class AsyncGoogleSheetInterface:
+    """Speaks the Sheets v4 REST API directly over the shared async http client.
+    Keeps the method surface of `models.GoogleSheetInterface` with every method
+    being a coroutine, so the service functions await either one the same way.
+    `worksheets` is left out as it hands out gspread objects, sheets are the
+    property dicts `get_sheet_by_name` returns."""
+
+    def __init__(self, executor=None, **credentials):
+        self.executor = executor
+        self.credentials = credentials
+        self.spreadsheet_id = None
+        self.metadata = None
+        self.sheet = None
+        self._snapshot = None
+
+    async def authorization(self):
+        # the client pool owns token minting and proactive refreshes
+        if self.executor:
+            gc = await self.executor.run(
+                models.client_pool.get_client, **self.credentials
+            )
+        else:
+            gc = models.client_pool.get_client(**self.credentials)
+        return {"Authorization": f"Bearer {gc.auth.token}"}
+
+    async def request(self, method, path="", params=None, json=None):
+        headers = await self.authorization()
+        response = await http_client().request(
+            method,
+            f"{SHEETS_API_URL}/{self.spreadsheet_id}{path}",
+            params=params,
+            json=json,
+            headers=headers,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    @property
+    def title(self):
+        return self.sheet["title"]
+
+    def range_name(self, range_name=None):
+        return utils.absolute_range_name(self.title, range_name)
+
+    async def values_get(self, range_name, params=None):
+        path = f"/values/{quote(range_name, safe='')}"
+        return await self.request("get", path, params=params)
+
+    async def values_batch_get(self, ranges, params=None):
+        # long lists of ranges are split over concurrent requests
+        chunks = models.batch_chunks(ranges)
+        responses = await asyncio.gather(
+            *[
+                self.request(
+                    "get", "/values:batchGet", params={**(params or {}), "ranges": x}
+                )
+                for x in chunks
+            ]
+        )
+        return [x.get("values", []) for y in responses for x in y["valueRanges"]]
+
+    async def values_update(self, range_name, values, value_input_option="RAW"):
+        path = f"/values/{quote(range_name, safe='')}"
+        params = {
+            "valueInputOption": value_input_option,
+            "includeValuesInResponse": "true",
+            "responseValueRenderOption": "FORMATTED_VALUE",
+        }
+        return await self.request("put", path, params=params, json={"values": values})
+
+    async def values_batch_update(self, data, value_input_option="USER_ENTERED"):
+        body = {
+            "valueInputOption": value_input_option,
+            "includeValuesInResponse": True,
+            "responseValueRenderOption": "FORMATTED_VALUE",
+            "data": [dict(x, range=self.range_name(x["range"])) for x in data],
+        }
+        return await self.request("post", "/values:batchUpdate", json=body)
+
+    async def batch_update(self, body):
+        return await self.request("post", ":batchUpdate", json=body)
+
+    async def open_file(self, url: str, refresh=False):
+        self.spreadsheet_id = utils.extract_id_from_url(url)
+        metadata = None if refresh else models.metadata_cache.get(self.spreadsheet_id)
+        if metadata is None:
+            params = {"includeGridData": "false"}
+            metadata = models.trim_metadata(await self.request("get", params=params))
+            models.metadata_cache.set(self.spreadsheet_id, metadata)
+        self.metadata = metadata
+        return self
+
+    async def invalidate_file(self):
+        if self.spreadsheet_id:
+            models.metadata_cache.delete(self.spreadsheet_id)
+
+    async def get_revision(self, url: str) -> str:
+        headers = await self.authorization()
+        response = await http_client().request(
+            "get",
+            f"{DRIVE_FILES_URL}/{utils.extract_id_from_url(url)}",
+            params={"fields": models.REVISION_FIELDS, "supportsAllDrives": "true"},
+            headers=headers,
+        )
+        response.raise_for_status()
+        return models.revision_token(response.json())
+
+    async def drive_request(self, url, params=None, json=None):
+        headers = await self.authorization()
+        response = await http_client().request(
+            "post", url, params=params, json=json, headers=headers
+        )
+        response.raise_for_status()
+        return response
+
+    async def watch_file(self, file_id: str, channel):
+        response = await self.drive_request(
+            f"{DRIVE_FILES_URL}/{file_id}/watch",
+            params={"supportsAllDrives": "true"},
+            json=channel,
+        )
+        return response.json()
+
+    async def stop_channel(self, channel):
+        await self.drive_request(models.DRIVE_CHANNELS_STOP_URL, json=channel)
+
+    async def sheet_names(self):
+        return [x["properties"]["title"] for x in self.metadata["sheets"]]
+
+    async def summary(self):
+        return {
+            "title": self.metadata["properties"]["title"],
+            "sheet_names": await self.sheet_names(),
+        }
+
+    async def get_sheet_names(self, url: str, refresh=False):
+        await self.open_file(url, refresh=refresh)
+        return await self.sheet_names()
+
+    async def get_spreadsheet_title(self, url: str, refresh=False):
+        await self.open_file(url, refresh=refresh)
+        return self.metadata["properties"]["title"]
+
+    async def get_sheet_by_name(self, name):
+        result = [
+            x["properties"]
+            for x in self.metadata["sheets"]
+            if models.sheet_matches(name, x["properties"]["title"])
+        ]
+        if result:
+            return result[0]
+
+    async def load_file(self, url: str, sheet_name: str):
+        self._snapshot = None
+        await self.open_file(url)
+        self.sheet = await self.get_sheet_by_name(sheet_name)
+        if not self.sheet:
+            await self.open_file(url, refresh=True)
+            self.sheet = await self.get_sheet_by_name(sheet_name)
+        return self
+
+    async def populate_heading(self, heading):
+        heading_range = models.a1_range(1, 1, 1, len(heading))
+        await self.values_update(self.range_name(heading_range), [heading])
+
+    async def create_new_sheet(self, url: str, name: str, heading):
+        await self.open_file(url)
+        properties = {
+            "title": name,
+            "sheetType": "GRID",
+            "gridProperties": {"rowCount": 1000, "columnCount": 10},
+        }
+        response = await self.batch_update(
+            {"requests": [{"addSheet": {"properties": properties}}]}
+        )
+        self.sheet = response["replies"][0]["addSheet"]["properties"]
+        await self.populate_heading(heading)
+        await self.invalidate_file()
+        await self.open_file(url)
+        return await self.summary()
+
+    async def edit_sheet(self, url: str, name: str, heading):
+        await self.load_file(url, name)
+        await self.populate_heading(heading)
+        await self.drop_snapshot()
+        await self.invalidate_file()
+        await self.open_file(url)
+        return await self.summary()
+
+    def snapshot_key(self):
+        return (self.spreadsheet_id, self.sheet["sheetId"])
+
+    async def snapshot(self, refresh=False) -> models.SheetSnapshot:
+        if self._snapshot is not None and not refresh:
+            return self._snapshot
+        cached = models.snapshot_cache.get(self.snapshot_key())
+        if cached is None or refresh:
+            data = await self.values_get(self.range_name())
+            values = utils.fill_gaps(data["values"]) if "values" in data else []
+            cached = models.fresh_snapshot(cached, values)
+            models.snapshot_cache.set(self.snapshot_key(), cached)
+            models.row_count_cache.set(self.snapshot_key(), cached.row_count - 1)
+        self._snapshot = cached
+        return self._snapshot
+
+    def cached_snapshot(self) -> typing.Optional[models.SheetSnapshot]:
+        if self._snapshot is None:
+            self._snapshot = models.snapshot_cache.get(self.snapshot_key())
+        return self._snapshot
+
+    def keep_snapshot(self, snapshot: models.SheetSnapshot):
+        self._snapshot = snapshot
+        models.snapshot_cache.set(self.snapshot_key(), snapshot)
+        models.row_count_cache.set(self.snapshot_key(), snapshot.row_count - 1)
+
+    async def drop_snapshot(self):
+        self._snapshot = None
+        if self.spreadsheet_id and self.sheet:
+            models.snapshot_cache.delete(self.snapshot_key())
+            models.header_cache.delete(self.snapshot_key())
+            models.row_count_cache.delete(self.snapshot_key())
+
+    async def headers(self):
+        snapshot = self.cached_snapshot()
+        if snapshot is not None:
+            return snapshot.heading
+        heading = models.header_cache.get(self.snapshot_key())
+        if heading is None:
+            data = await self.values_get(self.range_name("1:1"))
+            heading = data.get("values", [[]])[0]
+            models.header_cache.set(self.snapshot_key(), heading)
+        return heading
+
+    async def get_all_records(self):
+        return (await self.snapshot()).records()
+
+    async def batch_targets(self, specs):
+        result = []
+        for spec in specs:
+            sheet = None
+            if spec.get("sheet"):
+                sheet = await self.get_sheet_by_name(spec["sheet"])
+            result.append((sheet["title"], sheet["sheetId"]) if sheet else None)
+        return result
+
+    async def batch_read(self, url: str, specs):
+        await self.open_file(url)
+        targets = await self.batch_targets(specs)
+        if None in targets:
+            await self.open_file(url, refresh=True)
+            targets = await self.batch_targets(specs)
+        ranges, plan, pending = models.batch_plan(self.spreadsheet_id, targets, specs)
+        values = await self.values_batch_get(ranges) if ranges else []
+        return models.batch_results(specs, plan, pending, values)
+
+    async def read_columns(self, columns=None, first_row=None, last_row=None):
+        heading = await self.headers()
+        names = models.resolve_columns(heading, columns)
+        snapshot = self.cached_snapshot()
+        if snapshot is not None:
+            return snapshot.project(names, first_row, last_row)
+        runs = models.column_runs(heading, names)
+        ranges = [
+            self.range_name(models.column_range(x, y, first_row, last_row))
+            for x, y in runs
+        ]
+        count = models.row_count_cache.get(self.snapshot_key())
+        if count is None:
+            # the record count comes with the same request
+            *results, column = await self.values_batch_get(
+                ranges + [models.count_range(self.title)]
+            )
+            count = self.keep_count(column)
+        else:
+            results = await self.values_batch_get(ranges)
+        length = models.window_length(count, first_row, last_row)
+        return models.merge_columns(heading, names, runs, results, length)
+
+    def keep_count(self, column) -> int:
+        models.row_count_cache.set(self.snapshot_key(), len(column))
+        return len(column)
+
+    async def record_count(self) -> int:
+        snapshot = self.cached_snapshot()
+        if snapshot is not None:
+            return max(snapshot.row_count - 1, 0)
+        count = models.row_count_cache.get(self.snapshot_key())
+        if count is None:
+            ranges = [models.count_range(self.title)]
+            count = self.keep_count((await self.values_batch_get(ranges))[0])
+        return count
+
+    async def page_window(self, page=1, page_size=20, cursor=None):
+        key = list(self.snapshot_key())
+        page, page_size, total = models.page_request(key, page, page_size, cursor)
+        if total is None:
+            total = await self.record_count()
+        return models.page_window(key, page, page_size, total)
+
+    async def read_page(self, page=1, page_size=20, columns=None, cursor=None):
+        window = await self.page_window(page, page_size, cursor)
+        start, end = window["start"], window["end"]
+        questions = []
+        if end > start:
+            questions = await self.read_columns(columns, start + 1, end)
+        return models.window_result(window, questions)
+
+    async def find_records(self, key, values, case_insensitive=False, columns=None):
+        if columns:
+            names = models.resolve_columns(await self.headers(), columns)
+            names = names if key in names else names + [key]
+            if self.cached_snapshot() is None:
+                records = await self.read_columns(names)
+                return models.match_records(records, key, values, case_insensitive)
+        snapshot = await self.snapshot()
+        found = snapshot.find(key, values, case_insensitive=case_insensitive)
+        if columns:
+            return [{x: record[x] for x in names} for record in found]
+        return found
+
+    async def get_row_count(self):
+        return self.sheet["gridProperties"]["rowCount"]
+
+    async def find_cell(self, cell):
+        # the first cell holding `cell`, row by row like `Worksheet.find`
+        for i, row in enumerate((await self.snapshot()).values, 1):
+            for j, value in enumerate(row, 1):
+                if value == str(cell):
+                    return Cell(i, j, value)
+        raise CellNotFound(cell)
+
+    async def bulk_save(
+        self, column_id: int = None, http_client_function: typing.Callable = None
+    ) -> typing.Dict[str, typing.Any]:
+        column_values = (await self.col_values(column_id))[1:]
+        results = await http_client_function(column_values)
+        return {x[0]: x[1] for x in zip(column_values, results)}
+
+    async def read_last_row(self, columns=None):
+        if columns:
+            all_records = await self.read_columns(columns)
+        else:
+            all_records = await self.get_all_records()
+        if len(all_records) > 0:
+            return all_records[-1]
+        return {}
+
+    async def get_row_to_write(self):
+        return (await self.snapshot()).row_to_write()
+
+    async def get_cell_identity(self, key, value):
+        all_values = (await self.snapshot()).values
+        key_index = models.get_key_index(all_values, key)
+        row_index = models.get_row_index(all_values, value)
+        if row_index:
+            return (row_index, key_index)
+        raise ValueError("Missing Row Index")
+
+    async def get_indexes(self):
+        return dict((await self.snapshot()).indexes)
+
+    async def get_row_cell_ids(self, key, value, addition=0):
+        snapshot = await self.snapshot()
+        records = snapshot.records()
+        row_index = 0
+        for i, record in enumerate(records):
+            if record[key] == value:
+                row_index = i
+        row_index = row_index + 1
+        return {x: [row_index + addition, snapshot.indexes[x]] for x in records[0]}
+
+    async def update_records(self, data: typing.List[typing.Any]):
+        snapshot = (await self.snapshot(refresh=True)).copy()
+        keys = list(snapshot.indexes.keys())
+        index = snapshot.row_to_write()
+        response = await self.values_update(
+            self.range_name(models.a1_range(index, 1, index, len(data))),
+            [[str(v) for v in data]],
+            value_input_option="USER_ENTERED",
+        )
+        written = response.get("updatedData", {}).get("values", [[]])[0]
+        record = snapshot.append_row(written)
+        self.keep_snapshot(snapshot)
+        return keys[0], record
+
+    async def update_existing_record(self, key, value, data, check=False):
+        results = await self.update_existing_records(key, [(value, data)], check)
+        return results[0]
+
+    async def update_existing_records(self, key, updates, check=False):
+        snapshot = (await self.snapshot(refresh=True)).copy()
+        batch, rows = snapshot.plan_updates(key, updates, check=check)
+        response = await self.values_batch_update(batch)
+        results = snapshot.apply_updates(rows, batch, response.get("responses", []))
+        self.keep_snapshot(snapshot)
+        return results
+
+    async def fetch_groups(self, segments):
+        ranges = [self.range_name(x["cell_range"]) for x in segments]
+        results = await self.values_batch_get(ranges)
+        return [
+            models.as_dict(values, heading=x.get("heading"))
+            for values, x in zip(results, segments)
+        ]
+
+    async def col_values(self, col):
+        start_label = utils.rowcol_to_a1(1, col)
+        range_label = "{}:{}".format(start_label, start_label[:-1])
+        data = await self.values_get(
+            self.range_name(range_label), params={"majorDimension": "COLUMNS"}
+        )
+        try:
+            return data["values"][0]
+        except KeyError:
+            return []
+
+    async def get_referenced_cell_values(self, options):
+        columns = options.get("columns") or []
+        positions = models.referenced_columns(await self.headers(), columns)
+        cells, unique, ranges = models.reference_plan(
+            self.title, await self.column_values(positions)
+        )
+        values = await self.values_batch_get(ranges)
+        return models.referenced_values(columns, cells, unique, values)
+
+    async def column_values(self, positions):
+        snapshot = self.cached_snapshot()
+        if snapshot is not None:
+            return models.snapshot_columns(snapshot, positions)
+        ranges = models.column_ranges(self.title, positions)
+        results = await self.values_batch_get(
+            ranges, params={"majorDimension": "COLUMNS"}
+        )
+        return [x[0] if x else [] for x in results]
+
+    async def clear(self):
+        snapshot = await self.snapshot(refresh=True)
+        indexes = snapshot.indexes.values()
+        last_row = snapshot.row_to_write()
+        delete = {
+            "range": {
+                "sheetId": self.sheet["sheetId"],
+                "dimension": "ROWS",
+                "startIndex": min(indexes),
+                "endIndex": last_row,
+            }
+        }
+        await self.batch_update({"requests": [{"deleteDimension": delete}]})
+        await self.drop_snapshot()
+        await self.invalidate_file()
+
+    async def bulk_add(self, data):
+        snapshot = await self.snapshot(refresh=True)
+        indexes = snapshot.indexes.values()
+        last_row = snapshot.row_to_write()
+        ranges = models.a1_range(
+            last_row, min(indexes), last_row + (len(data) - 1), max(indexes)
+        )
+        await self.values_update(self.range_name(ranges), data)
+        await self.drop_snapshot()
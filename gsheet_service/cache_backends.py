@@ -0,0 +1,265 @@
+import datetime
+import json
+from urllib.parse import urlparse
+
+import sqlalchemy
+
+from gsheet_service import app_models
+from gsheet_service.app_models import ANY_SHEET
+from gsheet_service.local_cache import TTLCache
+
+
+class CacheBackend:
+    """What `app_models.TieredCache` expects from the store behind its local
+    tier. `get_entry` returns a mapping with the `data`, `sheet_link`,
+    `sheet_name`, `revision`, `created_at` and `expires_at` of a live entry,
+    `app_models.ServiceAPI` is the postgres implementation."""
+
+    async def db_action(self, value="connect"):
+        pass
+
+    async def get_entry(self, request_id: str):
+        raise NotImplementedError
+
+    async def update_record(
+        self,
+        request_id: str,
+        data,
+        sheet_link: str = None,
+        sheet_name: str = None,
+        ttl: int = None,
+        revision: str = None,
+    ):
+        raise NotImplementedError
+
+    async def touch(self, request_id: str, ttl: int = None):
+        raise NotImplementedError
+
+    async def delete_tagged(self, sheet_link: str, sheet_name: str = None) -> int:
+        raise NotImplementedError
+
+    async def generation(self, sheet_link: str):
+        """Value changed by every `delete_tagged` of `sheet_link`, None for
+        stores only this process uses."""
+        return None
+
+    async def reap_expired(self):
+        pass
+
+    async def purge_db(self):
+        raise NotImplementedError
+
+
+def lifetime(ttl=None):
+    now = datetime.datetime.utcnow()
+    expires_at = now + datetime.timedelta(seconds=ttl) if ttl else None
+    return {"created_at": now, "expires_at": expires_at}
+
+
+def new_record(data, sheet_link, sheet_name, ttl, revision):
+    return {
+        "data": data,
+        "sheet_link": sheet_link,
+        "sheet_name": sheet_name,
+        "revision": revision,
+        **lifetime(ttl),
+    }
+
+
+def is_live(record, now=None) -> bool:
+    now = now or datetime.datetime.utcnow()
+    return not record["expires_at"] or record["expires_at"] > now
+
+
+class MemoryBackend(CacheBackend):
+    """Entries kept in this process, for single worker deployments without
+    a database."""
+
+    def __init__(self, max_size=10000):
+        self.entries = TTLCache(max_size=max_size, ttl=float("inf"))
+
+    async def get_entry(self, request_id: str):
+        record = self.entries.get(request_id)
+        if record and is_live(record):
+            return dict(record)
+        return None
+
+    async def update_record(
+        self,
+        request_id: str,
+        data,
+        sheet_link: str = None,
+        sheet_name: str = None,
+        ttl: int = None,
+        revision: str = None,
+    ):
+        record = new_record(data, sheet_link, sheet_name, ttl, revision)
+        self.entries.set(request_id, record)
+
+    async def touch(self, request_id: str, ttl: int = None):
+        record = self.entries.get(request_id)
+        if record:
+            record.update(lifetime(ttl))
+
+    async def delete_tagged(self, sheet_link: str, sheet_name: str = None) -> int:
+        def tagged(key, record):
+            return record["sheet_link"] == sheet_link and (
+                not sheet_name or record["sheet_name"] in (sheet_name, ANY_SHEET)
+            )
+
+        return self.entries.delete_where(tagged)
+
+    async def reap_expired(self):
+        now = datetime.datetime.utcnow()
+        self.entries.delete_where(lambda key, record: not is_live(record, now))
+
+    async def purge_db(self):
+        self.entries.clear()
+
+
+class SQLiteBackend(app_models.ServiceAPI):
+    """`ServiceAPI` over a local sqlite file. The table is created on connect
+    and the file is switched to WAL so readers do not wait on writers."""
+
+    async def db_action(self, value="connect"):
+        if value == "connect":
+            self.metadata.create_all(sqlalchemy.create_engine(self.url))
+            await self.database.connect()
+            await self.database.execute("PRAGMA journal_mode=WAL")
+        else:
+            await self.database.disconnect()
+
+
+class RedisBackend(CacheBackend):
+    """Entries stored as JSON under `prefix`, shared by every worker and host
+    talking to the same server. Redis expires the entries itself, the tag
+    sets listing the entries of each spreadsheet and sheet are pruned by
+    `reap_expired`."""
+
+    def __init__(self, url, prefix="gsheet:", client=None):
+        if client is None:
+            # optional dependency, only deployments using redis need it
+            from redis import asyncio as redis
+
+            client = redis.from_url(url, decode_responses=True)
+        self.redis = client
+        self.prefix = prefix
+
+    def key(self, request_id: str) -> str:
+        return f"{self.prefix}cache:{request_id}"
+
+    def tag_key(self, sheet_link: str, sheet_name: str = None) -> str:
+        if sheet_name:
+            return f"{self.prefix}sheet:{sheet_link}:{sheet_name}"
+        return f"{self.prefix}link:{sheet_link}"
+
+    def generation_key(self, sheet_link: str) -> str:
+        return f"{self.prefix}generation:{sheet_link}"
+
+    async def db_action(self, value="connect"):
+        if value == "connect":
+            await self.redis.ping()
+        else:
+            await self.redis.close()
+
+    async def get_entry(self, request_id: str):
+        value = await self.redis.get(self.key(request_id))
+        if not value:
+            return None
+        record = json.loads(value)
+        for field in ("created_at", "expires_at"):
+            if record[field]:
+                record[field] = datetime.datetime.fromisoformat(record[field])
+        return record
+
+    async def set_record(self, request_id: str, record, ttl: int = None):
+        value = json.dumps(record, default=str)
+        await self.redis.set(self.key(request_id), value, ex=ttl or None)
+
+    async def update_record(
+        self,
+        request_id: str,
+        data,
+        sheet_link: str = None,
+        sheet_name: str = None,
+        ttl: int = None,
+        revision: str = None,
+    ):
+        record = new_record(data, sheet_link, sheet_name, ttl, revision)
+        value = json.dumps(record, default=str)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self.key(request_id), value, ex=ttl or None)
+            pipe.sadd(self.tag_key(sheet_link), request_id)
+            if sheet_name:
+                pipe.sadd(self.tag_key(sheet_link, sheet_name), request_id)
+            await pipe.execute()
+
+    async def touch(self, request_id: str, ttl: int = None):
+        record = await self.get_entry(request_id)
+        if record:
+            record.update(lifetime(ttl))
+            await self.set_record(request_id, record, ttl)
+
+    async def delete_tagged(self, sheet_link: str, sheet_name: str = None) -> int:
+        tags = [self.tag_key(sheet_link, sheet_name)]
+        if sheet_name:
+            # entries tagged with any sheet go with every one of them
+            tags.append(self.tag_key(sheet_link, ANY_SHEET))
+        members = await self.redis.sunion(*tags)
+        count = 0
+        if members:
+            count = await self.redis.delete(*[self.key(x) for x in members])
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(*tags)
+            pipe.incr(self.generation_key(sheet_link))
+            await pipe.execute()
+        return count
+
+    async def generation(self, sheet_link: str) -> str:
+        return await self.redis.get(self.generation_key(sheet_link)) or ""
+
+    async def reap_expired(self):
+        for pattern in ("link:*", "sheet:*"):
+            async for tag in self.redis.scan_iter(match=self.prefix + pattern):
+                members = list(await self.redis.smembers(tag))
+                if not members:
+                    continue
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for member in members:
+                        pipe.exists(self.key(member))
+                    found = await pipe.execute()
+                gone = [x for x, y in zip(members, found) if not y]
+                if gone:
+                    await self.redis.srem(tag, *gone)
+
+    async def purge_db(self):
+        keys = [x async for x in self.redis.scan_iter(match=self.prefix + "*")]
+        if keys:
+            await self.redis.delete(*keys)
+
+
+def backend_name(url: str) -> str:
+    scheme = urlparse(url or "").scheme.split("+")[0]
+    if scheme in ("postgres", "postgresql"):
+        return "postgres"
+    if scheme in ("redis", "rediss"):
+        return "redis"
+    if scheme == "sqlite":
+        return "sqlite"
+    return "memory"
+
+
+def create_backend(name: str = None, url: str = None, max_size=10000) -> CacheBackend:
+    """Cache store named by `name`, or guessed from the scheme of `url`."""
+    name = name or backend_name(url)
+    if name == "memory":
+        return MemoryBackend(max_size)
+    if not url:
+        raise ValueError(f"The {name} cache backend needs a url")
+    if name == "sqlite":
+        return SQLiteBackend(url)
+    if name == "postgres":
+        return app_models.ServiceAPI(url)
+    if name == "redis":
+        return RedisBackend(url)
+    raise ValueError(f"Unknown cache backend {name}")
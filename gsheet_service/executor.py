@@ -0,0 +1,146 @@
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorBusy(Exception):
+    pass
+
+
+class ExecutorTimeout(ExecutorBusy):
+    pass
+
+
+class SheetExecutor:
+    """Bounded thread pool through which blocking gspread calls are dispatched
+    so that a slow Google response does not stall the event loop."""
+
+    def __init__(self, max_workers=8, max_queue=64, timeout=30):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="gsheet")
+        self.lock = threading.Lock()
+        self.counters = {
+            "submitted": 0,
+            "completed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "queued": 0,
+            "active": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+        }
+
+    @property
+    def stats(self):
+        with self.lock:
+            result = dict(self.counters)
+        started = result["completed"] + result["active"]
+        result["queue_wait_avg"] = (
+            result["queue_wait_total"] / started if started else 0
+        )
+        result["saturation"] = (result["active"] + result["queued"]) / (
+            self.max_workers + self.max_queue
+        )
+        return result
+
+    def _started(self, submitted_at):
+        wait = time.monotonic() - submitted_at
+        with self.lock:
+            self.counters["queued"] -= 1
+            self.counters["active"] += 1
+            self.counters["queue_wait_total"] += wait
+            self.counters["queue_wait_max"] = max(self.counters["queue_wait_max"], wait)
+
+    def _finished(self, future):
+        with self.lock:
+            if future.cancelled():
+                # never started, it timed out while waiting in the queue
+                self.counters["queued"] -= 1
+            else:
+                self.counters["active"] -= 1
+                self.counters["completed"] += 1
+
+    async def run(self, func, *args, **kwargs):
+        with self.lock:
+            if self.counters["queued"] >= self.max_queue:
+                self.counters["rejected"] += 1
+                raise ExecutorBusy("Too many pending spreadsheet requests")
+            self.counters["queued"] += 1
+            self.counters["submitted"] += 1
+        submitted_at = time.monotonic()
+
+        def call():
+            self._started(submitted_at)
+            return func(*args, **kwargs)
+
+        future = self.pool.submit(call)
+        future.add_done_callback(self._finished)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self.lock:
+                self.counters["timeouts"] += 1
+            raise ExecutorTimeout("Timed out waiting for the spreadsheet")
+
+    async def instance(self, klass, *args, **kwargs) -> "AsyncProxy":
+        result = await self.run(klass, *args, **kwargs)
+        return AsyncProxy(result, self)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+
+class AsyncProxy:
+    """Exposes the blocking methods of `instance` as coroutines that run on
+    the executor. Attributes and coroutine methods are returned untouched."""
+
+    def __init__(self, instance, executor: SheetExecutor):
+        self._instance = instance
+        self._executor = executor
+
+    def __getattr__(self, name):
+        attr = getattr(self._instance, name)
+        if not callable(attr) or inspect.iscoroutinefunction(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self._executor.run(attr, *args, **kwargs)
+
+        return method
+
+
+class SingleFlight:
+    """Lets concurrent callers asking for the same `key` share one call of
+    `func` instead of each of them hitting the spreadsheet."""
+
+    def __init__(self):
+        self.calls = {}
+        self.stats = {"calls": 0, "coalesced": 0, "in_flight": 0}
+
+    async def run(self, key, func):
+        task = self.calls.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            # the call runs on its own task, the caller that started it
+            # giving up does not cancel it for the ones waiting on it
+            task = asyncio.ensure_future(func())
+            self.calls[key] = task
+            self.stats["calls"] += 1
+            self.stats["in_flight"] = len(self.calls)
+            task.add_done_callback(functools.partial(self.finished, key))
+        return await asyncio.shield(task)
+
+    def finished(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        self.stats["in_flight"] = len(self.calls)
+        if not task.cancelled():
+            # mark it retrieved, there may be nobody else waiting
+            task.exception()
@@ -0,0 +1,79 @@
+import collections
+import threading
+import time
+
+
+class TTLCache:
+    """Size bounded in-process cache where every entry expires after `ttl`
+    seconds. The least recently used entry is dropped once `max_size` is hit,
+    or once the entries weigh more than `max_bytes` as measured by `sizeof`."""
+
+    def __init__(
+        self, max_size=256, ttl=300, timer=time.monotonic, max_bytes=None, sizeof=None
+    ):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.timer = timer
+        self.sizeof = sizeof
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return default
+            value, expires_at, size = entry
+            if expires_at <= self.timer():
+                self._pop(key)
+                self.stats["misses"] += 1
+                return default
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = self.timer() + (self.ttl if ttl is None else ttl)
+        size = self.sizeof(value) if self.sizeof else 0
+        with self.lock:
+            self._pop(key)
+            if self.max_bytes and size > self.max_bytes:
+                # would evict everything else and still not fit
+                return
+            self.entries[key] = (value, expires_at, size)
+            self.bytes += size
+            while len(self.entries) > self.max_size or (
+                self.max_bytes and self.bytes > self.max_bytes
+            ):
+                self._pop(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+        return entry
+
+    def delete(self, key):
+        with self.lock:
+            return self._pop(key) is not None
+
+    def delete_where(self, predicate) -> int:
+        """Drops every entry whose `predicate(key, value)` holds."""
+        with self.lock:
+            keys = [x for x, y in self.entries.items() if predicate(x, y[0])]
+            for key in keys:
+                self._pop(key)
+            return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
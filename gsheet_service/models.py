@@ -1,11 +1,21 @@
 import typing
 from urllib.parse import quote_plus
+import base64
+import bisect
+import collections
+import datetime
+import hashlib
+import json
 import logging
+import threading
+import time
 import gspread
 import re
 from gspread import models as g_models, utils
 from oauth2client.service_account import ServiceAccountCredentials
 
+from gsheet_service.local_cache import TTLCache
+
 DEFAULT_SCOPES = [
     "https://spreadsheets.google.com/feeds",
     "https://www.googleapis.com/auth/drive",
@@ -54,6 +64,416 @@ def create_credentials(additional_scopes=None, **kwargs):
     return gc
 
 
+def create_client(key_location: str = None, additional_scopes=None, **kwargs):
+    if key_location:
+        return create_credentials_from_file(key_location, additional_scopes)
+    return create_credentials(additional_scopes, **kwargs)
+
+
+class ClientPool:
+    """Keeps authorized gspread clients alive for the lifetime of the process so
+    that a token is only minted when the credential is new or about to expire.
+    Clients are keyed by a fingerprint of the credential used to create them.
+    `lock` only guards the pool itself, creating or refreshing a client holds
+    the lock of its fingerprint so a slow token request for one credential
+    does not hold up the others."""
+
+    def __init__(self, max_size=32, refresh_margin=300, factory=create_client):
+        self.max_size = max_size
+        self.refresh_margin = refresh_margin
+        self.factory = factory
+        self.clients = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0, "evictions": 0}
+
+    @staticmethod
+    def fingerprint(**kwargs) -> str:
+        payload = json.dumps(kwargs, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_client(self, **kwargs):
+        key = self.fingerprint(**kwargs)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self.lock:
+                gc = self.clients.get(key)
+                if gc is not None:
+                    self.stats["hits"] += 1
+                    self.clients.move_to_end(key)
+            if gc is None:
+                gc = self.factory(**kwargs)
+                self.add_client(key, gc)
+            self.ensure_fresh(gc)
+        return gc
+
+    def add_client(self, key, gc):
+        with self.lock:
+            self.stats["misses"] += 1
+            self.clients[key] = gc
+            if len(self.clients) > self.max_size:
+                evicted, _ = self.clients.popitem(last=False)
+                self.key_locks.pop(evicted, None)
+                self.stats["evictions"] += 1
+
+    def ensure_fresh(self, gc):
+        # refresh ahead of expiry so requests never stall on a lazy token refresh
+        auth = gc.auth
+        expiry = getattr(auth, "expiry", None)
+        if auth.token and expiry:
+            remaining = expiry - datetime.datetime.utcnow()
+            if remaining > datetime.timedelta(seconds=self.refresh_margin):
+                return
+        gc.login()
+        with self.lock:
+            self.stats["refreshes"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.clients.clear()
+            self.key_locks.clear()
+
+
+client_pool = ClientPool()
+# USER_ENTERED matches `update_cell`; the response echoes what was written
+WRITE_OPTIONS = dict(
+    raw=False,
+    include_values_in_response=True,
+    response_value_render_option="FORMATTED_VALUE",
+)
+# a quoted reference to a single cell, on the same worksheet unless it is
+# prefixed by a sheet name: "D12", "AB3", "Sheet2!C4", "'Other sheet'!$C$4"
+CELL_REFERENCE = re.compile(
+    r"(?<![\w$])((?:'(?:[^']|'')+'|[A-Za-z_][\w.]*)!)?(\$?[A-Z]{1,3}\$?[0-9]+)\""
+)
+# an A1 range of the spec's own worksheet: "B2", "A2:C", "$A$1:$B$4", "2:5"
+A1_BOUND = r"(?:\$?[A-Za-z]{1,3}\$?[0-9]*|\$?[0-9]+)"
+A1_RANGE = re.compile(rf"{A1_BOUND}(?::{A1_BOUND})?")
+# ranges of one values:batchGet, all of them go in the query string
+BATCH_GET_MAX_RANGES = 100
+BATCH_GET_MAX_LENGTH = 6000
+# spreadsheet id -> {"properties": {...}, "sheets": [{"properties": {...}}]}
+metadata_cache = TTLCache(max_size=256, ttl=300)
+# (spreadsheet id, worksheet id) -> SheetSnapshot
+snapshot_cache = TTLCache(max_size=64, ttl=60)
+# (spreadsheet id, worksheet id) -> values of the heading row
+header_cache = TTLCache(max_size=256, ttl=300)
+# (spreadsheet id, worksheet id) -> number of records below the heading
+row_count_cache = TTLCache(max_size=256, ttl=60)
+
+
+def sheet_matches(name: str, title: str) -> bool:
+    # worksheets are looked up by a case insensitive part of their title
+    return name.lower() in title.strip().lower()
+
+
+def worksheet_id(spreadsheet_id: str, name: str):
+    """Id of the worksheet `load_file` opens for `name`, None when it is not
+    in the cached metadata of the spreadsheet."""
+    metadata = metadata_cache.get(spreadsheet_id) or {"sheets": []}
+    for sheet in metadata["sheets"]:
+        if sheet_matches(name, sheet["properties"]["title"]):
+            return sheet["properties"]["sheetId"]
+    return None
+
+
+def trim_metadata(metadata):
+    return {
+        "properties": {"title": metadata["properties"]["title"]},
+        "sheets": [{"properties": x["properties"]} for x in metadata["sheets"]],
+    }
+
+
+# Drive file fields that change whenever the spreadsheet is edited
+REVISION_FIELDS = "modifiedTime,version"
+DRIVE_CHANNELS_STOP_URL = "https://www.googleapis.com/drive/v3/channels/stop"
+
+
+def forget_spreadsheet(spreadsheet_id: str):
+    """Drops everything cached in this process about a spreadsheet."""
+    metadata_cache.delete(spreadsheet_id)
+    for cache in (snapshot_cache, header_cache, row_count_cache):
+        cache.delete_where(lambda key, value: key[0] == spreadsheet_id)
+
+
+def forget_older(spreadsheet_id: str, max_age: float):
+    """Drops the snapshots of a spreadsheet read more than `max_age` seconds
+    ago, so the next `snapshot()` of their worksheet reads it again. Headings
+    and record counts are not timed and always go."""
+    now = time.monotonic()
+    snapshot_cache.delete_where(
+        lambda key, value: key[0] == spreadsheet_id and now - value.fetched_at > max_age
+    )
+    for cache in (header_cache, row_count_cache):
+        cache.delete_where(lambda key, value: key[0] == spreadsheet_id)
+
+
+def revision_token(file) -> str:
+    return f"{file.get('modifiedTime')}/{file.get('version')}"
+
+
+def lookup_value(value, case_insensitive=False):
+    if case_insensitive:
+        return str(value).strip().lower()
+    return value
+
+
+class SheetSnapshot:
+    """All the values of a worksheet fetched once and shared by the helper
+    methods taking part in an operation. Snapshots are also kept in
+    `snapshot_cache` so point lookups by a key column are served from a hash
+    index instead of scanning every record."""
+
+    def __init__(self, values: typing.List[typing.List[str]]):
+        self.values = values
+        self.heading = values[0] if values else []
+        self.indexes = {}
+        for i, x in enumerate(self.heading):
+            self.indexes.setdefault(x, i + 1)
+        self.row_count = len(values)
+        # monotonic time the values were read at, see `forget_older`
+        self.fetched_at = time.monotonic()
+        self._records = None
+        self._lookups = {}
+
+    def as_record(self, row: typing.List[typing.Any]) -> typing.Dict[str, typing.Any]:
+        # same numericised output as `Worksheet.get_all_records`
+        row = list(row) + [""] * (len(self.heading) - len(row))
+        return dict(zip(self.heading, utils.numericise_all(row)))
+
+    def records(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        if self._records is None:
+            self._records = [self.as_record(row) for row in self.values[1:]]
+        return self._records
+
+    def lookup(self, key, case_insensitive=False) -> typing.Dict[typing.Any, list]:
+        """Maps every value of the `key` column to the row numbers holding it.
+        Built once per column and kept in step by `append_row`/`replace_row`."""
+        name = (key, case_insensitive)
+        if name not in self._lookups:
+            result = {}
+            for i, x in enumerate(self.records()):
+                value = lookup_value(x[key], case_insensitive)
+                result.setdefault(value, []).append(i + 2)
+            self._lookups[name] = result
+        return self._lookups[name]
+
+    def find(self, key, values, case_insensitive=False):
+        # first matching row per value, the same record `read_row` used to return
+        lookup = self.lookup(key, case_insensitive)
+        records = self.records()
+        result = []
+        for value in values:
+            rows = lookup.get(lookup_value(value, case_insensitive))
+            if rows:
+                result.append(records[rows[0] - 2])
+        return result
+
+    def copy(self) -> "SheetSnapshot":
+        """A snapshot sharing the rows of this one that can be patched without
+        the change showing to requests still holding this one."""
+        result = SheetSnapshot.__new__(SheetSnapshot)
+        result.__dict__.update(self.__dict__)
+        result._lookups = {
+            name: {value: list(rows) for value, rows in lookup.items()}
+            for name, lookup in self._lookups.items()
+        }
+        return result
+
+    def append_row(self, row):
+        row = list(row) + [""] * (len(self.heading) - len(row))
+        record = self.as_record(row)
+        # copy on write, other requests may be iterating the current lists
+        self.values = self.values + [row]
+        self.row_count += 1
+        if self._records is not None:
+            self._records = self._records + [record]
+        for (key, case_insensitive), lookup in self._lookups.items():
+            value = lookup_value(record.get(key), case_insensitive)
+            lookup.setdefault(value, []).append(self.row_count)
+        return record
+
+    def replace_row(self, row_index, row):
+        old = self.records()[row_index - 2]
+        record = self.as_record(row)
+        values = list(self.values)
+        values[row_index - 1] = row
+        self.values = values
+        records = list(self._records)
+        records[row_index - 2] = record
+        self._records = records
+        for (key, case_insensitive), lookup in self._lookups.items():
+            before = lookup_value(old.get(key), case_insensitive)
+            after = lookup_value(record.get(key), case_insensitive)
+            if before != after:
+                lookup[before].remove(row_index)
+                if not lookup[before]:
+                    del lookup[before]
+                bisect.insort(lookup.setdefault(after, []), row_index)
+        return record
+
+    def row_to_write(self) -> int:
+        return self.row_count + 1
+
+    def project(self, names, first_row=None, last_row=None):
+        records = self.records()[(first_row or 1) - 1 : last_row]
+        return [{x: record[x] for x in names} for record in records]
+
+    def plan_updates(self, key, updates, check=False):
+        """Resolves `(value, data)` pairs into the cells to write in one batch
+        request and the row numbers they land on."""
+        lookup = self.lookup(key)
+        batch, rows = [], []
+        for value, data in updates:
+            if check:
+                valid = all([p in self.indexes for p in data.keys()])
+                if not valid:
+                    raise KeyError("Invalid params passed")
+            if value not in lookup:
+                raise ValueError("Missing Row Index")
+            # the last row holding a value wins, matching `get_row_cell_ids`
+            row_index = lookup[value][-1]
+            rows.append(row_index)
+            for x, y in data.items():
+                column = self.indexes[x]
+                batch.append(
+                    {"range": utils.rowcol_to_a1(row_index, column), "values": [[y]]}
+                )
+        return batch, rows
+
+    def apply_updates(self, rows, batch, responses):
+        """Patches the rows written by a `plan_updates` batch with the values
+        echoed back in `responses` and returns them as records."""
+        written = {}
+        for entry, result in zip(batch, responses):
+            values = result.get("updatedData", {}).get("values", [[""]])
+            written[entry["range"]] = values[0][0]
+        results = []
+        for row_index in rows:
+            row = list(self.values[row_index - 1])
+            row += [""] * (len(self.heading) - len(row))
+            for i in range(len(row)):
+                label = utils.rowcol_to_a1(row_index, i + 1)
+                if label in written:
+                    row[i] = written[label]
+            results.append(self.replace_row(row_index, row))
+        return results
+
+
+def fresh_snapshot(cached: typing.Optional[SheetSnapshot], values) -> SheetSnapshot:
+    # keep the cached snapshot, and the lookups built on it, when nothing changed
+    if cached is not None and cached.values == values:
+        cached.fetched_at = time.monotonic()
+        return cached
+    return SheetSnapshot(values)
+
+
+def batch_chunks(ranges, max_ranges=None, max_length=None):
+    """Splits `ranges` into the groups sent with each values:batchGet so no
+    request carries more than `max_ranges` ranges or `max_length` quoted
+    characters of them."""
+    max_ranges = max_ranges or BATCH_GET_MAX_RANGES
+    max_length = max_length or BATCH_GET_MAX_LENGTH
+    chunks, length = [], 0
+    for name in ranges:
+        size = len(quote_plus(name)) + len("&ranges=")
+        if not chunks or len(chunks[-1]) >= max_ranges or length + size > max_length:
+            chunks.append([])
+            length = 0
+        chunks[-1].append(name)
+        length += size
+    return chunks
+
+
+def batch_plan(file_id, targets, specs):
+    """Ranges a single `values:batchGet` has to read to answer `specs`.
+    `targets` holds the (title, sheet id) of each spec's worksheet. Specs
+    with a `range` read it as is, the others are answered from the sheet
+    snapshot and only sheets missing from `snapshot_cache` are read."""
+    ranges, plan, pending = [], [], {}
+    for target, spec in zip(targets, specs):
+        if target is None:
+            plan.append(("error", "Missing `sheet` in spreadsheet"))
+            continue
+        title, sheet_id = target
+        if spec.get("range"):
+            plan.append(("range", len(ranges)))
+            ranges.append(utils.absolute_range_name(title, spec["range"]))
+            continue
+        key = (file_id, sheet_id)
+        snapshot = snapshot_cache.get(key)
+        if snapshot is not None:
+            plan.append(("snapshot", snapshot))
+            continue
+        if key not in pending:
+            pending[key] = len(ranges)
+            ranges.append(utils.absolute_range_name(title))
+        plan.append(("pending", key))
+    return ranges, plan, pending
+
+
+def spec_error(spec) -> typing.Optional[str]:
+    """Why `spec` can not be part of a batch read, checked before the batch
+    is built so one bad spec does not fail the others."""
+    if not isinstance(spec, dict):
+        return "Wrong spec passed, expected an object"
+    cell_range = spec.get("range")
+    if cell_range and not (
+        isinstance(cell_range, str) and A1_RANGE.fullmatch(cell_range)
+    ):
+        return "Wrong `range` passed"
+    return None
+
+
+def batch_results(specs, plan, pending, values):
+    # `values` are the value ranges read for the ranges of `batch_plan`
+    snapshots = {}
+    for key, index in pending.items():
+        rows = utils.fill_gaps(values[index]) if values[index] else []
+        snapshot = fresh_snapshot(snapshot_cache.get(key), rows)
+        snapshot_cache.set(key, snapshot)
+        row_count_cache.set(key, snapshot.row_count - 1)
+        snapshots[key] = snapshot
+    results = []
+    for spec, (kind, ref) in zip(specs, plan):
+        if kind == "error":
+            results.append({"error": ref})
+        elif kind == "range":
+            results.append({"data": values[ref]})
+        else:
+            snapshot = snapshots[ref] if kind == "pending" else ref
+            results.append(spec_result(snapshot, spec))
+    return results
+
+
+def spec_result(snapshot: SheetSnapshot, spec):
+    key = spec.get("key")
+    value = spec.get("value")
+    values = spec.get("values")
+    columns = spec.get("columns")
+    try:
+        if value or values:
+            if not key:
+                return {"error": "Missing `key` field to read a single record"}
+            found = snapshot.find(key, values or [value])
+            if columns:
+                names = resolve_columns(snapshot.heading, columns)
+                names = names if key in names else names + [key]
+                found = [{x: record[x] for x in names} for record in found]
+            if values:
+                return {"data": found}
+            return {"data": found[0]} if found else {"error": "Missing result"}
+        first_row = spec.get("first_row")
+        last_row = spec.get("last_row")
+        if columns or first_row or last_row:
+            names = resolve_columns(snapshot.heading, columns)
+            return {"data": snapshot.project(names, first_row, last_row)}
+        return {"data": snapshot.records()}
+    except KeyError:
+        return {"error": "Wrong `key` or `columns` passed"}
+
+
 class GoogleSheetInterface:
     def __init__(
         self,
@@ -65,9 +485,9 @@ class GoogleSheetInterface:
         client_id: str = None,
     ):
         if key_location:
-            self.gc = create_credentials(key_location)
+            self.gc = client_pool.get_client(key_location=key_location)
         else:
-            self.gc = create_credentials(
+            self.gc = client_pool.get_client(
                 project_id=project_id,
                 private_key=private_key,
                 private_key_id=private_key_id,
@@ -75,55 +495,252 @@ class GoogleSheetInterface:
                 client_id=client_id,
             )
         self.file = None
+        self.metadata = None
+        self.sheet = None
+        self._snapshot = None
         self.data = []
 
+    def open_file(self, url: str, refresh=False):
+        self.file = self.gc.open_by_url(url)
+        metadata = None if refresh else metadata_cache.get(self.file.id)
+        if metadata is None:
+            metadata = trim_metadata(self.file.fetch_sheet_metadata())
+            metadata_cache.set(self.file.id, metadata)
+        self.file._properties.update(metadata["properties"])
+        self.metadata = metadata
+        return self.file
+
+    def invalidate_file(self):
+        if self.file:
+            metadata_cache.delete(self.file.id)
+
+    def get_revision(self, url: str) -> str:
+        """One Drive metadata call telling whether the spreadsheet changed,
+        much cheaper than reading any of its values."""
+        file_id = utils.extract_id_from_url(url)
+        response = self.gc.request(
+            "get",
+            f"{gspread.urls.DRIVE_FILES_API_V3_URL}/{file_id}",
+            params={"fields": REVISION_FIELDS, "supportsAllDrives": "true"},
+        )
+        return revision_token(response.json())
+
+    def watch_file(self, file_id: str, channel):
+        response = self.gc.request(
+            "post",
+            f"{gspread.urls.DRIVE_FILES_API_V3_URL}/{file_id}/watch",
+            params={"supportsAllDrives": "true"},
+            json=channel,
+        )
+        return response.json()
+
+    def stop_channel(self, channel):
+        self.gc.request("post", DRIVE_CHANNELS_STOP_URL, json=channel)
+
+    def worksheets(self) -> typing.List[g_models.Worksheet]:
+        return [
+            g_models.Worksheet(self.file, x["properties"])
+            for x in self.metadata["sheets"]
+        ]
+
     def sheet_names(self):
-        return [x.title for x in self.file.worksheets()]
+        return [x["properties"]["title"] for x in self.metadata["sheets"]]
 
-    def get_sheet_names(self, url: str):
-        self.file = self.gc.open_by_url(url)
-        return [x.title for x in self.file.worksheets()]
+    def summary(self):
+        return {"title": self.file.title, "sheet_names": self.sheet_names()}
 
-    def get_spreadsheet_title(self, url: str):
-        self.file = self.gc.open_by_url(url)
+    def get_sheet_names(self, url: str, refresh=False):
+        self.open_file(url, refresh=refresh)
+        return self.sheet_names()
+
+    def get_spreadsheet_title(self, url: str, refresh=False):
+        self.open_file(url, refresh=refresh)
         return self.file.title
 
     def get_sheet_by_name(self, name) -> g_models.Worksheet:
-        result = [
-            x for x in self.file.worksheets() if name.lower() in x.title.strip().lower()
-        ]
+        result = [x for x in self.worksheets() if sheet_matches(name, x.title)]
         if result:
             return result[0]
 
     def load_file(self, url: str, sheet_name: str):
-        self.file = self.gc.open_by_url(url)
+        self._snapshot = None
+        self.open_file(url)
         self.sheet = self.get_sheet_by_name(sheet_name)
+        if not self.sheet:
+            # the worksheet may have been added since the metadata was cached
+            self.open_file(url, refresh=True)
+            self.sheet = self.get_sheet_by_name(sheet_name)
         return self
 
     def populate_heading(self, heading):
-        letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-        cols = [k for (i, k) in enumerate(letters) if i in range(len(heading))]
-        heading_range = f"{cols[0]}1:{cols[-1]}1"
+        heading_range = a1_range(1, 1, 1, len(heading))
         self.sheet.update(heading_range, [heading])
 
     def create_new_sheet(self, url: str, name: str, heading: typing.List[typing.Any]):
-        self.file = self.gc.open_by_url(url)
+        self.open_file(url)
         self.sheet = self.file.add_worksheet(title=name, rows="1000", cols="10")
         self.populate_heading(heading)
         # self.update_records(heading)
-        result = [x.title for x in self.file.worksheets()]
-        title = self.file.title
-        return {"title": title, "sheet_names": result}
+        self.invalidate_file()
+        self.open_file(url)
+        return self.summary()
 
     def edit_sheet(self, url: str, name: str, heading: typing.List[typing.Any]):
         self.load_file(url, name)
         self.populate_heading(heading)
-        result = [x.title for x in self.file.worksheets()]
-        title = self.file.title
-        return {"title": title, "sheet_names": result}
+        self.drop_snapshot()
+        self.invalidate_file()
+        self.open_file(url)
+        return self.summary()
+
+    def snapshot_key(self):
+        return (self.file.id, self.sheet.id)
+
+    def snapshot(self, refresh=False) -> SheetSnapshot:
+        """Reads are served from `snapshot_cache`, write paths pass `refresh`
+        so rows are always planned against the current sheet values."""
+        if self._snapshot is not None and not refresh:
+            return self._snapshot
+        cached = snapshot_cache.get(self.snapshot_key())
+        if cached is None or refresh:
+            cached = fresh_snapshot(cached, self.sheet.get_all_values())
+            snapshot_cache.set(self.snapshot_key(), cached)
+            row_count_cache.set(self.snapshot_key(), cached.row_count - 1)
+        self._snapshot = cached
+        return self._snapshot
+
+    def cached_snapshot(self) -> typing.Optional[SheetSnapshot]:
+        if self._snapshot is None:
+            self._snapshot = snapshot_cache.get(self.snapshot_key())
+        return self._snapshot
+
+    def keep_snapshot(self, snapshot: SheetSnapshot):
+        # writes patch a copy of the snapshot and swap it in once it is whole
+        self._snapshot = snapshot
+        snapshot_cache.set(self.snapshot_key(), snapshot)
+        row_count_cache.set(self.snapshot_key(), snapshot.row_count - 1)
+
+    def drop_snapshot(self):
+        self._snapshot = None
+        if self.file and self.sheet:
+            snapshot_cache.delete(self.snapshot_key())
+            header_cache.delete(self.snapshot_key())
+            row_count_cache.delete(self.snapshot_key())
+
+    def headers(self):
+        snapshot = self.cached_snapshot()
+        if snapshot is not None:
+            return snapshot.heading
+        heading = header_cache.get(self.snapshot_key())
+        if heading is None:
+            heading = self.sheet.row_values(1)
+            header_cache.set(self.snapshot_key(), heading)
+        return heading
 
     def get_all_records(self):
-        return self.sheet.get_all_records()
+        return self.snapshot().records()
+
+    def batch_targets(self, specs):
+        result = []
+        for spec in specs:
+            sheet = None
+            if spec.get("sheet"):
+                sheet = self.get_sheet_by_name(spec["sheet"])
+            result.append((sheet.title, sheet.id) if sheet else None)
+        return result
+
+    def batch_read(self, url: str, specs):
+        """Answers every spec, each naming its own worksheet, with at most
+        one read of the spreadsheet."""
+        self.open_file(url)
+        targets = self.batch_targets(specs)
+        if None in targets:
+            # a worksheet may have been added since the metadata was cached
+            self.open_file(url, refresh=True)
+            targets = self.batch_targets(specs)
+        ranges, plan, pending = batch_plan(self.file.id, targets, specs)
+        return batch_results(specs, plan, pending, self.batch_values(ranges))
+
+    def batch_values(self, ranges, params=None):
+        """Values of every range in `ranges`, read with as few
+        values:batchGet requests as `batch_chunks` allows."""
+        # `Worksheet.batch_get` fails on ranges without values, read them raw
+        result = []
+        for chunk in batch_chunks(ranges):
+            response = self.file.values_batch_get(chunk, params=params)
+            result.extend(x.get("values", []) for x in response["valueRanges"])
+        return result
+
+    def read_columns(self, columns=None, first_row=None, last_row=None):
+        """Records limited to `columns` and the `first_row`..`last_row`
+        window. Only those cells are fetched unless the sheet is cached."""
+        heading = self.headers()
+        names = resolve_columns(heading, columns)
+        snapshot = self.cached_snapshot()
+        if snapshot is not None:
+            return snapshot.project(names, first_row, last_row)
+        runs = column_runs(heading, names)
+        ranges = [
+            utils.absolute_range_name(
+                self.sheet.title, column_range(x, y, first_row, last_row)
+            )
+            for x, y in runs
+        ]
+        count = row_count_cache.get(self.snapshot_key())
+        if count is None:
+            # the record count comes with the same request
+            *results, column = self.batch_values(
+                ranges + [count_range(self.sheet.title)]
+            )
+            count = self.keep_count(column)
+        else:
+            results = self.batch_values(ranges)
+        length = window_length(count, first_row, last_row)
+        return merge_columns(heading, names, runs, results, length)
+
+    def keep_count(self, column) -> int:
+        # `column` is the `count_range` read, one row per record
+        row_count_cache.set(self.snapshot_key(), len(column))
+        return len(column)
+
+    def record_count(self) -> int:
+        """Rows below the heading. A sheet that is not cached is counted over
+        its first column alone instead of being downloaded, trailing rows
+        with a blank first cell only count once the sheet is loaded."""
+        snapshot = self.cached_snapshot()
+        if snapshot is not None:
+            return max(snapshot.row_count - 1, 0)
+        count = row_count_cache.get(self.snapshot_key())
+        if count is None:
+            column = self.batch_values([count_range(self.sheet.title)])[0]
+            count = self.keep_count(column)
+        return count
+
+    def page_window(self, page=1, page_size=20, cursor=None):
+        key = list(self.snapshot_key())
+        page, page_size, total = page_request(key, page, page_size, cursor)
+        if total is None:
+            total = self.record_count()
+        return page_window(key, page, page_size, total)
+
+    def read_page(self, page=1, page_size=20, columns=None, cursor=None):
+        """Fetches only the rows of `page`, see `get_page` for the layout."""
+        window = self.page_window(page, page_size, cursor)
+        start, end = window["start"], window["end"]
+        questions = self.read_columns(columns, start + 1, end) if end > start else []
+        return window_result(window, questions)
+
+    def find_records(self, key, values, case_insensitive=False, columns=None):
+        if columns:
+            names = resolve_columns(self.headers(), columns)
+            names = names if key in names else names + [key]
+            if self.cached_snapshot() is None:
+                records = self.read_columns(names)
+                return match_records(records, key, values, case_insensitive)
+        found = self.snapshot().find(key, values, case_insensitive=case_insensitive)
+        if columns:
+            return [{x: record[x] for x in names} for record in found]
+        return found
 
     def get_row_count(self):
         return self.sheet.row_count
@@ -139,28 +756,33 @@ class GoogleSheetInterface:
         return {x[0]: x[1] for x in zip(column_values, results)}
 
     def update_records(self, data: typing.List[typing.Any]):
-        column_indices = self.get_indexes()
-        index = self.get_row_to_write()
-        keys = list(column_indices.keys())
-        obj = {}
-        for i, v in enumerate(data):
-            column = keys[i]
-            self.sheet.update_cell(index, i + 1, str(v))
-            obj[column] = v
-        return keys[0], obj
-
-    def read_last_row(self):
-        all_records = self.sheet.get_all_records()
+        snapshot = self.snapshot(refresh=True).copy()
+        keys = list(snapshot.indexes.keys())
+        index = snapshot.row_to_write()
+        response = self.sheet.update(
+            a1_range(index, 1, index, len(data)),
+            [[str(v) for v in data]],
+            **WRITE_OPTIONS,
+        )
+        written = response.get("updatedData", {}).get("values", [[]])[0]
+        record = snapshot.append_row(written)
+        self.keep_snapshot(snapshot)
+        return keys[0], record
+
+    def read_last_row(self, columns=None):
+        if columns:
+            all_records = self.read_columns(columns)
+        else:
+            all_records = self.get_all_records()
         if len(all_records) > 0:
             return all_records[-1]
         return {}
 
     def get_row_to_write(self):
-        all_values = self.sheet.get_all_values()
-        return len(all_values) + 1
+        return self.snapshot().row_to_write()
 
     def get_cell_identity(self, key, value):
-        all_values = self.sheet.get_all_values()
+        all_values = self.snapshot().values
         key_index = get_key_index(all_values, key)
         row_index = get_row_index(all_values, value)
         if row_index:
@@ -168,12 +790,11 @@ class GoogleSheetInterface:
         raise ValueError("Missing Row Index")
 
     def get_indexes(self):
-        all_values = self.sheet.get_all_values()
-        keys = all_values[0]
-        return {x: get_key_index(all_values, x) for x in keys}
+        return dict(self.snapshot().indexes)
 
     def get_row_cell_ids(self, key, value, addition=0):
-        all_values = self.sheet.get_all_records()
+        snapshot = self.snapshot()
+        all_values = snapshot.records()
         keys = all_values[0]
         row_index = 0
         for i, j in enumerate(all_values):
@@ -185,119 +806,154 @@ class GoogleSheetInterface:
         # if row_index == None:
         #     row_index = 1
         # row_index = row_index + addition
-        return {
-            x: [row_index + addition, get_key_index(self.sheet.get_all_values(), x)]
-            for x in keys
-        }
+        return {x: [row_index + addition, snapshot.indexes[x]] for x in keys}
 
     def update_existing_record(self, key, value, data, check=False):
-        cell_ids_dict = self.get_row_cell_ids(key, value, 1)
-        if check:
-            valid = all([p in cell_ids_dict.keys() for p in data.keys()])
-            if not valid:
-                raise KeyError("Invalid params passed")
-        for x, y in data.items():
-            coordinate = cell_ids_dict[x]
-            print(coordinate)
-            self.sheet.update_cell(*coordinate, y)
+        return self.update_existing_records(key, [(value, data)], check=check)[0]
+
+    def update_existing_records(self, key, updates, check=False):
+        """Writes every `(value, data)` pair of `updates` in a single batch
+        request and returns the updated rows as records."""
+        snapshot = self.snapshot(refresh=True).copy()
+        batch, rows = snapshot.plan_updates(key, updates, check=check)
+        response = self.sheet.batch_update(batch, **WRITE_OPTIONS)
+        results = snapshot.apply_updates(rows, batch, response.get("responses", []))
+        self.keep_snapshot(snapshot)
+        return results
 
     def fetch_groups(self, segments):
-        results = [
-            (self.sheet.get(x["cell_range"]), x.get("heading")) for x in segments
+        ranges = [
+            utils.absolute_range_name(self.sheet.title, x["cell_range"])
+            for x in segments
+        ]
+        results = self.batch_values(ranges)
+        return [
+            as_dict(values, heading=x.get("heading"))
+            for values, x in zip(results, segments)
         ]
-        return [as_dict(s[0], heading=s[1]) for s in results]
 
     def get_referenced_cell_values(self, options):
-        all_column_names: list = [
-            (column.lower()).strip() for column in self.sheet.row_values(1)
-        ]
-        complete_values = dict()
-        for column in options.get("columns"):
-            if isinstance(column, str):
-                unique_cells = get_cells(
-                    self.sheet.col_values(all_column_names.index(column.lower()) + 1)
-                )
-                column_value = self.sheet.batch_get(unique_cells)
-                expected_dict = get_cell_data(unique_cells, column_value)
-                complete_values[column] = expected_dict
-            else:
-                unique_cells = get_cells(self.sheet.col_values(column))
-                column_value = self.sheet.batch_get(unique_cells)
-                expected_dict = get_cell_data(unique_cells, column_value)
-                complete_values[column] = expected_dict
+        """Values of the cells quoted in the given `columns`, keyed by column
+        and reference. The columns are read together and every distinct
+        reference is then resolved with one batched read."""
+        columns = options.get("columns") or []
+        positions = referenced_columns(self.headers(), columns)
+        cells, unique, ranges = reference_plan(
+            self.sheet.title, self.column_values(positions)
+        )
+        return referenced_values(columns, cells, unique, self.batch_values(ranges))
 
-        return complete_values
+    def column_values(self, positions):
+        # whole columns, heading included, like `Worksheet.col_values`
+        snapshot = self.cached_snapshot()
+        if snapshot is not None:
+            return snapshot_columns(snapshot, positions)
+        ranges = column_ranges(self.sheet.title, positions)
+        results = self.batch_values(ranges, params={"majorDimension": "COLUMNS"})
+        return [x[0] if x else [] for x in results]
 
     def clear(self):
-        options = {
-            1: "A",
-            2: "B",
-            3: "C",
-            4: "D",
-            5: "E",
-            6: "F",
-            7: "G",
-            8: "H",
-            9: "I",
-            10: "J",
-            11: "K",
-            12: "L",
-            13: "M",
-            14: "N",
-            15: "0",
-            16: "P",
-            17: "Q",
-            18: "R",
-            19: "S",
-            20: "T",
-            21: "U",
-            22: "V",
-            23: "W",
-            24: "X",
-            25: "Y",
-            26: "Z",
-        }
-        indexes = self.get_indexes().values()
+        snapshot = self.snapshot(refresh=True)
+        indexes = snapshot.indexes.values()
         _min = min(indexes)
         _max = max(indexes)
-        last_row = self.get_row_to_write()
+        last_row = snapshot.row_to_write()
         self.sheet.delete_rows(_min + 1, last_row)
+        self.drop_snapshot()
+        self.invalidate_file()
 
     def bulk_add(self, data):
-        options = {
-            1: "A",
-            2: "B",
-            3: "C",
-            4: "D",
-            5: "E",
-            6: "F",
-            7: "G",
-            8: "H",
-            9: "I",
-            10: "J",
-            11: "K",
-            12: "L",
-            13: "M",
-            14: "N",
-            15: "0",
-            16: "P",
-            17: "Q",
-            18: "R",
-            19: "S",
-            20: "T",
-            21: "U",
-            22: "V",
-            23: "W",
-            24: "X",
-            25: "Y",
-            26: "Z",
-        }
-        indexes = self.get_indexes().values()
+        snapshot = self.snapshot(refresh=True)
+        indexes = snapshot.indexes.values()
         _min = min(indexes)
         _max = max(indexes)
-        last_row = self.get_row_to_write()
-        ranges = f"{options[_min]}{last_row}:{options[_max]}{last_row+(len(data)-1)}"
+        last_row = snapshot.row_to_write()
+        ranges = a1_range(last_row, _min, last_row + (len(data) - 1), _max)
         self.sheet.update(ranges, data)
+        self.drop_snapshot()
+
+
+def a1_range(start_row, start_col, end_row, end_col):
+    start = utils.rowcol_to_a1(start_row, start_col)
+    end = utils.rowcol_to_a1(end_row, end_col)
+    return f"{start}:{end}"
+
+
+def column_range(start_col, end_col, first_row=None, last_row=None):
+    """A1 range of the records `first_row`..`last_row` (1 based, the heading
+    excluded) over the given columns, open ended when `last_row` is missing."""
+    start = utils.rowcol_to_a1((first_row or 1) + 1, start_col)
+    if last_row:
+        return f"{start}:{utils.rowcol_to_a1(last_row + 1, end_col)}"
+    return f"{start}:{re.sub(r'[0-9]+', '', utils.rowcol_to_a1(1, end_col))}"
+
+
+def resolve_columns(heading, columns=None) -> typing.List[str]:
+    # column names or 1 based positions, the whole heading when missing
+    if not columns:
+        return [x for x in heading if x]
+    result = []
+    for column in columns:
+        if isinstance(column, int) and 0 < column <= len(heading):
+            column = heading[column - 1]
+        if column not in heading:
+            raise KeyError(column)
+        if column not in result:
+            result.append(column)
+    return result
+
+
+def column_runs(heading, names):
+    """Groups the positions of `names` into contiguous `(start, end)` runs
+    so neighbouring columns are fetched with a single range."""
+    positions = sorted(set(heading.index(x) + 1 for x in names))
+    runs = []
+    for position in positions:
+        if runs and runs[-1][1] == position - 1:
+            runs[-1][1] = position
+        else:
+            runs.append([position, position])
+    return [tuple(x) for x in runs]
+
+
+def count_range(title):
+    # the first column below the heading, rows past its last value are empty
+    return utils.absolute_range_name(title, "A2:A")
+
+
+def window_length(count, first_row=None, last_row=None) -> int:
+    # records `SheetSnapshot.project` returns for the window out of `count`
+    return len(range(count)[(first_row or 1) - 1 : last_row])
+
+
+def merge_columns(heading, names, runs, results, length=0):
+    """Stitches the values fetched for each run of `column_runs` back into
+    records holding only `names`, numericised like `get_all_records`. The
+    API drops trailing blank cells, rows missing from every run are padded
+    up to `length` records."""
+    lookup = {}
+    for i, (start, end) in enumerate(runs):
+        for position in range(start, end + 1):
+            lookup[position] = (i, position - start)
+    cells = [lookup[heading.index(x) + 1] for x in names]
+    length = max([length] + [len(x) for x in results])
+    records = []
+    for i in range(length):
+        row = []
+        for run, offset in cells:
+            values = results[run][i] if i < len(results[run]) else []
+            row.append(values[offset] if offset < len(values) else "")
+        records.append(dict(zip(names, utils.numericise_all(row))))
+    return records
+
+
+def match_records(records, key, values, case_insensitive=False):
+    # first record per value, same as `SheetSnapshot.find` without an index
+    found = {}
+    for record in records:
+        found.setdefault(lookup_value(record[key], case_insensitive), record)
+    result = [found.get(lookup_value(x, case_insensitive)) for x in values]
+    return [x for x in result if x is not None]
 
 
 def get_key_index(all_values, key):
@@ -315,21 +971,12 @@ def get_row_index(all_values, value, index=0):
 
 
 def as_dict(arr, heading=None):
-    # keys = arr[0]
-    keys = heading or arr[0]
-    values = arr[1:]
-    if heading:
-        values = arr
-    results = []
-    for k in values:
-        item = {}
-        for i, j in enumerate(keys):
-            try:
-                item[j] = k[i]
-            except IndexError as e:
-                item[j] = ""
-        results.append(item)
-    return results
+    """Rows of `arr` as dicts keyed by `heading`, or by the first row when
+    no heading is given. Short rows are padded with empty strings."""
+    keys = heading or (arr[0] if arr else [])
+    values = arr if heading else arr[1:]
+    width = len(keys)
+    return [dict(zip(keys, row[:width] + [""] * (width - len(row)))) for row in values]
 
 
 def paginate_response(response, page_size):
@@ -354,39 +1001,157 @@ def paginate_response(response, page_size):
 #     return row_range
 
 
+def page_bounds(total, page_size, page):
+    """Offsets `(start, end)` of `page` when `total` rows are split the same
+    way `paginate_response` splits them, without needing the rows."""
+    avg = total / float(page_size)
+    bounds = []
+    last = 0.0
+    while last < total:
+        bounds.append((int(last), int(last + avg)))
+        last += avg
+    if not bounds and page == 1:
+        return 0, 0
+    if page < 1 or page > len(bounds):
+        raise IndexError("Page out of range")
+    return bounds[page - 1]
+
+
+def page_result(questions, total, page_size, page, start, end):
+    return {
+        "first_row": start + 1,
+        "last_row": end,
+        "total_row_count": total,
+        "page": page,
+        "page_size": page_size,
+        "questions": questions,
+    }
+
+
 def get_page(response, page_size, page):
-    split_response = paginate_response(response, page_size)
-    sub_array = split_response[page - 1]
-    first = response.index(sub_array[0]) + 1
-    last = response.index(sub_array[-1]) + 1
-    result = {
-        "first_row": first,
-        "last_row": last,
-        "total_row_count": len(response),
+    start, end = page_bounds(len(response), page_size, page)
+    return page_result(response[start:end], len(response), page_size, page, start, end)
+
+
+def encode_cursor(**data) -> str:
+    value = json.dumps(data, sort_keys=True).encode()
+    return base64.urlsafe_b64encode(value).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError("Invalid `cursor` passed")
+
+
+def page_request(key, page, page_size, cursor=None):
+    """`(page, page_size, total)` to read. A cursor pins the row total seen
+    by the first page so later pages keep the same boundaries."""
+    if not cursor:
+        return page, page_size, None
+    state = decode_cursor(cursor)
+    try:
+        assert state["sheet"] == key
+        return int(state["page"]), int(state["page_size"]), int(state["total"])
+    except (AssertionError, KeyError, TypeError, ValueError):
+        raise ValueError("Invalid `cursor` passed")
+
+
+def next_cursor(key, page, page_size, total, end):
+    if end >= total:
+        return None
+    return encode_cursor(sheet=key, page=page + 1, page_size=page_size, total=total)
+
+
+def page_window(key, page, page_size, total):
+    start, end = page_bounds(total, page_size, page)
+    return {
         "page": page,
         "page_size": page_size,
-        "questions": sub_array,
+        "total": total,
+        "start": start,
+        "end": end,
+        "next_cursor": next_cursor(key, page, page_size, total, end),
     }
 
+
+def window_result(window, questions):
+    result = page_result(
+        questions,
+        window["total"],
+        window["page_size"],
+        window["page"],
+        window["start"],
+        window["end"],
+    )
+    result["next_cursor"] = window["next_cursor"]
     return result
 
 
 def get_cells(column_data):
-    cleaned_data = ",".join(list(set(column_data)))
-    pattern = re.compile(r'[A-Z]\d+"')
-    cells = pattern.findall(cleaned_data)
-    cells.sort()
-    cells = [cell.replace('"', "") for cell in cells]
-    return cells
+    """Sorted distinct cell references quoted in the values of a column."""
+    found = set()
+    for value in column_data:
+        for sheet, cell in CELL_REFERENCE.findall(str(value)):
+            found.add(sheet + cell)
+    return sorted(found)
 
 
 def get_cell_data(unique_cells, cell_data):
-    cell_dictionary = dict()
-    for n in unique_cells:
-        cell_dictionary[unique_cells[unique_cells.index(n)]] = cell_data[
-            unique_cells.index(n)
-        ][0][0]
-        cell_dictionary[unique_cells[unique_cells.index(n)]] = cell_data[
-            unique_cells.index(n)
-        ][0][0]
-    return cell_dictionary
+    # `cell_data` holds the values read for each of `unique_cells`, in order
+    return {
+        cell: values[0][0] if values and values[0] else ""
+        for cell, values in zip(unique_cells, cell_data)
+    }
+
+
+def reference_range(title, cell):
+    # references without a sheet point into the worksheet holding them
+    sheet, _, a1 = cell.rpartition("!")
+    a1 = a1.replace("$", "")
+    if sheet:
+        return f"{sheet}!{a1}"
+    return utils.absolute_range_name(title, a1)
+
+
+def referenced_columns(heading, columns):
+    """1 based positions of `columns`, given by position or by name matched
+    regardless of case and surrounding spaces."""
+    positions = {}
+    for i, name in enumerate(heading):
+        positions.setdefault(str(name).lower().strip(), i + 1)
+    result = []
+    for column in columns:
+        if isinstance(column, str):
+            column = positions[column.lower().strip()]
+        result.append(column)
+    return result
+
+
+def column_ranges(title, positions):
+    letters = [re.sub(r"[0-9]+", "", utils.rowcol_to_a1(1, x)) for x in positions]
+    return [utils.absolute_range_name(title, f"{x}:{x}") for x in letters]
+
+
+def snapshot_columns(snapshot: SheetSnapshot, positions):
+    return [
+        [row[x - 1] if x <= len(row) else "" for row in snapshot.values]
+        for x in positions
+    ]
+
+
+def reference_plan(title, column_values):
+    """References quoted in each of `column_values`, the distinct ones
+    across every column and the ranges to read them with."""
+    cells = [get_cells(x) for x in column_values]
+    unique = sorted(set(x for y in cells for x in y))
+    return cells, unique, [reference_range(title, x) for x in unique]
+
+
+def referenced_values(columns, cells, unique, values):
+    # columns given by position are keyed like they come back from the cache
+    found = get_cell_data(unique, values)
+    return {
+        str(column): {x: found[x] for x in refs} for column, refs in zip(columns, cells)
+    }
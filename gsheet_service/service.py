@@ -2,81 +2,105 @@ import typing
 import json
 
 from gsheet_service import settings, models
-from gsheet_service.types import Result, config
+from gsheet_service.types import Result, get_sheet_interface
 
 
-async def read_row(link, sheet, key, value) -> Result:
+async def read_row(
+    link, sheet, key, value, values=None, columns=None, first_row=None, last_row=None
+) -> Result:
     if not link or not sheet:
         return Result(error="Missing `link` or `sheet` value")
-    instance = models.GoogleSheetInterface(**config)
-    instance.load_file(link, sheet)
-    result = instance.get_all_records()
-    if value:
+    instance = await get_sheet_interface()
+    await instance.load_file(link, sheet)
+    if value or values:
         if not key:
             return Result(error="Missing `key` field to read a single record")
-        found = [x for x in result if x[key] == value]
+        try:
+            found = await instance.find_records(
+                key, values or [value], columns=columns
+            )
+        except KeyError:
+            return Result(error="Wrong `key` or `columns` passed")
+        if values:
+            return Result(data=found)
         if found:
             return Result(data=found[0])
         return Result(error="Missing result")
+    if columns or first_row or last_row:
+        try:
+            result = await instance.read_columns(columns, first_row, last_row)
+        except KeyError:
+            return Result(error="Wrong `columns` passed")
+        return Result(data=result)
+    result = await instance.get_all_records()
     return Result(data=result)
 
 
-async def update_row(link, sheet, key, value, data) -> Result:
+async def update_row(link, sheet, key, value, data, updates=None) -> Result:
     if not link or not sheet:
         return Result(error="Missing `link` or `sheet` value")
-    instance = models.GoogleSheetInterface(**config)
-    instance.load_file(link, sheet)
-    if value:
+    instance = await get_sheet_interface()
+    await instance.load_file(link, sheet)
+    if value or updates:
         if not key:
             return Result(error="Missing `key` field to read a record")
+        targets = [(x.get("value"), x.get("data") or {}) for x in updates or []]
+        if value:
+            targets.insert(0, (value, data))
         try:
-            instance.update_existing_record(key, value, data)
-        except KeyError as e:
+            result = await instance.update_existing_records(key, targets)
+        except KeyError:
             return Result(error="Wrong `key` passed in `data`")
-        else:
-            return await read_row(link, sheet, key, value)
+        except ValueError:
+            return Result(error="Missing result")
+        if updates:
+            return Result(data=result)
+        return Result(data=result[0])
 
 
-async def read_last_row(link, sheet) -> Result:
+async def read_last_row(link, sheet, columns=None) -> Result:
     if not link or not sheet:
         return Result(error="Missing `link` or `sheet` value")
-    instance = models.GoogleSheetInterface(**config)
-    instance.load_file(link, sheet)
-    result = instance.read_last_row()
+    instance = await get_sheet_interface()
+    await instance.load_file(link, sheet)
+    try:
+        result = await instance.read_last_row(columns=columns)
+    except KeyError:
+        return Result(error="Wrong `columns` passed")
     return Result(data=result)
 
 
 async def new_sheet(link, sheet, value):
     if not link or not sheet:
         return Result(error="Missing `link` or `sheet` value")
-    instance = models.GoogleSheetInterface(**config)
-    result = instance.create_new_sheet(link, sheet, value)
+    instance = await get_sheet_interface()
+    result = await instance.create_new_sheet(link, sheet, value)
     return Result(data=result)
 
 
 async def edit_sheet(link, sheet, value):
     if not link or not sheet:
         return Result(error="Missing `link` or `sheet` value")
-    instance = models.GoogleSheetInterface(**config)
-    result = instance.edit_sheet(link, sheet, value)
+    instance = await get_sheet_interface()
+    result = await instance.edit_sheet(link, sheet, value)
     return Result(data=result)
 
 
 async def add_to_sheet(link, sheet, value):
     if not link or not sheet:
         return Result(error="Missing `link` or `sheet` value")
-    instance = models.GoogleSheetInterface(**config)
-    instance.load_file(link, sheet)
-    key, value = instance.update_records(value)
-    return await read_row(link, sheet, key, value[key])
+    instance = await get_sheet_interface()
+    await instance.load_file(link, sheet)
+    key, record = await instance.update_records(value)
+    return Result(data=record)
 
 
 async def add_multiple_rows(link, sheet, values):
     if not link or not sheet:
         return Result(error="Missing `link` or `sheet` value")
-    instance = models.GoogleSheetInterface(**config)
-    instance.load_file(link, sheet)
-    instance.bulk_add(values)
+    instance = await get_sheet_interface()
+    await instance.load_file(link, sheet)
+    await instance.bulk_add(values)
     # for i in values:
     #     key, value = instance.update_records(i)
     return await read_row(link, sheet, None, None)
@@ -85,52 +109,135 @@ async def add_multiple_rows(link, sheet, values):
 async def clear_all_rows(link, sheet):
     if not link or not sheet:
         return Result(error="Missing `link` or `sheet` value")
-    instance = models.GoogleSheetInterface(**config)
-    instance.load_file(link, sheet)
-    instance.clear()
+    instance = await get_sheet_interface()
+    await instance.load_file(link, sheet)
+    await instance.clear()
     return await read_row(link, sheet, None, None)
 
 
 async def fetch_groups(link, sheet, segments):
     if not link or not sheet:
         return Result(error="Missing `link` or `sheet` value")
-    instance = models.GoogleSheetInterface(**config)
-    instance.load_file(link, sheet)
-    result = instance.fetch_groups(segments)
+    instance = await get_sheet_interface()
+    await instance.load_file(link, sheet)
+    result = await instance.fetch_groups(segments)
     return Result(data=result)
 
 
-async def read_sheetnames(link) -> Result:
+async def read_sheetnames(link, refresh=False) -> Result:
     if not link:
         return Result(error="Missing `link` or `sheet` value")
-    instance = models.GoogleSheetInterface(**config)
-    result = instance.get_sheet_names(link)
-    title = instance.get_spreadsheet_title(link)
-    return Result(data=dict(title=title, sheet_names=result))
+    instance = await get_sheet_interface()
+    await instance.open_file(link, refresh=refresh)
+    return Result(data=await instance.summary())
+
 
+async def batch_read(link, specs) -> Result:
+    if not link or not specs:
+        return Result(error="Missing `link` or `specs` value")
+    errors = [models.spec_error(x) for x in specs]
+    valid = [x for x, y in zip(specs, errors) if not y]
+    found = []
+    if valid:
+        instance = await get_sheet_interface()
+        found = await instance.batch_read(link, valid)
+    found = iter(found)
+    return Result(data=[{"error": x} if x else next(found) for x in errors])
 
-async def read_new_row(link, sheet, page, page_size, key, value) -> Result:
+
+async def read_revision(link) -> Result:
+    if not link:
+        return Result(error="Missing `link` value")
+    instance = await get_sheet_interface()
+    return Result(data=await instance.get_revision(link))
+
+
+async def read_new_row(
+    link, sheet, page, page_size, key, value, columns=None, cursor=None
+) -> Result:
     if not link or not sheet:
         return Result(error="Missing `link` or `sheet` value")
-    instance = models.GoogleSheetInterface(**config)
-    instance.load_file(link, sheet)
-    full_result = instance.get_all_records()
-    result = models.get_page(full_result, page_size=page_size, page=page)
+    instance = await get_sheet_interface()
+    await instance.load_file(link, sheet)
+    fields = columns
+    if columns and key and key not in columns:
+        fields = columns + [key]
+    try:
+        result = await instance.read_page(
+            page, page_size, columns=fields, cursor=cursor
+        )
+    except KeyError:
+        return Result(error="Wrong `key` or `columns` passed")
+    except (IndexError, ValueError) as e:
+        return Result(error=str(e))
     if value:
         if not key:
             return Result(error="Missing `key` field to read a single record")
-        found = [x for x in result if x[key] == value]
+        found = [x for x in result["questions"] if x[key] == value]
         if found:
             return Result(data=found[0])
     return Result(data=result)
 
 
+def stream_records(instance, columns, first_row, last_row=None, chunk_size=None):
+    """Yields the records `first_row`..`last_row` reading them one range of
+    `chunk_size` rows at a time. Without `last_row` the records are read
+    until a chunk comes back short, the sheet is never counted or loaded."""
+    chunk_size = chunk_size or settings.STREAM_CHUNK_SIZE
+
+    async def records():
+        start = first_row
+        while last_row is None or start <= last_row:
+            end = start + chunk_size - 1
+            if last_row is not None:
+                end = min(end, last_row)
+            chunk = await instance.read_columns(columns, start, end)
+            for record in chunk:
+                yield record
+            if len(chunk) < end - start + 1:
+                return
+            start = end + 1
+
+    return records()
+
+
+async def stream_rows(link, sheet, columns=None, first_row=None, last_row=None):
+    if not link or not sheet:
+        return Result(error="Missing `link` or `sheet` value")
+    instance = await get_sheet_interface()
+    await instance.load_file(link, sheet)
+    try:
+        models.resolve_columns(await instance.headers(), columns)
+    except KeyError:
+        return Result(error="Wrong `columns` passed")
+    return Result(data=stream_records(instance, columns, first_row or 1, last_row))
+
+
+async def stream_page(link, sheet, page, page_size, columns=None, cursor=None):
+    if not link or not sheet:
+        return Result(error="Missing `link` or `sheet` value")
+    instance = await get_sheet_interface()
+    await instance.load_file(link, sheet)
+    try:
+        models.resolve_columns(await instance.headers(), columns)
+        window = await instance.page_window(page, page_size, cursor)
+    except KeyError:
+        return Result(error="Wrong `columns` passed")
+    except (IndexError, ValueError) as e:
+        return Result(error=str(e))
+    records = stream_records(instance, columns, window["start"] + 1, window["end"])
+    return Result(data={**models.window_result(window, None), "questions": records})
+
+
 async def read_referenced_cell(link, sheet, options, key, value) -> Result:
     if not link or not sheet:
         return Result(error="Missing `link` or `sheet` value")
-    instance = models.GoogleSheetInterface(**config)
-    instance.load_file(link, sheet)
-    result = instance.get_referenced_cell_values(options)
+    instance = await get_sheet_interface()
+    await instance.load_file(link, sheet)
+    try:
+        result = await instance.get_referenced_cell_values(options)
+    except KeyError:
+        return Result(error="Wrong `columns` passed")
     if value:
         if not key:
             return Result(error="Missing `key` field to read a single record")
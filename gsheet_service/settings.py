@@ -1,5 +1,5 @@
 from starlette.config import Config
-from starlette.datastructures import URL, Secret
+from starlette.datastructures import URL, CommaSeparatedStrings, Secret
 
 config = Config(".env")
 SECRET= config("APP_SECRET")
@@ -17,6 +17,55 @@ MEDIA_SPREADSHEET = config("MEDIA_SPREADSHEET")
 SCHEDULER_SPREADSHEET = config("SCHEDULER_SPREADSHEET")
 SCHEDULER_SHEET_NAME = config("SCHEDULER_SHEET_NAME")
 DATABASE_URL=config("DATABASE_URL",default="")
+# memory, sqlite, postgres or redis, guessed from CACHE_URL when left empty
+CACHE_BACKEND = config("CACHE_BACKEND", default="")
+CACHE_URL = config("CACHE_URL", default=DATABASE_URL)
+CACHE_MEMORY_SIZE = config("CACHE_MEMORY_SIZE", cast=int, default=10000)
+CLIENT_POOL_SIZE = config("CLIENT_POOL_SIZE", cast=int, default=32)
+TOKEN_REFRESH_MARGIN = config("TOKEN_REFRESH_MARGIN", cast=int, default=300)
+METADATA_CACHE_SIZE = config("METADATA_CACHE_SIZE", cast=int, default=256)
+METADATA_CACHE_TTL = config("METADATA_CACHE_TTL", cast=int, default=300)
+SNAPSHOT_CACHE_SIZE = config("SNAPSHOT_CACHE_SIZE", cast=int, default=64)
+SNAPSHOT_CACHE_TTL = config("SNAPSHOT_CACHE_TTL", cast=int, default=60)
+# provider config sheets rarely change, /reload-providers picks up edits
+PROVIDER_CACHE_TTL = config("PROVIDER_CACHE_TTL", cast=int, default=3600)
+PROVIDER_CACHE_SIZE = config("PROVIDER_CACHE_SIZE", cast=int, default=64)
+SHEET_EXECUTOR_WORKERS = config("SHEET_EXECUTOR_WORKERS", cast=int, default=8)
+SHEET_EXECUTOR_QUEUE = config("SHEET_EXECUTOR_QUEUE", cast=int, default=64)
+SHEET_EXECUTOR_TIMEOUT = config("SHEET_EXECUTOR_TIMEOUT", cast=float, default=30)
+# "threaded" runs gspread on the executor, "async" talks to the REST api over httpx
+SHEET_CLIENT = config("SHEET_CLIENT", default="threaded")
+SHEET_HTTP2 = config("SHEET_HTTP2", cast=bool, default=True)
+SHEET_HTTP_MAX_CONNECTIONS = config("SHEET_HTTP_MAX_CONNECTIONS", cast=int, default=100)
+SHEET_HTTP_MAX_KEEPALIVE = config("SHEET_HTTP_MAX_KEEPALIVE", cast=int, default=20)
+STREAM_CHUNK_SIZE = config("STREAM_CHUNK_SIZE", cast=int, default=1000)
+# seconds a cached response stays valid, 0 keeps it until it is purged
+REQUEST_CACHE_TTL = config("REQUEST_CACHE_TTL", cast=int, default=3600)
+# cached reads older than CACHE_FRESH_TTL are still served for CACHE_STALE_TTL
+# more seconds while they are refreshed in the background
+CACHE_FRESH_TTL = config("CACHE_FRESH_TTL", cast=int, default=60)
+CACHE_STALE_TTL = config("CACHE_STALE_TTL", cast=int, default=3600)
+# seconds between two looks at the invalidations other processes made to the
+# shared cache of the same spreadsheet, 0 looks on every cached read
+CACHE_SYNC_INTERVAL = config("CACHE_SYNC_INTERVAL", cast=float, default=5)
+# seconds between two Drive revision checks of the same spreadsheet
+REVISION_CHECK_INTERVAL = config("REVISION_CHECK_INTERVAL", cast=int, default=10)
+# "drive" registers files.watch channels, "local" keeps them in process
+WATCH_NOTIFIER = config("WATCH_NOTIFIER", default="drive")
+# Drive caps file channels at a day
+WATCH_CHANNEL_TTL = config("WATCH_CHANNEL_TTL", cast=int, default=86400)
+WATCH_RENEW_MARGIN = config("WATCH_RENEW_MARGIN", cast=int, default=600)
+# scheduler provider that renews the channels, none leaves it to the caller
+WATCH_SCHEDULER = config("WATCH_SCHEDULER", default=None)
+# "link|sheet" pairs loaded at startup besides the provider sheets, a bare
+# link only loads the spreadsheet metadata
+WARMUP_SHEETS = config("WARMUP_SHEETS", cast=CommaSeparatedStrings, default="")
+# seconds between reloads of the warm-up list, 0 loads it once
+WARMUP_INTERVAL = config("WARMUP_INTERVAL", cast=int, default=SNAPSHOT_CACHE_TTL)
+CACHE_REAP_INTERVAL = config("CACHE_REAP_INTERVAL", cast=int, default=300)
+LOCAL_CACHE_SIZE = config("LOCAL_CACHE_SIZE", cast=int, default=1024)
+LOCAL_CACHE_BYTES = config("LOCAL_CACHE_BYTES", cast=int, default=64 * 1024 * 1024)
+LOCAL_CACHE_TTL = config("LOCAL_CACHE_TTL", cast=int, default=300)
 # IMAGE_SERVICES = {
 #     "cloudinary": {
 #         "cloud_name": config("CLOUDINARY_CLOUD_NAME"),
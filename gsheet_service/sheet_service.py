@@ -1,37 +1,398 @@
-import jwt
-
-from gsheet_service import app_models, service, settings
-
-service_api = None
-
-if settings.DATABASE_URL:
-    service_api = app_models.ServiceAPI(settings.DATABASE_URL)
+import asyncio
+import functools
+import logging
+
+from gsheet_service import app_models, cache_backends, models, service, settings
+from gsheet_service.executor import SingleFlight
+from gsheet_service.local_cache import TTLCache
+
+service_api = cache_backends.create_backend(
+    settings.CACHE_BACKEND, settings.CACHE_URL, max_size=settings.CACHE_MEMORY_SIZE
+)
+
+request_cache = app_models.TieredCache(
+    TTLCache(
+        max_size=settings.LOCAL_CACHE_SIZE,
+        ttl=settings.LOCAL_CACHE_TTL,
+        max_bytes=settings.LOCAL_CACHE_BYTES,
+        sizeof=app_models.entry_size,
+    ),
+    service_api,
+)
+single_flight = SingleFlight()
+refresh_tasks = set()
+# spreadsheet id -> Drive revision, rate limits the revision checks per link
+revisions = TTLCache(
+    max_size=settings.LOCAL_CACHE_SIZE, ttl=settings.REVISION_CHECK_INTERVAL
+)
+# spreadsheet id -> revision the worksheet values cached by `models` are from
+model_revisions = TTLCache(max_size=settings.LOCAL_CACHE_SIZE, ttl=float("inf"))
+# spreadsheet id -> invalidation generation of the shared cache, rate limits
+# the generation checks per link
+generations = TTLCache(
+    max_size=settings.LOCAL_CACHE_SIZE, ttl=settings.CACHE_SYNC_INTERVAL
+)
+# spreadsheet id -> generation what this process keeps about it is from
+local_generations = TTLCache(max_size=settings.LOCAL_CACHE_SIZE, ttl=float("inf"))
+
+# (fresh, stale) seconds per cached method, the others use the defaults
+CACHE_POLICIES = {
+    "read_sheetnames": (settings.METADATA_CACHE_TTL, settings.CACHE_STALE_TTL),
+    # sheets created or edited by a cached request must not be redone
+    "add_new_sheet": (settings.REQUEST_CACHE_TTL, 0),
+    "edit_sheet": (settings.REQUEST_CACHE_TTL, 0),
+}
+
+
+def cache_policy(method):
+    return CACHE_POLICIES.get(
+        method, (settings.CACHE_FRESH_TTL, settings.CACHE_STALE_TTL)
+    )
 
 
 def encode_obj(obj):
-    result = jwt.encode(obj, settings.SECRET, algorithm="HS256")
-    return result.decode("utf-8")
-
-
-async def check_database(request_id, callback) -> service.Result:
-    if service_api:
-        result = await service_api.get_record(request_id)
-        if result:
-            return service.Result(data=result)
+    # `max_age` only changes how a cached response is used, not the response
+    obj = {k: v for k, v in obj.items() if k != "max_age"}
+    return app_models.request_key(obj, settings.SECRET)
+
+
+async def check_database(
+    request_id, callback, link=None, sheet=None, method=None, max_age=None
+) -> service.Result:
+    """Serves the cached response of `request_id` while it is fresh. Once it
+    is stale it is still served but refreshed in the background, unless the
+    caller asked for one younger than `max_age` seconds."""
+    fresh, stale = cache_policy(method)
+    ttl = fresh + stale if fresh else 0
+    # only entries that can go stale are worth checking against Drive
+    validate = bool(stale and link and settings.REVISION_CHECK_INTERVAL)
+    refresh = functools.partial(
+        fetch_fresh, request_id, callback, link, sheet, ttl, validate=validate
+    )
+    await sync_invalidations(link)
+    entry = await request_cache.get_entry(request_id, fresh)
+    if entry and entry["data"]:
+        state = app_models.freshness(entry["created_at"], fresh, stale, max_age)
+        if state == "stale":
+            revalidate(request_id, lambda: refresh(entry))
+        if state != "expired":
+            return service.Result(data=entry["data"], etag=entry["etag"])
+        # a revision checked less than `max_age` ago can still vouch for it
+        if max_age is None or max_age < settings.REVISION_CHECK_INTERVAL:
+            entry = None
+    else:
+        entry = None
+    forget_older(link, max_age)
+    # identical requests arriving together wait for the first one's result
+    return await single_flight.run(request_id, lambda: refresh(entry))
+
+
+def revalidate(request_id, refresh):
+    if request_id in single_flight.calls:
+        return
+    task = asyncio.ensure_future(single_flight.run(request_id, refresh))
+    refresh_tasks.add(task)
+    task.add_done_callback(revalidated)
+
+
+def revalidated(task):
+    refresh_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logging.error("Cache refresh failed", exc_info=task.exception())
+
+
+async def fetch_fresh(
+    request_id, callback, link=None, sheet=None, ttl=None, entry=None, validate=False
+) -> service.Result:
+    """Calls `callback` and caches its result, unless the spreadsheet has not
+    changed since `entry` was cached in which case `entry` is kept."""
+    revision = await current_revision(link) if validate else None
+    if entry and revision and entry.get("revision") == revision:
+        await request_cache.touch(request_id, entry, ttl=ttl)
+        return service.Result(data=entry["data"], etag=entry["etag"])
+    if revision:
+        sync_models(link, revision)
     data = await callback()
     if data.data:
-        if service_api:
-            await service_api.update_record(request_id, data.data)
+        sheet_link, sheet_name = sheet_tags(link, sheet)
+        entry = await request_cache.update_record(
+            request_id,
+            data.data,
+            sheet_link=sheet_link,
+            sheet_name=sheet_name,
+            ttl=ttl,
+            revision=revision,
+        )
+        data.etag = entry["etag"]
     return data
 
 
+def sync_models(link, revision):
+    """Drops the worksheet values `models` keeps for the spreadsheet the
+    first time `revision` is seen, a response stored under a revision must
+    not be read from values cached before it."""
+    file_id, _ = app_models.cache_tags(link)
+    if model_revisions.get(file_id) != revision:
+        models.forget_spreadsheet(file_id)
+        model_revisions.set(file_id, revision)
+
+
+def forget_older(link, max_age=None):
+    # worksheet values older than `max_age` can not answer the read either
+    if link and max_age is not None:
+        file_id, _ = app_models.cache_tags(link)
+        models.forget_older(file_id, max_age)
+
+
+async def sync_invalidations(link):
+    """Drops the responses and worksheet values this process keeps for the
+    spreadsheet at `link` once another process sharing the cache backend
+    invalidated it. The backend is asked at most once every
+    `CACHE_SYNC_INTERVAL` seconds."""
+    if not link:
+        return
+    file_id, _ = app_models.cache_tags(link)
+    if generations.get(file_id) is not None:
+        return
+    generation = await single_flight.run(
+        ("generation", file_id), lambda: request_cache.generation(file_id)
+    )
+    generation = generation or ""
+    generations.set(file_id, generation)
+    known = local_generations.get(file_id)
+    if known is not None and known != generation:
+        request_cache.forget_local(file_id)
+        models.forget_spreadsheet(file_id)
+    local_generations.set(file_id, generation)
+
+
+async def current_revision(link):
+    """Drive revision of the spreadsheet at `link`, asked to Google at most
+    once every `REVISION_CHECK_INTERVAL` seconds."""
+    file_id, _ = app_models.cache_tags(link)
+    revision = revisions.get(file_id)
+    if revision is None:
+        revision = await single_flight.run(
+            ("revision", file_id), lambda: fetch_revision(link)
+        )
+        revisions.set(file_id, revision)
+    return revision or None
+
+
+async def fetch_revision(link) -> str:
+    try:
+        result = await service.read_revision(link)
+    except Exception as e:
+        # without a revision entries are simply refetched once stale
+        logging.exception(e)
+        return ""
+    return result.data or ""
+
+
+def worksheet_tag(link, sheet=None):
+    """Tag of the worksheet `sheet` resolves to. Tagging by id makes every
+    name matching the same worksheet share its cached responses."""
+    if not sheet:
+        return None
+    file_id, _ = app_models.cache_tags(link)
+    found = models.worksheet_id(file_id, sheet)
+    return str(found) if found is not None else None
+
+
+def sheet_tags(link, sheet=None):
+    if sheet == app_models.ANY_SHEET:
+        return app_models.cache_tags(link, sheet)
+    # `sheet` itself when the spreadsheet metadata is not cached any more
+    return app_models.cache_tags(link, worksheet_tag(link, sheet) or sheet)
+
+
+async def invalidate(link, sheet=None) -> int:
+    """Drops the cached responses of `sheet`, or of the whole spreadsheet
+    when no sheet is given or its worksheet can not be resolved."""
+    if not link:
+        return 0
+    sheet_link, sheet_name = app_models.cache_tags(link, worksheet_tag(link, sheet))
+    # our own write changed the revision, do not trust the remembered one
+    revisions.delete(sheet_link)
+    count = await request_cache.delete_tagged(sheet_link, sheet_name)
+    # our own invalidation, the values kept in `models` already have the write
+    generation = await request_cache.generation(sheet_link) or ""
+    generations.set(sheet_link, generation)
+    local_generations.set(sheet_link, generation)
+    return count
+
+
+async def reap_expired_records():
+    while True:
+        await asyncio.sleep(settings.CACHE_REAP_INTERVAL)
+        try:
+            await service_api.reap_expired()
+        except Exception as e:
+            logging.exception(e)
+
+
 async def fetch_groups(**data) -> service.Result:
+    """Rows of each segment's `cell_range`. Segments are cached on their own
+    so requests sharing some of them reuse each other's reads."""
     link = data.get("link")
     sheet = data.get("sheet")
     segments = data.get("segments") or []
-    key = encode_obj({**data, "method": "fetch_groups"})
-    callback = lambda: service.fetch_groups(link, sheet, segments)
-    return await check_database(key, callback)
+    if not link or not sheet:
+        return service.Result(error="Missing `link` or `sheet` value")
+    keys = [
+        encode_obj(
+            {
+                "link": link,
+                "sheet": sheet,
+                "cell_range": x.get("cell_range"),
+                "heading": x.get("heading"),
+                "method": "fetch_groups",
+            }
+        )
+        for x in segments
+    ]
+    fetch = functools.partial(fetch_segments, link, sheet, segments, keys)
+    result = await check_parts(link, keys, fetch, "fetch_groups", data.get("max_age"))
+    if result.error:
+        return result
+    return service.Result(data=[result.data[i] for i in range(len(segments))])
+
+
+async def fetch_segments(
+    link, sheet, segments, keys, indexes, ttl=None, revision=None
+) -> service.Result:
+    result = await service.fetch_groups(link, sheet, [segments[i] for i in indexes])
+    if result.error:
+        return result
+    sheet_link, sheet_name = sheet_tags(link, sheet)
+    found = {}
+    for i, rows in zip(indexes, result.data):
+        found[keys[i]] = rows
+        await request_cache.update_record(
+            keys[i], rows, sheet_link, sheet_name, ttl=ttl, revision=revision
+        )
+    return service.Result(data=found)
+
+
+async def batch_read(**data) -> service.Result:
+    """Answers several sheet reads of one spreadsheet. Every spec is cached
+    on its own and the ones missing from the cache share one batched read."""
+    link = data.get("link")
+    specs = data.get("specs")
+    if not link or not specs or not isinstance(specs, list):
+        return service.Result(error="Missing `link` or `specs` value")
+    # specs that are not objects get their error from `service.batch_read`
+    fields = [x if isinstance(x, dict) else {"spec": x} for x in specs]
+    names = [str(x.get("name", i)) for i, x in enumerate(fields)]
+    if len(set(names)) < len(names):
+        return service.Result(error="Duplicate `name` in `specs`")
+    keys = [
+        encode_obj(
+            {
+                "link": link,
+                **{k: v for k, v in x.items() if k != "name"},
+                "method": "batch_read",
+            }
+        )
+        for x in fields
+    ]
+    fetch = functools.partial(fetch_batch, link, specs, keys)
+    result = await check_parts(link, keys, fetch, "batch_read", data.get("max_age"))
+    if result.error:
+        return result
+    return service.Result(data={names[i]: result.data[i] for i in range(len(specs))})
+
+
+async def fetch_batch(
+    link, specs, keys, indexes, ttl=None, revision=None
+) -> service.Result:
+    result = await service.batch_read(link, [specs[i] for i in indexes])
+    if result.error:
+        return result
+    found = {}
+    for i, item in zip(indexes, result.data):
+        if "error" in item:
+            found[keys[i]] = {"status": False, "msg": item["error"]}
+            continue
+        found[keys[i]] = {"status": True, "data": item["data"]}
+        sheet_link, sheet_name = sheet_tags(link, specs[i].get("sheet"))
+        await request_cache.update_record(
+            keys[i],
+            found[keys[i]],
+            sheet_link,
+            sheet_name,
+            ttl=ttl,
+            revision=revision,
+        )
+    return service.Result(data=found)
+
+
+async def check_parts(link, keys, fetch, method, max_age=None) -> service.Result:
+    """`check_database` for requests made of several parts cached under
+    `keys`. Parts missing from the cache are fetched together with
+    `fetch(indexes, ttl, revision)`, stale ones are refreshed the same way in
+    the background. The result maps the position of each part to its data."""
+    fresh, stale = cache_policy(method)
+    ttl = fresh + stale if fresh else 0
+    validate = bool(stale and link and settings.REVISION_CHECK_INTERVAL)
+    await sync_invalidations(link)
+    entries = await asyncio.gather(*[request_cache.get_entry(x, fresh) for x in keys])
+    results, missing, outdated, known = {}, [], [], {}
+    for i, entry in enumerate(entries):
+        if not entry:
+            missing.append(i)
+            continue
+        known[i] = entry
+        state = app_models.freshness(entry["created_at"], fresh, stale, max_age)
+        if state == "expired":
+            missing.append(i)
+            # a revision checked less than `max_age` ago can still vouch for it
+            if max_age is None or max_age < settings.REVISION_CHECK_INTERVAL:
+                del known[i]
+            continue
+        results[i] = entry["data"]
+        if state == "stale":
+            outdated.append(i)
+    refresh = functools.partial(
+        fetch_parts, link, keys, fetch, known, ttl=ttl, validate=validate
+    )
+    if outdated:
+        request_id = (method, link, *sorted({keys[i] for i in outdated}))
+        revalidate(request_id, lambda: refresh(outdated))
+    if missing:
+        forget_older(link, max_age)
+        # requests missing the same parts together wait for one read of them
+        request_id = (method, link, *sorted({keys[i] for i in missing}))
+        result = await single_flight.run(request_id, lambda: refresh(missing))
+        if result.error:
+            return result
+        results.update({i: result.data[keys[i]] for i in missing})
+    return service.Result(data=results)
+
+
+async def fetch_parts(
+    link, keys, fetch, entries, indexes, ttl=None, validate=False
+) -> service.Result:
+    """`fetch_fresh` for the parts at `indexes`, the ones whose entry was
+    cached at the current revision are kept. The result maps the key of
+    each part to its data."""
+    revision = await current_revision(link) if validate else None
+    found, changed = {}, []
+    for i in indexes:
+        entry = entries.get(i)
+        if entry and revision and entry.get("revision") == revision:
+            await request_cache.touch(keys[i], entry, ttl=ttl)
+            found[keys[i]] = entry["data"]
+        else:
+            changed.append(i)
+    if not changed:
+        return service.Result(data=found)
+    if revision:
+        sync_models(link, revision)
+    result = await fetch(changed, ttl, revision)
+    if result.error:
+        return result
+    return service.Result(data={**found, **result.data})
 
 
 async def read_row(**data):
@@ -39,14 +400,40 @@ async def read_row(**data):
     primary_key = data.get("key")
     value = data.get("value")
     sheet = data.get("sheet")
+    values = data.get("values")
+    columns = data.get("columns")
+    first_row = data.get("first_row")
+    last_row = data.get("last_row")
     key = encode_obj({**data, "method": "read_row"})
-    callback = lambda: service.read_row(link, sheet, primary_key, value)
-    return await check_database(key, callback)
+    callback = lambda: service.read_row(
+        link, sheet, primary_key, value, values, columns, first_row, last_row
+    )
+    return await check_database(
+        key, callback, link, sheet, method="read_row", max_age=data.get("max_age")
+    )
+
+
+async def stream_rows(**data):
+    link = data.get("link")
+    sheet = data.get("sheet")
+    columns = data.get("columns")
+    first_row = data.get("first_row")
+    last_row = data.get("last_row")
+    return await service.stream_rows(link, sheet, columns, first_row, last_row)
+
+
+async def stream_page(**data):
+    link = data.get("link")
+    sheet = data.get("sheet")
+    page_size = data.get("page_size") or 20
+    page = data.get("page") or 1
+    columns = data.get("columns")
+    cursor = data.get("cursor")
+    return await service.stream_page(link, sheet, page, page_size, columns, cursor)
 
 
 async def delete_key(**data):
-    key = encode_obj({**data, "method": "read_row"})
-    result = await service_api.delete_record(key)
+    result = await invalidate(data.get("link"), data.get("sheet"))
     if result:
         return service.Result(data={"msg": "Successfull"})
     return service.Result(error="Missing key record found")
@@ -58,7 +445,7 @@ async def new_sheet(**data):
     heading = data.get("data")
     key = encode_obj({**data, "method": "add_new_sheet"})
     callback = lambda: service.new_sheet(link, sheet, heading)
-    return await check_database(key, callback)
+    return await check_database(key, callback, link, sheet, method="add_new_sheet")
 
 
 async def edit_sheet(**data):
@@ -67,17 +454,19 @@ async def edit_sheet(**data):
     heading = data.get("data")
     key = encode_obj({**data, "method": "edit_sheet"})
     callback = lambda: service.edit_sheet(link, sheet, heading)
-    return await check_database(key, callback)
+    return await check_database(key, callback, link, sheet, method="edit_sheet")
 
 
 async def read_sheetnames(**data):
     link = data.get("link")
     reset = data.pop("reset", False)
     key = encode_obj({**data, "method": "read_sheetnames"})
-    callback = lambda: service.read_sheetnames(link)
+    callback = lambda: service.read_sheetnames(link, refresh=reset)
     if reset:
         return await callback()
-    return await check_database(key, callback)
+    return await check_database(
+        key, callback, link, method="read_sheetnames", max_age=data.get("max_age")
+    )
 
 
 async def update_existing(**data):
@@ -86,8 +475,11 @@ async def update_existing(**data):
     key = data.get("key")
     value = data.get("value")
     update_data = data.get("data")
+    updates = data.get("updates")
     # key = encode_obj({**data, "method": "update_existing"})
-    callback = lambda: service.update_row(link, sheet, key, value, update_data)
+    callback = lambda: service.update_row(
+        link, sheet, key, value, update_data, updates=updates
+    )
     return await callback()
     # return await check_database(key, callback)
 
@@ -95,10 +487,10 @@ async def update_existing(**data):
 async def read_last(**data):
     link = data.get("link")
     sheet = data.get("sheet")
-    key = encode_obj({**data, "method": "read_last"})
-    callback = lambda: service.read_last_row(link, sheet)
-    return await callback()
-    return await check_database(key, callback)
+    columns = data.get("columns")
+    # not cached, it is read right after appends whose invalidation runs
+    # in the background once their response is sent
+    return await service.read_last_row(link, sheet, columns=columns)
 
 
 async def add_new(**data):
@@ -134,11 +526,22 @@ async def read_new_row(**data):
     sheet = data.get("sheet")
     page_size = data.get("page_size") or 20
     page = data.get("page") or 1
+    columns = data.get("columns")
+    cursor = data.get("cursor")
     key = encode_obj({**data, "method": "read_new_row"})
     callback = lambda: service.read_new_row(
-        link, sheet, page_size=page_size, page=page, key=primary_key, value=value
+        link,
+        sheet,
+        page_size=page_size,
+        page=page,
+        key=primary_key,
+        value=value,
+        columns=columns,
+        cursor=cursor,
+    )
+    return await check_database(
+        key, callback, link, sheet, method="read_new_row", max_age=data.get("max_age")
     )
-    return await check_database(key, callback)
 
 
 async def read_referenced_cell(**data):
@@ -151,7 +554,16 @@ async def read_referenced_cell(**data):
     callback = lambda: service.read_referenced_cell(
         link, sheet, key=primary_key, options=options, value=value
     )
-    return await check_database(key, callback)
+    # references may point into other worksheets, writes to any of them
+    # drop the response
+    return await check_database(
+        key,
+        callback,
+        link,
+        app_models.ANY_SHEET,
+        method="read_referenced_cell",
+        max_age=data.get("max_age"),
+    )
 
 
 async def read_new_row(**data):
@@ -161,15 +573,25 @@ async def read_new_row(**data):
     sheet = data.get("sheet")
     page_size = data.get("page_size") or 20
     page = data.get("page") or 1
+    columns = data.get("columns")
+    cursor = data.get("cursor")
     key = encode_obj({**data, "method": "read_new_row"})
     callback = lambda: service.read_new_row(
-        link, sheet, page_size=page_size, page=page, key=primary_key, value=value
+        link,
+        sheet,
+        page_size=page_size,
+        page=page,
+        key=primary_key,
+        value=value,
+        columns=columns,
+        cursor=cursor,
     )
 
-    return await check_database(key, callback)
+    return await check_database(
+        key, callback, link, sheet, method="read_new_row", max_age=data.get("max_age")
+    )
 
 
 async def clear_database(**data):
-    if service_api:
-        await service_api.purge_db()
+    await request_cache.purge_db()
     return service.Result(data={"cleaned_db": True})
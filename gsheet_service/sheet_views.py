@@ -1,13 +1,21 @@
+import asyncio
+import json
 import os
 from starlette.background import BackgroundTask
 
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response, StreamingResponse
 from starlette.routing import Route
 
 from gsheet_service import (
+    app_models,
+    async_models,
+    models,
     service,
+    settings,
     sheet_service,
+    types,
+    warmup,
 )
 
 BASE_DIR = os.path.dirname(os.path.abspath(__name__))
@@ -15,10 +23,29 @@ BASE_DIR = os.path.dirname(os.path.abspath(__name__))
 service_api = sheet_service.service_api
 
 
-async def bg_task():
-    print("Clearing db cache")
-    await sheet_service.clear_database()
-    print("cleared db cache")
+def invalidate_task(data, whole_file=False):
+    # drop only the cached responses of the sheet that was written to
+    sheet = None if whole_file else data.get("sheet")
+    return BackgroundTask(sheet_service.invalidate, data.get("link"), sheet)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # weak comparison, a `W/` prefix does not change the value
+    tags = [x.strip() for x in header.split(",")]
+    return "*" in tags or etag in [x[2:] if x.startswith("W/") else x for x in tags]
+
+
+def read_response(request: Request, result: service.Result):
+    """Body of a successful read, or an empty 304 when the client already
+    holds the same data."""
+    etag = result.etag or app_models.content_etag(result.data)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"status": True, "data": result.data}, headers=headers)
 
 
 async def fetch_groups(request: Request):
@@ -26,15 +53,61 @@ async def fetch_groups(request: Request):
     result = await sheet_service.fetch_groups(**data)
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
-    return JSONResponse({"status": True, "data": result.data})
+    return read_response(request, result)
+
+
+def wants_stream(request: Request, data) -> bool:
+    if data.get("value") or data.get("values"):
+        return False
+    accept = request.headers.get("accept", "")
+    return bool(data.get("stream")) or "application/x-ndjson" in accept
+
+
+def ndjson_response(records, headers=None):
+    async def lines():
+        async for record in records:
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(
+        lines(), media_type="application/x-ndjson", headers=headers
+    )
+
+
+async def stream_page(data):
+    result = await sheet_service.stream_page(**data)
+    if result.error:
+        return JSONResponse({"status": False, "msg": result.error}, status_code=400)
+    page = result.data
+    # the page details travel as headers, the body only holds records
+    headers = {
+        "x-" + x.replace("_", "-"): str(page[x] or "")
+        for x in page
+        if x != "questions"
+    }
+    return ndjson_response(page["questions"], headers=headers)
 
 
 async def read_row(request: Request):
     data = await request.json()
+    if wants_stream(request, data):
+        result = await sheet_service.stream_rows(**data)
+        if result.error:
+            return JSONResponse(
+                {"status": False, "msg": result.error}, status_code=400
+            )
+        return ndjson_response(result.data)
     result: service.Result = await sheet_service.read_row(**data)
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
-    return JSONResponse({"status": True, "data": result.data})
+    return read_response(request, result)
+
+
+async def batch_read(request: Request):
+    data = await request.json()
+    result: service.Result = await sheet_service.batch_read(**data)
+    if result.error:
+        return JSONResponse({"status": False, "msg": result.error}, status_code=400)
+    return read_response(request, result)
 
 
 async def read_sheetnames(request: Request):
@@ -42,7 +115,7 @@ async def read_sheetnames(request: Request):
     result: service.Result = await sheet_service.read_sheetnames(**data)
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
-    return JSONResponse({"status": True, "data": result.data})
+    return read_response(request, result)
 
 
 async def create_new_sheet(request: Request):
@@ -50,7 +123,7 @@ async def create_new_sheet(request: Request):
     result: service.Result = await sheet_service.new_sheet(**data)
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
-    task = BackgroundTask(bg_task)
+    task = invalidate_task(data, whole_file=True)
     return JSONResponse({"status": True, "data": result.data}, background=task)
 
 
@@ -59,7 +132,7 @@ async def edit_existing_sheet(request: Request):
     result: service.Result = await sheet_service.edit_sheet(**data)
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
-    task = BackgroundTask(bg_task)
+    task = invalidate_task(data, whole_file=True)
     return JSONResponse({"status": True, "data": result.data}, background=task)
 
 
@@ -73,14 +146,7 @@ async def update_existing(request: Request):
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
 
-    async def remove_row():
-        print("Clearing row cache")
-        await sheet_service.delete_key(
-            link=data["link"], sheet=data["sheet"], key=data["key"], value=data["value"]
-        )
-        print("cleared row cache")
-
-    task = BackgroundTask(remove_row)
+    task = invalidate_task(data)
     return JSONResponse({"status": True, "data": result.data}, background=task)
 
 
@@ -89,7 +155,7 @@ async def read_last(request: Request):
     result: service.Result = await sheet_service.read_last(**data)
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
-    return JSONResponse({"status": True, "data": result.data})
+    return read_response(request, result)
 
 
 async def add_new(request: Request):
@@ -98,7 +164,7 @@ async def add_new(request: Request):
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
 
-    task = BackgroundTask(bg_task)
+    task = invalidate_task(data)
     return JSONResponse({"status": True, "data": result.data}, background=task)
 
 
@@ -108,7 +174,7 @@ async def clear_all_rows(request: Request):
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
 
-    task = BackgroundTask(bg_task)
+    task = invalidate_task(data)
     return JSONResponse({"status": True, "data": result.data}, background=task)
 
 
@@ -118,16 +184,18 @@ async def add_multiple_rows(request: Request):
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
 
-    task = BackgroundTask(bg_task)
+    task = invalidate_task(data)
     return JSONResponse({"status": True, "data": result.data}, background=task)
 
 
 async def read_new_row(request: Request):
     data = await request.json()
+    if wants_stream(request, data):
+        return await stream_page(data)
     result: service.Result = await sheet_service.read_new_row(**data)
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
-    return JSONResponse({"status": True, "data": result.data})
+    return read_response(request, result)
 
 
 async def read_referenced_cell(request: Request):
@@ -135,15 +203,17 @@ async def read_referenced_cell(request: Request):
     result: service.Result = await sheet_service.read_referenced_cell(**data)
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
-    return JSONResponse({"status": True, "data": result.data})
+    return read_response(request, result)
 
 
 async def read_new_row(request: Request):
     data = await request.json()
+    if wants_stream(request, data):
+        return await stream_page(data)
     result: service.Result = await sheet_service.read_new_row(**data)
     if result.error:
         return JSONResponse({"status": False, "msg": result.error}, status_code=400)
-    return JSONResponse({"status": True, "data": result.data})
+    return read_response(request, result)
 
 
 async def clear_db(request: Request):
@@ -161,11 +231,41 @@ async def delete_key(request: Request):
     return JSONResponse({"status": True, "data": result.data})
 
 
+async def metrics(request: Request):
+    data = {
+        "client_pool": models.client_pool.stats,
+        "metadata_cache": models.metadata_cache.stats,
+        "snapshot_cache": models.snapshot_cache.stats,
+        "header_cache": models.header_cache.stats,
+        "executor": types.sheet_executor.stats,
+        "request_cache": sheet_service.request_cache.stats,
+        "single_flight": sheet_service.single_flight.stats,
+        "revisions": sheet_service.revisions.stats,
+        "providers": types.provider_registry.stats,
+    }
+    return JSONResponse({"status": True, "data": data})
+
+
+async def reload_providers(request: Request):
+    data = await request.json() if await request.body() else {}
+    count = types.provider_registry.reload(data.get("link"), data.get("sheet"))
+    return JSONResponse({"status": True, "data": {"reloaded": count}})
+
+
+async def health(request: Request):
+    # load balancers should hold traffic until the hot sheets are loaded
+    ready = warmup.warmer.ready
+    data = {"ready": ready, "warmup": warmup.warmer.stats}
+    status_code = 200 if ready else 503
+    return JSONResponse({"status": ready, "data": data}, status_code=status_code)
+
+
 routes = [
     Route("/read-single", read_row, methods=["POST"]),
     Route("/read-new-single", read_new_row, methods=["POST"]),
     Route("/read-referenced-cells", read_referenced_cell, methods=["POST"]),
     Route("/read-sheetnames", read_sheetnames, methods=["POST"]),
+    Route("/batch-read", batch_read, methods=["POST"]),
     Route("/update", update_existing, methods=["POST"]),
     Route("/add", add_new, methods=["POST"]),
     Route("/add-sheet", create_new_sheet, methods=["POST"]),
@@ -176,17 +276,32 @@ routes = [
     Route("/delete-record", delete_key, methods=["POST"]),
     Route("/clear-all-rows", clear_all_rows, methods=["POST"]),
     Route("/add-multiple-rows", add_multiple_rows, methods=["POST"]),
+    Route("/metrics", metrics, methods=["GET"]),
+    Route("/health", health, methods=["GET"]),
+    Route("/reload-providers", reload_providers, methods=["POST"]),
 ]
 
 
+background_tasks = []
+
+
 async def on_startup_task():
     if service_api:
         await service_api.db_action("connect")
+        if settings.CACHE_REAP_INTERVAL:
+            reaper = asyncio.ensure_future(sheet_service.reap_expired_records())
+            background_tasks.append(reaper)
+    warming = asyncio.ensure_future(warmup.warmer.keep_warm(settings.WARMUP_INTERVAL))
+    background_tasks.append(warming)
 
 
 async def on_shutdown_task():
+    for task in background_tasks + list(sheet_service.refresh_tasks):
+        task.cancel()
     if service_api:
         await service_api.db_action("disconnect")
+    await async_models.close_http_client()
+    types.sheet_executor.shutdown()
 
 
 on_startup = [on_startup_task]
@@ -1,6 +1,8 @@
 import typing
 import json
-from gsheet_service import settings, models
+import time
+from gsheet_service import settings, models, executor, async_models, app_models
+from gsheet_service.local_cache import TTLCache
 
 
 class Result:
@@ -9,10 +11,12 @@ class Result:
         error: str = None,
         data: dict = None,
         task: typing.List[typing.Any] = None,
+        etag: str = None,
     ):
         self.error = error
         self.data = data
         self.task = task
+        self.etag = etag
 
 
 config = dict(
@@ -28,14 +32,111 @@ if not settings.DEBUG:
 else:
     config.update(private_key=json.loads(f'"{config["private_key"]}"'))
 
+models.client_pool.max_size = settings.CLIENT_POOL_SIZE
+models.client_pool.refresh_margin = settings.TOKEN_REFRESH_MARGIN
+models.metadata_cache.max_size = settings.METADATA_CACHE_SIZE
+models.metadata_cache.ttl = settings.METADATA_CACHE_TTL
+models.snapshot_cache.max_size = settings.SNAPSHOT_CACHE_SIZE
+models.snapshot_cache.ttl = settings.SNAPSHOT_CACHE_TTL
+# heading rows change about as often as the worksheet list
+models.header_cache.max_size = settings.METADATA_CACHE_SIZE
+models.header_cache.ttl = settings.METADATA_CACHE_TTL
+
+sheet_executor = executor.SheetExecutor(
+    max_workers=settings.SHEET_EXECUTOR_WORKERS,
+    max_queue=settings.SHEET_EXECUTOR_QUEUE,
+    timeout=settings.SHEET_EXECUTOR_TIMEOUT,
+)
+
+
+async_models.http_options.update(
+    http2=settings.SHEET_HTTP2,
+    max_connections=settings.SHEET_HTTP_MAX_CONNECTIONS,
+    max_keepalive=settings.SHEET_HTTP_MAX_KEEPALIVE,
+)
+
+
+async def get_sheet_interface(**kwargs) -> models.GoogleSheetInterface:
+    if settings.SHEET_CLIENT == "async":
+        return async_models.AsyncGoogleSheetInterface(
+            executor=sheet_executor, **{**config, **kwargs}
+        )
+    return await sheet_executor.instance(
+        models.GoogleSheetInterface, **{**config, **kwargs}
+    )
+
+
+class ProviderRegistry:
+    """Rows of the provider config sheets, read once and indexed by the
+    lowercased value of their key column. A sheet is read again once it is
+    older than `ttl` seconds or after `reload`, at most `max_size` sheets
+    are kept."""
+
+    def __init__(self, ttl=3600, max_size=64, timer=time.monotonic):
+        self.ttl = ttl
+        # (link, sheet, credentials) -> {"records":, "indexes":}
+        self.sheets = TTLCache(max_size=max_size, ttl=ttl, timer=timer)
+        self.loading = executor.SingleFlight()
+        self.stats = {"hits": 0, "misses": 0, "loads": 0}
+
+    @staticmethod
+    def sheet_key(link, sheet, **credentials):
+        fingerprint = models.ClientPool.fingerprint(**credentials)
+        return link, (sheet or "").strip().lower(), fingerprint
+
+    async def load(self, link, sheet, **credentials):
+        instance = await get_sheet_interface(**credentials)
+        await instance.load_file(link, sheet)
+        records = await instance.get_all_records()
+        self.stats["loads"] += 1
+        entry = {"records": records, "indexes": {}}
+        self.sheets.set(self.sheet_key(link, sheet, **credentials), entry)
+        return entry
+
+    async def entry(self, link, sheet, **credentials):
+        key = self.sheet_key(link, sheet, **credentials)
+        entry = self.sheets.get(key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            return entry
+        self.stats["misses"] += 1
+        return await self.loading.run(
+            key, lambda: self.load(link, sheet, **credentials)
+        )
+
+    async def lookup(self, link, sheet, provider, key="id", **credentials):
+        entry = await self.entry(link, sheet, **credentials)
+        index = entry["indexes"].get(key)
+        if index is None:
+            index = {}
+            for record in entry["records"]:
+                value = models.lookup_value(record.get(key), case_insensitive=True)
+                # the first row wins, like a scan of the sheet would
+                index.setdefault(value, record)
+            entry["indexes"][key] = index
+        found = index.get(models.lookup_value(provider, case_insensitive=True))
+        return dict(found) if found else None
+
+    def reload(self, link=None, sheet=None) -> int:
+        """Forgets the loaded sheets of the spreadsheet at `link`, or every
+        sheet when no link is given, so the next lookup reads them again.
+        `link` may be any link to the spreadsheet or its id."""
+        file_id, sheet = app_models.cache_tags(link, sheet)
+
+        def loaded(key, _):
+            if sheet and key[1] != sheet:
+                return False
+            return not link or app_models.cache_tags(key[0])[0] == file_id
+
+        return self.sheets.delete_where(loaded)
+
+
+provider_registry = ProviderRegistry(
+    ttl=settings.PROVIDER_CACHE_TTL, max_size=settings.PROVIDER_CACHE_SIZE
+)
+
 
 async def get_provider_sheet(link=None, sheet=None, provider=None, key="id", **kwargs):
-    updated_config = {**config, **kwargs}
-    instance = models.GoogleSheetInterface(**updated_config)
-    instance.load_file(link, sheet)
-    result = instance.get_all_records()
     if key:
-        found = [x for x in result if x[key].lower() == provider.lower()]
-        if found:
-            return found[0]
+        return await provider_registry.lookup(link, sheet, provider, key, **kwargs)
     return None
@@ -10,12 +10,14 @@ from starlette.staticfiles import StaticFiles
 from starlette.templating import Jinja2Templates
 
 from gsheet_service import (
+    executor,
     media_views,
     oauth_views,
     scheduler_views,
     settings,
     sheet_views,
     spell_check_views,
+    watch_views,
 )
 
 BASE_DIR = os.path.dirname(os.path.abspath(__name__))
@@ -146,6 +148,7 @@ routes = [
     Mount("/media", routes=media_views.routes),
     Mount("/scheduler", routes=scheduler_views.routes),
     Mount("/sc", routes=spell_check_views.routes),
+    Mount("/watch", routes=watch_views.routes),
     Mount("", routes=sheet_views.routes),
     # Route("/secrets", secrets),
 ]
@@ -154,9 +157,17 @@ routes = [
 on_startup = [] + sheet_views.on_startup
 on_shutdown = [] + sheet_views.on_shutdown
 
+
+async def executor_busy(request: Request, exc: executor.ExecutorBusy):
+    return JSONResponse({"status": False, "msg": str(exc)}, status_code=503)
+
+
+exception_handlers = {executor.ExecutorBusy: executor_busy}
+
 app = Starlette(
     middleware=middlewares,
     routes=routes,
+    exception_handlers=exception_handlers,
     on_startup=on_startup,
     on_shutdown=on_shutdown,
 )
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+
+from gsheet_service import settings
+from gsheet_service.types import get_sheet_interface, provider_registry
+
+
+def warmup_targets():
+    """(link, sheet) pairs to load ahead of the first request, a sheet of
+    None only opens the spreadsheet."""
+    result = []
+    for value in settings.WARMUP_SHEETS:
+        link, _, sheet = value.partition("|")
+        if link.strip() and (link.strip(), sheet.strip() or None) not in result:
+            result.append((link.strip(), sheet.strip() or None))
+    return result
+
+
+def provider_targets():
+    # every provider lookup reads one of these
+    targets = [
+        (settings.MEDIA_SPREADSHEET, settings.MEDIA_SHEET_NAME),
+        (settings.SCHEDULER_SPREADSHEET, settings.SCHEDULER_SHEET_NAME),
+        (settings.OAUTH_SPREADSHEET, settings.OAUTH_SHEET_NAME),
+    ]
+    return [x for i, x in enumerate(targets) if x[0] and x not in targets[:i]]
+
+
+class Warmup:
+    """Loads the metadata and the values of hot sheets concurrently so the
+    first requests after a deploy hit warm caches. `ready` turns on after
+    the first pass, whether every sheet could be loaded or not."""
+
+    def __init__(self, targets, providers=None):
+        self.targets = targets
+        self.providers = providers or []
+        self.ready = False
+        self.runs = 0
+        self.last_run = None
+        self.duration = None
+        self.failures = {}
+
+    @property
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "targets": len(self.targets) + len(self.providers),
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "duration": self.duration,
+            "failures": self.failures,
+        }
+
+    async def warm(self, link, sheet=None):
+        instance = await get_sheet_interface()
+        if not sheet:
+            await instance.open_file(link, refresh=True)
+            return
+        await instance.load_file(link, sheet)
+        if not instance.sheet:
+            raise KeyError(f"Missing sheet {sheet}")
+        await instance.snapshot(refresh=True)
+
+    async def warm_provider(self, link, sheet):
+        # the registry only reads the sheet again once its own ttl ran out
+        await provider_registry.entry(link, sheet)
+
+    async def run(self):
+        started = time.monotonic()
+        results = await asyncio.gather(
+            *[self.warm(link, sheet) for link, sheet in self.targets],
+            *[self.warm_provider(link, sheet) for link, sheet in self.providers],
+            return_exceptions=True,
+        )
+        failures = {}
+        for (link, sheet), result in zip(self.targets + self.providers, results):
+            if isinstance(result, Exception):
+                logging.error(f"Could not warm up {link} {sheet}: {result!r}")
+                failures[f"{link}|{sheet or ''}"] = repr(result)
+        self.failures = failures
+        self.duration = time.monotonic() - started
+        self.last_run = time.time()
+        self.runs += 1
+        self.ready = True
+
+    async def keep_warm(self, interval=None):
+        while True:
+            await self.run()
+            if not interval:
+                return
+            await asyncio.sleep(interval)
+
+
+warmer = Warmup(warmup_targets(), provider_targets())
@@ -0,0 +1,179 @@
+import logging
+import time
+import uuid
+
+from gsheet_service import (
+    app_models,
+    async_models,
+    models,
+    scheduler_service,
+    settings,
+    sheet_service,
+)
+from gsheet_service.types import Result, get_sheet_interface, provider_registry
+
+# spreadsheet id -> channel watching it, registered by this process
+channels = {}
+
+
+def channel_token(file_id: str) -> str:
+    # notifications echo the token, it tells which spreadsheet changed and
+    # that the channel was registered by us
+    signature = app_models.request_key({"watch": file_id}, settings.SECRET)
+    return f"{file_id}:{signature}"
+
+
+def token_file_id(token: str):
+    file_id, _, _ = (token or "").rpartition(":")
+    if file_id and channel_token(file_id) == token:
+        return file_id
+    return None
+
+
+class DriveNotifier:
+    """Registers `files.watch` channels, Google posts the changes to the
+    channel address."""
+
+    async def watch(self, file_id: str, channel):
+        instance = await get_sheet_interface()
+        return await instance.watch_file(file_id, channel)
+
+    async def stop(self, channel):
+        instance = await get_sheet_interface()
+        await instance.stop_channel(channel)
+
+
+class LocalNotifier:
+    """Stand-in for Drive keeping the channels in memory. `notify` delivers
+    a change the way Google would, so invalidation can be exercised without
+    the network."""
+
+    def __init__(self, client=None):
+        self.client = client
+        self.channels = {}
+
+    async def watch(self, file_id: str, channel):
+        resource_id = f"local-{file_id}"
+        self.channels[channel["id"]] = {**channel, "resourceId": resource_id}
+        return {
+            "kind": "api#channel",
+            "id": channel["id"],
+            "resourceId": resource_id,
+            "expiration": str(channel["expiration"]),
+        }
+
+    async def stop(self, channel):
+        self.channels.pop(channel["id"], None)
+
+    async def notify(self, file_id: str, state="update") -> float:
+        """Posts a change of `file_id` to its channels, returns the seconds
+        taken until the receiver answered."""
+        client = self.client or async_models.http_client()
+        started = time.monotonic()
+        for number, channel in enumerate(list(self.channels.values()), 1):
+            if channel["resourceId"] != f"local-{file_id}":
+                continue
+            headers = {
+                "X-Goog-Channel-ID": channel["id"],
+                "X-Goog-Channel-Token": channel["token"],
+                "X-Goog-Channel-Expiration": str(channel["expiration"]),
+                "X-Goog-Resource-ID": channel["resourceId"],
+                "X-Goog-Resource-State": state,
+                "X-Goog-Message-Number": str(number),
+            }
+            response = await client.post(channel["address"], headers=headers)
+            response.raise_for_status()
+        return time.monotonic() - started
+
+
+notifier = LocalNotifier() if settings.WATCH_NOTIFIER == "local" else DriveNotifier()
+
+
+async def watch_spreadsheet(link, ttl=None, schedule=True) -> Result:
+    if not link:
+        return Result(error="Missing `link` value")
+    file_id, _ = app_models.cache_tags(link)
+    ttl = min(ttl or settings.WATCH_CHANNEL_TTL, settings.WATCH_CHANNEL_TTL)
+    channel = {
+        "id": str(uuid.uuid4()),
+        "type": "web_hook",
+        "address": f"{settings.HOST_PROVIDER}/watch/notify",
+        "token": channel_token(file_id),
+        "expiration": int((time.time() + ttl) * 1000),
+    }
+    try:
+        response = await notifier.watch(file_id, channel)
+    except Exception as e:
+        logging.exception(e)
+        return Result(error="Could not watch the spreadsheet")
+    previous = channels.get(file_id) or {}
+    if previous:
+        await stop_channel(previous)
+    record = {
+        "link": link,
+        "file_id": file_id,
+        "id": response["id"],
+        "resource_id": response["resourceId"],
+        "expiration": int(response.get("expiration") or channel["expiration"]),
+        "job_id": previous.get("job_id"),
+    }
+    if schedule and not record["job_id"] and settings.WATCH_SCHEDULER:
+        record["job_id"] = await schedule_renewal(link, ttl)
+    channels[file_id] = record
+    return Result(data=record)
+
+
+async def schedule_renewal(link, ttl):
+    # the scheduler calls back in before the channel runs out
+    result = await scheduler_service.create_job(
+        settings.WATCH_SCHEDULER,
+        endpoint=f"{settings.HOST_PROVIDER}/watch/renew",
+        method="POST",
+        job={"link": link},
+        trigger="interval",
+        seconds=max(ttl - settings.WATCH_RENEW_MARGIN, 60),
+    )
+    if result.error:
+        logging.error(result.error)
+        return None
+    return result.data[0]
+
+
+async def renew_watch(link, ttl=None) -> Result:
+    return await watch_spreadsheet(link, ttl=ttl, schedule=False)
+
+
+async def stop_channel(record):
+    try:
+        await notifier.stop({"id": record["id"], "resourceId": record["resource_id"]})
+    except Exception as e:
+        # an unknown channel simply runs out on its own
+        logging.exception(e)
+
+
+async def unwatch_spreadsheet(link) -> Result:
+    if not link:
+        return Result(error="Missing `link` value")
+    file_id, _ = app_models.cache_tags(link)
+    record = channels.pop(file_id, None)
+    if not record:
+        return Result(error="Spreadsheet is not watched")
+    await stop_channel(record)
+    if record["job_id"]:
+        await scheduler_service.delete_job(
+            settings.WATCH_SCHEDULER, job_id=record["job_id"]
+        )
+    return Result(data=record)
+
+
+async def receive_notification(headers) -> Result:
+    file_id = token_file_id(headers.get("x-goog-channel-token"))
+    if not file_id:
+        return Result(error="Invalid channel token")
+    # "sync" only confirms that a new channel works
+    if headers.get("x-goog-resource-state") == "sync":
+        return Result(data={"file_id": file_id, "invalidated": 0})
+    models.forget_spreadsheet(file_id)
+    provider_registry.reload(file_id)
+    count = await sheet_service.invalidate(file_id)
+    return Result(data={"file_id": file_id, "invalidated": count})
@@ -0,0 +1,49 @@
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from gsheet_service import watch_service
+
+
+async def register(request: Request):
+    data = await request.json()
+    result = await watch_service.watch_spreadsheet(data.get("link"), data.get("ttl"))
+    if result.error:
+        return JSONResponse({"status": False, "msg": result.error}, status_code=400)
+    return JSONResponse({"status": True, "data": result.data})
+
+
+async def renew(request: Request):
+    data = await request.json()
+    result = await watch_service.renew_watch(data.get("link"), data.get("ttl"))
+    if result.error:
+        return JSONResponse({"status": False, "msg": result.error}, status_code=400)
+    return JSONResponse({"status": True, "data": result.data})
+
+
+async def stop(request: Request):
+    data = await request.json()
+    result = await watch_service.unwatch_spreadsheet(data.get("link"))
+    if result.error:
+        return JSONResponse({"status": False, "msg": result.error}, status_code=400)
+    return JSONResponse({"status": True, "data": result.data})
+
+
+async def notify(request: Request):
+    result = await watch_service.receive_notification(request.headers)
+    if result.error:
+        return JSONResponse({"status": False, "msg": result.error}, status_code=400)
+    return JSONResponse({"status": True, "data": result.data})
+
+
+async def list_channels(request: Request):
+    return JSONResponse({"status": True, "data": list(watch_service.channels.values())})
+
+
+routes = [
+    Route("/register", register, methods=["POST"]),
+    Route("/renew", renew, methods=["POST"]),
+    Route("/stop", stop, methods=["POST"]),
+    Route("/notify", notify, methods=["POST"]),
+    Route("/channels", list_channels, methods=["GET"]),
+]
@@ -0,0 +1,31 @@
+"""Cache expiry columns
+
+Revision ID: a3f9d5e81c44
+Revises: e6b1c47d2f90
+Create Date: 2026-10-18 11:40:05.118734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f9d5e81c44'
+down_revision = 'e6b1c47d2f90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # sheet_link and the unique index on request_id were added by e6b1c47d2f90
+    op.add_column('sheet_request_cache', sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    op.add_column('sheet_request_cache', sa.Column('expires_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_sheet_request_cache_sheet_link'), 'sheet_request_cache', ['sheet_link'], unique=False)
+    op.create_index(op.f('ix_sheet_request_cache_expires_at'), 'sheet_request_cache', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_sheet_request_cache_expires_at'), table_name='sheet_request_cache')
+    op.drop_index(op.f('ix_sheet_request_cache_sheet_link'), table_name='sheet_request_cache')
+    op.drop_column('sheet_request_cache', 'expires_at')
+    op.drop_column('sheet_request_cache', 'created_at')
@@ -0,0 +1,46 @@
+"""Cache sheet tags
+
+Revision ID: c71e2a9b5d03
+Revises: a3f9d5e81c44
+Create Date: 2026-10-18 13:05:47.660291
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from gsheet_service.app_models import ANY_SHEET, cache_tags
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71e2a9b5d03'
+down_revision = 'a3f9d5e81c44'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('sheet_request_cache', sa.Column('sheet_name', sa.Text(), nullable=True))
+    op.drop_index('ix_sheet_request_cache_sheet_link', table_name='sheet_request_cache')
+    op.create_index('ix_sheet_request_cache_tags', 'sheet_request_cache', ['sheet_link', 'sheet_name'], unique=False)
+    # rows carried over by e6b1c47d2f90 or cached since are tagged with the
+    # raw link, tag them with the spreadsheet id and as belonging to any of
+    # its worksheets
+    bind = op.get_bind()
+    table = sa.table('sheet_request_cache',
+    sa.column('id', sa.Integer()),
+    sa.column('sheet_link', sa.Text()),
+    sa.column('sheet_name', sa.Text()),
+    )
+    rows = bind.execute(sa.select([table.c.id, table.c.sheet_link]))
+    for row_id, link in rows.fetchall():
+        sheet_link, _ = cache_tags(link)
+        bind.execute(
+            table.update().where(table.c.id == row_id)
+            .values(sheet_link=sheet_link, sheet_name=ANY_SHEET)
+        )
+
+
+def downgrade():
+    op.drop_index('ix_sheet_request_cache_tags', table_name='sheet_request_cache')
+    op.create_index('ix_sheet_request_cache_sheet_link', 'sheet_request_cache', ['sheet_link'], unique=False)
+    op.drop_column('sheet_request_cache', 'sheet_name')
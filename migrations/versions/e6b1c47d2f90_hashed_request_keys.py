@@ -0,0 +1,69 @@
+"""Hashed request keys
+
+Revision ID: e6b1c47d2f90
+Revises: 39ead1cac3ce
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from alembic import op
+import jwt
+import sqlalchemy as sa
+
+from gsheet_service import settings
+from gsheet_service.app_models import request_key
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b1c47d2f90'
+down_revision = '39ead1cac3ce'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the link a row was read from, so writes to it can drop the row once
+    # responses are invalidated per spreadsheet
+    op.add_column('sheet_request_cache', sa.Column('sheet_link', sa.Text(), nullable=True))
+    # existing rows are keyed by the HS256 token of the request payload,
+    # decode it and store the blake2b key of the same payload instead.
+    bind = op.get_bind()
+    table = sa.table('sheet_request_cache',
+    sa.column('id', sa.Integer()),
+    sa.column('request_id', sa.Text()),
+    sa.column('sheet_link', sa.Text()),
+    )
+    rows = bind.execute(
+        sa.select([table.c.id, table.c.request_id]).order_by(table.c.id.desc())
+    )
+    seen = set()
+    for row_id, token in rows.fetchall():
+        try:
+            payload = jwt.decode(token, settings.SECRET, algorithms=['HS256'])
+            key = request_key(payload, settings.SECRET)
+        except jwt.InvalidTokenError:
+            key = None
+        # keep only the most recent row of duplicated requests
+        if key is None or key in seen:
+            bind.execute(table.delete().where(table.c.id == row_id))
+            continue
+        seen.add(key)
+        bind.execute(
+            table.update().where(table.c.id == row_id)
+            .values(request_id=key, sheet_link=payload.get('link'))
+        )
+    op.alter_column('sheet_request_cache', 'request_id',
+               existing_type=sa.Text(),
+               type_=sa.String(length=64),
+               existing_nullable=False)
+    op.create_index(op.f('ix_sheet_request_cache_request_id'), 'sheet_request_cache', ['request_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_sheet_request_cache_request_id'), table_name='sheet_request_cache')
+    op.alter_column('sheet_request_cache', 'request_id',
+               existing_type=sa.String(length=64),
+               type_=sa.Text(),
+               existing_nullable=False)
+    # hashed keys can not be turned back into tokens, the cache starts empty
+    op.execute('DELETE FROM sheet_request_cache')
+    op.drop_column('sheet_request_cache', 'sheet_link')
@@ -0,0 +1,24 @@
+"""Cache revision
+
+Revision ID: f28d6a0c9e17
+Revises: c71e2a9b5d03
+Create Date: 2026-10-18 15:21:09.183406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f28d6a0c9e17'
+down_revision = 'c71e2a9b5d03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('sheet_request_cache', sa.Column('revision', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('sheet_request_cache', 'revision')
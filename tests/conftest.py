@@ -0,0 +1,82 @@
+import os
+
+import pytest
+import pytest_asyncio
+
+# settings the app refuses to start without, none of them is contacted
+for name in (
+    "APP_SECRET",
+    "GOOGLE_PROJECT_ID",
+    "GOOGLE_PRIVATE_KEY",
+    "GOOGLE_PRIVATE_KEY_ID",
+    "GOOGLE_CLIENT_EMAIL",
+    "GOOGLE_CLIENT_ID",
+    "OAUTH_SPREADSHEET",
+    "HOST_PROVIDER",
+    "OAUTH_SHEET_NAME",
+    "MEDIA_SHEET_NAME",
+    "MEDIA_SPREADSHEET",
+    "SCHEDULER_SPREADSHEET",
+    "SCHEDULER_SHEET_NAME",
+):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+from gsheet_service import async_models, models, sheet_service  # noqa: E402
+from tests.fake_sheets import FakeClient, FakeHttpClient, sample_sheets  # noqa: E402
+
+
+class Clock:
+    """Timer of the TTL caches under test, moved by setting `now`."""
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def sheets():
+    """Fake spreadsheet every `GoogleSheetInterface` opens."""
+    backend = sample_sheets()
+    factory = models.client_pool.factory
+    models.client_pool.clear()
+    models.client_pool.factory = lambda **kwargs: FakeClient(backend)
+    clear_caches()
+    yield backend
+    models.client_pool.clear()
+    models.client_pool.factory = factory
+    clear_caches()
+
+
+@pytest.fixture
+def async_sheets(sheets, monkeypatch):
+    """The fake spreadsheet, also answering `AsyncGoogleSheetInterface`."""
+    monkeypatch.setattr(async_models, "_http_client", FakeHttpClient(sheets))
+    return sheets
+
+
+@pytest_asyncio.fixture
+async def request_cache():
+    await sheet_service.request_cache.purge_db()
+    sheet_service.revisions.clear()
+    sheet_service.generations.clear()
+    sheet_service.local_generations.clear()
+    yield sheet_service.request_cache
+    await sheet_service.request_cache.purge_db()
+
+
+def clear_caches():
+    for cache in (
+        models.metadata_cache,
+        models.snapshot_cache,
+        models.header_cache,
+        models.row_count_cache,
+    ):
+        cache.clear()
@@ -0,0 +1,235 @@
+"""In-memory stand-in for the parts of the Sheets v4 and Drive v3 REST APIs
+the service talks to, used through gspread's `Client.request` or in place of
+the httpx client of `async_models`."""
+
+import datetime
+import re
+from urllib.parse import unquote
+
+from gspread.models import Spreadsheet
+
+SHEETS_URL = "https://sheets.googleapis.com/v4/spreadsheets/"
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files/"
+FILE_ID = "fake"
+LINK = f"https://docs.google.com/spreadsheets/d/{FILE_ID}/edit"
+
+
+def column_number(letters):
+    result = 0
+    for letter in letters.upper():
+        result = result * 26 + ord(letter) - 64
+    return result
+
+
+def parse_range(name):
+    """(title, (first row, first col, last row, last col)), 1 based and None
+    where the range is open ended."""
+    title, _, cells = name.rpartition("!")
+    if not title:
+        title, cells = cells, ""
+    title = title.strip("'").replace("''", "'")
+    if not cells:
+        return title, (1, 1, None, None)
+
+    def cell(value):
+        letters, digits = re.match(r"^([A-Za-z]*)([0-9]*)$", value).groups()
+        return (
+            int(digits) if digits else None,
+            column_number(letters) if letters else None,
+        )
+
+    parts = cells.replace("$", "").split(":")
+    first_row, first_col = cell(parts[0])
+    if len(parts) == 1:
+        return title, (first_row, first_col, first_row, first_col)
+    last_row, last_col = cell(parts[1])
+    return title, (first_row or 1, first_col or 1, last_row, last_col)
+
+
+def trim(rows):
+    # Google drops trailing empty cells and rows from value ranges
+    rows = [list(x) for x in rows]
+    for row in rows:
+        while row and row[-1] == "":
+            row.pop()
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+
+class Response:
+    status_code = 200
+    ok = True
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSheets:
+    def __init__(self):
+        self.sheets = {}
+        self.calls = []
+        self.version = 1
+
+    def add_sheet(self, title, grid, rows=1000, cols=26):
+        self.sheets[title] = {
+            "id": len(self.sheets) + 100,
+            "grid": [[str(x) for x in row] for row in grid],
+            "rows": rows,
+            "cols": cols,
+        }
+
+    def count(self, kind):
+        return len([x for x in self.calls if x[0] == kind])
+
+    def metadata(self):
+        sheets = [
+            {
+                "properties": {
+                    "sheetId": sheet["id"],
+                    "title": title,
+                    "index": i,
+                    "gridProperties": {
+                        "rowCount": sheet["rows"],
+                        "columnCount": sheet["cols"],
+                    },
+                }
+            }
+            for i, (title, sheet) in enumerate(self.sheets.items())
+        ]
+        return {"properties": {"title": "Fake spreadsheet"}, "sheets": sheets}
+
+    def read(self, name, major="ROWS"):
+        title, (first_row, first_col, last_row, last_col) = parse_range(name)
+        grid = self.sheets[title]["grid"]
+        rows = grid[first_row - 1 : last_row or len(grid)]
+        last_col = last_col or max([len(x) for x in rows] or [0])
+        values = trim(x[first_col - 1 : last_col] for x in rows)
+        if major == "COLUMNS":
+            width = max([len(x) for x in values] or [0])
+            values = trim(
+                [x[i] if i < len(x) else "" for x in values] for i in range(width)
+            )
+        result = {"range": name, "majorDimension": major}
+        if values:
+            result["values"] = values
+        return result
+
+    def write(self, name, values):
+        """Changes cells the way an edit made in the Sheets UI would."""
+        self.version += 1
+        title, (first_row, first_col, _, _) = parse_range(name)
+        grid = self.sheets[title]["grid"]
+        for i, row in enumerate(values):
+            while len(grid) < first_row + i:
+                grid.append([])
+            cells = grid[first_row - 1 + i]
+            for j, value in enumerate(row):
+                while len(cells) < first_col + j:
+                    cells.append("")
+                cells[first_col - 1 + j] = str(value)
+        return {
+            "updatedRange": name,
+            "updatedData": {
+                "range": name,
+                "values": [[str(x) for x in row] for row in values],
+            },
+        }
+
+    def batch_update(self, requests):
+        self.version += 1
+        replies = []
+        for request in requests:
+            if "addSheet" in request:
+                properties = request["addSheet"]["properties"]
+                grid = properties.get("gridProperties", {})
+                self.add_sheet(properties["title"], [], grid.get("rowCount", 1000))
+                added = self.metadata()["sheets"][-1]
+                replies.append({"addSheet": added})
+            elif "deleteDimension" in request:
+                found = request["deleteDimension"]["range"]
+                sheet = [x for x in self.sheets.values() if x["id"] == found["sheetId"]]
+                del sheet[0]["grid"][found["startIndex"] : found["endIndex"]]
+                replies.append({})
+        return {"replies": replies}
+
+    def request(self, method, url, params=None, json=None, **kwargs):
+        params = params or {}
+        if url.startswith(DRIVE_FILES_URL):
+            self.calls.append(("drive", params.get("fields")))
+            modified = f"2020-01-01T00:00:00.{self.version:03d}Z"
+            return Response({"modifiedTime": modified, "version": str(self.version)})
+        path = url[len(SHEETS_URL) :]
+        if "/values:batchGet" in path:
+            ranges = params["ranges"]
+            ranges = [ranges] if isinstance(ranges, str) else list(ranges)
+            self.calls.append(("batchGet", ranges))
+            major = params.get("majorDimension") or "ROWS"
+            return Response({"valueRanges": [self.read(x, major) for x in ranges]})
+        if "/values:batchUpdate" in path:
+            self.calls.append(("valuesBatchUpdate", json))
+            responses = [self.write(x["range"], x["values"]) for x in json["data"]]
+            return Response({"responses": responses})
+        if "/values/" in path:
+            name = unquote(path.split("/values/", 1)[1])
+            if method == "get":
+                self.calls.append(("get", name))
+                return Response(self.read(name, params.get("majorDimension") or "ROWS"))
+            self.calls.append(("update", name))
+            return Response(self.write(name, json["values"]))
+        if path.endswith(":batchUpdate"):
+            self.calls.append(("batchUpdate", json))
+            return Response(self.batch_update(json["requests"]))
+        if method == "get":
+            self.calls.append(("metadata", None))
+            return Response(self.metadata())
+        raise NotImplementedError((method, url))
+
+
+class FakeAuth:
+    token = "token"
+    expiry = datetime.datetime(2100, 1, 1)
+
+
+class FakeClient:
+    """Enough of `gspread.Client` for `GoogleSheetInterface`."""
+
+    def __init__(self, backend: FakeSheets):
+        self.backend = backend
+        self.auth = FakeAuth()
+
+    def login(self):
+        pass
+
+    def request(self, method, endpoint, params=None, json=None, **kwargs):
+        return self.backend.request(method, endpoint, params=params, json=json)
+
+    def open_by_url(self, url):
+        return Spreadsheet(self, {"id": FILE_ID})
+
+
+class FakeHttpClient:
+    """Enough of `httpx.AsyncClient` for `AsyncGoogleSheetInterface`."""
+
+    def __init__(self, backend: FakeSheets):
+        self.backend = backend
+
+    async def request(self, method, url, params=None, json=None, headers=None):
+        return self.backend.request(method, url, params=params, json=json)
+
+
+def sample_sheets(rows=5, cols=4) -> FakeSheets:
+    backend = FakeSheets()
+    heading = ["id"] + [f"col{i}" for i in range(1, cols)]
+    grid = [heading] + [
+        [f"r{r}"] + [f"v{r}-{c}" for c in range(1, cols)] for r in range(1, rows + 1)
+    ]
+    backend.add_sheet("Sheet1", grid)
+    backend.add_sheet("Other", [["a", "b"], ["1", "2"]])
+    return backend
@@ -0,0 +1,133 @@
+import pytest
+from gspread.exceptions import CellNotFound
+
+from gsheet_service import async_models
+from tests.fake_sheets import LINK
+
+
+async def interface(sheet="Sheet1"):
+    instance = async_models.AsyncGoogleSheetInterface(key_location="key.json")
+    await instance.load_file(LINK, sheet)
+    return instance
+
+
+@pytest.mark.asyncio
+async def test_load_file(async_sheets):
+    instance = await interface("sheet1")
+    assert instance.title == "Sheet1"
+    assert await instance.summary() == {
+        "title": "Fake spreadsheet",
+        "sheet_names": ["Sheet1", "Other"],
+    }
+    assert await instance.headers() == ["id", "col1", "col2", "col3"]
+    # the metadata is read once and shared with the next interface
+    await interface("Other")
+    assert async_sheets.count("metadata") == 1
+
+
+@pytest.mark.asyncio
+async def test_read_page(async_sheets):
+    instance = await interface()
+    result = await instance.read_page(page=2, page_size=3, columns=["id", "col2"])
+    assert result["questions"] == [
+        {"id": "r2", "col2": "v2-2"},
+        {"id": "r3", "col2": "v3-2"},
+    ]
+    assert result["total_row_count"] == 5
+    # the page is read over its own range, the sheet is not downloaded
+    assert instance.cached_snapshot() is None
+
+
+@pytest.mark.asyncio
+async def test_find_records(async_sheets):
+    instance = await interface()
+    found = await instance.find_records("id", ["R4", "r2"], case_insensitive=True)
+    assert [x["col1"] for x in found] == ["v4-1", "v2-1"]
+    found = await instance.find_records("col1", ["v3-1"], columns=["col3"])
+    assert found == [{"col3": "v3-3", "col1": "v3-1"}]
+    cell = await instance.find_cell("v3-2")
+    assert (cell.row, cell.col, cell.value) == (4, 3, "v3-2")
+    assert await instance.get_cell_identity("col2", "r3") == (4, 3)
+    with pytest.raises(CellNotFound):
+        await instance.find_cell("nowhere")
+    with pytest.raises(ValueError):
+        await instance.get_cell_identity("id", "nowhere")
+
+
+@pytest.mark.asyncio
+async def test_add_and_update_rows(async_sheets):
+    instance = await interface()
+    key, record = await instance.update_records(["r6", "v6-1", "v6-2", "v6-3"])
+    assert key == "id"
+    assert record["col1"] == "v6-1"
+    assert async_sheets.sheets["Sheet1"]["grid"][6][0] == "r6"
+    assert await instance.record_count() == 6
+
+    updated = await instance.update_existing_records(
+        "id", [("r2", {"col1": "new"}), ("r6", {"col3": "last"})]
+    )
+    assert [x["col1"] for x in updated] == ["new", "v6-1"]
+    assert async_sheets.sheets["Sheet1"]["grid"][2][1] == "new"
+    assert async_sheets.sheets["Sheet1"]["grid"][6][3] == "last"
+    assert (await interface()).cached_snapshot().find("id", ["r6"])[0]["col3"] == (
+        "last"
+    )
+
+
+@pytest.mark.asyncio
+async def test_bulk_save(async_sheets):
+    instance = await interface()
+
+    async def save(values):
+        return [x.upper() for x in values]
+
+    result = await instance.bulk_save(column_id=1, http_client_function=save)
+    assert result == {f"r{i}": f"R{i}" for i in range(1, 6)}
+
+
+@pytest.mark.asyncio
+async def test_batch_read(async_sheets):
+    instance = async_models.AsyncGoogleSheetInterface()
+    specs = [
+        {"sheet": "Sheet1", "key": "id", "value": "r1", "columns": ["col1"]},
+        {"sheet": "Other", "range": "A1:B2"},
+        {"sheet": "Missing"},
+    ]
+    assert await instance.batch_read(LINK, specs) == [
+        {"data": {"col1": "v1-1", "id": "r1"}},
+        {"data": [["a", "b"], ["1", "2"]]},
+        {"error": "Missing `sheet` in spreadsheet"},
+    ]
+    assert async_sheets.count("batchGet") == 1
+
+
+@pytest.mark.asyncio
+async def test_revision_follows_writes(async_sheets):
+    instance = async_models.AsyncGoogleSheetInterface()
+    revision = await instance.get_revision(LINK)
+    assert await instance.get_revision(LINK) == revision
+    async_sheets.write("'Other'!A2", [["changed"]])
+    assert await instance.get_revision(LINK) != revision
+
+
+@pytest.mark.asyncio
+async def test_create_and_clear_sheet(async_sheets):
+    instance = async_models.AsyncGoogleSheetInterface()
+    summary = await instance.create_new_sheet(LINK, "New", ["id", "name"])
+    assert summary["sheet_names"] == ["Sheet1", "Other", "New"]
+    assert async_sheets.sheets["New"]["grid"] == [["id", "name"]]
+    instance = await interface()
+    await instance.clear()
+    assert async_sheets.sheets["Sheet1"]["grid"] == [["id", "col1", "col2", "col3"]]
+    assert await (await interface()).get_all_records() == []
+
+
+@pytest.mark.asyncio
+async def test_column_reads_keep_blank_trailing_cells(async_sheets):
+    async_sheets.add_sheet("Notes", [["id", "notes"], ["a", "x"], ["b", ""]])
+    instance = await interface("Notes")
+    cold = await instance.read_columns(["notes"])
+    assert cold == [{"notes": "x"}, {"notes": ""}]
+    assert await instance.read_last_row(columns=["notes"]) == {"notes": ""}
+    await instance.snapshot()
+    assert await instance.read_columns(["notes"]) == cold
@@ -0,0 +1,120 @@
+import datetime
+
+import fakeredis
+import pytest
+import sqlalchemy
+
+from gsheet_service.app_models import ANY_SHEET, TieredCache
+from gsheet_service.cache_backends import (
+    MemoryBackend,
+    RedisBackend,
+    SQLiteBackend,
+    backend_name,
+    create_backend,
+)
+from gsheet_service.local_cache import TTLCache
+
+
+def test_backend_is_picked_from_the_url():
+    assert backend_name("postgresql://user@host/db") == "postgres"
+    assert backend_name("postgres+asyncpg://user@host/db") == "postgres"
+    assert backend_name("sqlite:///cache.db") == "sqlite"
+    assert backend_name("rediss://host:6379/0") == "redis"
+    assert backend_name("") == "memory"
+    assert isinstance(create_backend(url=""), MemoryBackend)
+    with pytest.raises(ValueError):
+        create_backend("postgres")
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_drops_tagged_entries():
+    backend = MemoryBackend()
+    await backend.update_record("a", {"x": 1}, "file", "one", ttl=60, revision="r1")
+    await backend.update_record("b", {"x": 2}, "file", "two", ttl=60)
+    await backend.update_record("c", {"x": 3}, "other", "one")
+    await backend.update_record("d", {"x": 4}, "file", ANY_SHEET)
+    entry = await backend.get_entry("a")
+    assert entry["data"] == {"x": 1} and entry["revision"] == "r1"
+    assert await backend.delete_tagged("file", "one") == 2
+    assert await backend.get_entry("a") is None
+    assert await backend.get_entry("d") is None
+    assert await backend.delete_tagged("file") == 1
+    assert (await backend.get_entry("c"))["data"] == {"x": 3}
+
+
+@pytest.mark.asyncio
+async def test_sqlite_upsert_expiry_and_reaping(tmp_path):
+    backend = SQLiteBackend(f"sqlite:///{tmp_path / 'cache.db'}")
+    await backend.db_action("connect")
+    try:
+        await backend.update_record("a", {"x": 1}, "file", "one", ttl=60, revision="r1")
+        await backend.update_record("a", {"x": 2}, "file", "two", ttl=60)
+        await backend.update_record("b", {"x": 3}, "file", "one", ttl=60)
+        entry = await backend.get_entry("a")
+        assert entry["data"] == {"x": 2}
+        assert (entry["sheet_name"], entry["revision"]) == ("two", None)
+        count = sqlalchemy.select([sqlalchemy.func.count()]).select_from(backend.table)
+        assert await backend.database.fetch_val(count) == 2
+
+        past = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        table = backend.table
+        query = table.update().where(table.c.request_id == "b")
+        await backend.database.execute(query.values(expires_at=past))
+        assert await backend.get_entry("b") is None
+        await backend.reap_expired()
+        assert await backend.database.fetch_val(count) == 1
+        assert (await backend.get_entry("a"))["data"] == {"x": 2}
+
+        # rows tagged before worksheets were tagged go with any of them
+        await backend.update_record("c", {"x": 4}, "file", ANY_SHEET)
+        generation = await backend.generation("file")
+        assert await backend.delete_tagged("file", "one") == 1
+        assert await backend.get_entry("c") is None
+        assert await backend.generation("file") not in ("", generation)
+    finally:
+        await backend.db_action("disconnect")
+
+
+@pytest.mark.asyncio
+async def test_workers_see_each_others_invalidations_once_stale():
+    backend = MemoryBackend()
+    first, second = [TieredCache(TTLCache(max_size=10, ttl=300), backend) for _ in "ab"]
+    await first.update_record("a", {"x": 1}, "file", "one", ttl=60)
+    assert (await second.get_entry("a", fresh=60))["data"] == {"x": 1}
+    await first.delete_tagged("file")
+    # still fresh, served from the second worker's own tier
+    assert (await second.get_entry("a", fresh=60))["data"] == {"x": 1}
+    entry = second.local.get("a")
+    entry["created_at"] -= datetime.timedelta(seconds=61)
+    assert await second.get_entry("a", fresh=60) is None
+    assert second.local.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_redis_entries_tags_and_generations():
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    backend = RedisBackend("redis://fake", client=client)
+    await backend.update_record("a", {"x": 1}, "file", "one", ttl=60, revision="r1")
+    await backend.update_record("b", {"x": 2}, "file", "two")
+    await backend.update_record("c", {"x": 3}, "other", "one", ttl=60)
+    await backend.update_record("d", {"x": 4}, "file", ANY_SHEET)
+    entry = await backend.get_entry("a")
+    assert entry["data"] == {"x": 1} and entry["revision"] == "r1"
+    assert entry["expires_at"] > entry["created_at"]
+    assert 0 < await client.ttl(backend.key("a")) <= 60
+
+    assert await backend.generation("file") == ""
+    assert await backend.delete_tagged("file", "one") == 2
+    assert await backend.get_entry("a") is None
+    assert await backend.get_entry("d") is None
+    assert await backend.generation("file") == "1"
+    assert await backend.delete_tagged("file") == 1
+    assert await backend.generation("file") == "2"
+    assert (await backend.get_entry("c"))["data"] == {"x": 3}
+
+    # tag sets keep no members whose entry is gone
+    await client.delete(backend.key("c"))
+    await backend.reap_expired()
+    assert await client.smembers(backend.tag_key("other")) == set()
+    await backend.purge_db()
+    assert await client.keys("gsheet:*") == []
@@ -0,0 +1,38 @@
+import datetime
+
+from gsheet_service.app_models import cache_tags, content_etag, freshness, request_key
+
+
+def test_request_key_is_canonical():
+    first = request_key({"link": "a", "sheet": "b", "method": "read_row"}, "secret")
+    second = request_key({"method": "read_row", "sheet": "b", "link": "a"}, "secret")
+    assert first == second
+    assert len(first) == 64
+    assert request_key({"link": "a"}, "secret") != request_key({"link": "b"}, "secret")
+    assert request_key({"link": "a"}, "secret") != request_key({"link": "a"}, "other")
+
+
+def test_content_etag():
+    etag = content_etag({"a": 1, "b": [1, 2]})
+    assert etag == content_etag({"b": [1, 2], "a": 1})
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag != content_etag({"a": 2, "b": [1, 2]})
+
+
+def test_cache_tags():
+    link = "https://docs.google.com/spreadsheets/d/1AbC-xyz/edit#gid=0"
+    assert cache_tags(link, " Sheet1 ") == ("1AbC-xyz", "sheet1")
+    assert cache_tags(link) == ("1AbC-xyz", None)
+    assert cache_tags("not-a-link", "a") == ("not-a-link", "a")
+
+
+def test_freshness():
+    now = datetime.datetime.utcnow()
+    minutes = lambda n: now - datetime.timedelta(minutes=n)
+    assert freshness(minutes(0), 60, 600) == "fresh"
+    assert freshness(minutes(5), 60, 600) == "stale"
+    assert freshness(minutes(20), 60, 600) == "expired"
+    assert freshness(minutes(20), 0, 0) == "fresh"
+    assert freshness(minutes(5), 60, 600, max_age=600) == "expired"
+    assert freshness(minutes(0), 60, 600, max_age=600) == "fresh"
+    assert freshness(minutes(5), 0, 0, max_age=60) == "expired"
@@ -0,0 +1,77 @@
+import datetime
+import threading
+
+from gsheet_service.models import ClientPool
+
+
+class FakeAuth:
+    def __init__(self):
+        self.token = None
+        self.expiry = None
+
+
+class FakeClient:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.auth = FakeAuth()
+        self.logins = 0
+
+    def login(self):
+        self.logins += 1
+        self.auth.token = f"token-{self.logins}"
+        self.auth.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+
+def test_client_is_reused_for_the_same_credentials():
+    pool = ClientPool(factory=FakeClient)
+    first = pool.get_client(client_email="a@b.com", private_key="key")
+    second = pool.get_client(private_key="key", client_email="a@b.com")
+    other = pool.get_client(client_email="c@d.com", private_key="key")
+    assert first is second
+    assert first is not other
+    assert first.logins == 1
+    assert pool.stats == {"hits": 1, "misses": 2, "refreshes": 2, "evictions": 0}
+
+
+def test_token_is_refreshed_before_it_expires():
+    pool = ClientPool(refresh_margin=300, factory=FakeClient)
+    client = pool.get_client(client_email="a@b.com")
+    client.auth.expiry = datetime.datetime.utcnow() + datetime.timedelta(seconds=60)
+    pool.get_client(client_email="a@b.com")
+    assert client.logins == 2
+    assert pool.stats["refreshes"] == 2
+
+
+def test_least_recently_used_client_is_evicted():
+    pool = ClientPool(max_size=2, factory=FakeClient)
+    first = pool.get_client(client_email="1")
+    pool.get_client(client_email="2")
+    pool.get_client(client_email="1")
+    pool.get_client(client_email="3")
+    assert pool.stats["evictions"] == 1
+    assert pool.get_client(client_email="1") is first
+    assert pool.stats["misses"] == 3
+
+
+def test_slow_login_does_not_block_other_credentials():
+    started, release = threading.Event(), threading.Event()
+
+    class SlowClient(FakeClient):
+        def login(self):
+            if self.kwargs["client_email"] == "slow":
+                started.set()
+                release.wait(5)
+            super().login()
+
+    pool = ClientPool(factory=SlowClient)
+    slow = threading.Thread(target=pool.get_client, kwargs={"client_email": "slow"})
+    slow.start()
+    assert started.wait(5)
+    fast = threading.Thread(target=pool.get_client, kwargs={"client_email": "fast"})
+    fast.start()
+    # served while the other credential is still waiting on its token
+    fast.join(1)
+    assert not fast.is_alive()
+    release.set()
+    slow.join(5)
+    assert pool.stats["misses"] == 2
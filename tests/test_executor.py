@@ -0,0 +1,95 @@
+import asyncio
+import threading
+
+import pytest
+
+from gsheet_service.executor import (
+    ExecutorBusy,
+    ExecutorTimeout,
+    SheetExecutor,
+    SingleFlight,
+)
+
+
+class Blocking:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def wait(self, value):
+        self.release.wait(5)
+        return value
+
+
+@pytest.mark.asyncio
+async def test_proxy_runs_blocking_methods_on_the_pool():
+    executor = SheetExecutor(max_workers=2)
+    instance = await executor.instance(Blocking)
+    instance.release.set()
+    assert await instance.wait("done") == "done"
+    stats = executor.stats
+    assert stats["submitted"] == stats["completed"] == 2
+    assert stats["active"] == stats["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_calls_are_rejected_once_the_queue_is_full():
+    executor = SheetExecutor(max_workers=1, max_queue=1)
+    blocking = Blocking()
+    running = asyncio.ensure_future(executor.run(blocking.wait, 1))
+    await asyncio.sleep(0.05)
+    queued = asyncio.ensure_future(executor.run(blocking.wait, 2))
+    await asyncio.sleep(0.05)
+    with pytest.raises(ExecutorBusy):
+        await executor.run(blocking.wait, 3)
+    blocking.release.set()
+    assert await asyncio.gather(running, queued) == [1, 2]
+    assert executor.stats["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_calls_time_out():
+    executor = SheetExecutor(max_workers=1, timeout=0.05)
+    blocking = Blocking()
+    with pytest.raises(ExecutorTimeout):
+        await executor.run(blocking.wait, 1)
+    blocking.release.set()
+    assert executor.stats["timeouts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_identical_calls_share_one_result():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"id": 1}
+
+    results = await asyncio.gather(*[flight.run("key", fetch) for _ in range(5)])
+    assert results == [{"id": 1}] * 5
+    assert len(calls) == 1
+    assert flight.stats == {"calls": 1, "coalesced": 4, "in_flight": 0}
+    await flight.run("key", fetch)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_waiters_outlive_a_cancelled_first_caller():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        return {"id": 1}
+
+    first = asyncio.ensure_future(flight.run("key", fetch))
+    await asyncio.sleep(0)
+    waiter = asyncio.ensure_future(flight.run("key", fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await waiter == {"id": 1}
+    assert first.cancelled()
+    assert flight.stats["in_flight"] == 0
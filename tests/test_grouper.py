@@ -1,4 +1,11 @@
-from gsheet_service.models import get_cell_data, get_cells
+from gsheet_service.models import (
+    get_cell_data,
+    get_cells,
+    reference_plan,
+    reference_range,
+    referenced_columns,
+    referenced_values,
+)
 import pytest 
 import re
 sample_data = [
@@ -38,4 +45,27 @@ def test_grouping_similar_cells():
     #     "type": "text"
     # }
 
-    #"result_pairs":["Pretext","Comprehension"]
\ No newline at end of file
+    #"result_pairs":["Pretext","Comprehension"]
+
+
+def test_multi_letter_and_cross_sheet_references():
+    column = ['=AB12"', '"AB12"', "\"'Other sheet'!$C$4\"", '"Sheet2!D1" and "D1"', 7, ""]
+    assert get_cells(column) == ["'Other sheet'!$C$4", "AB12", "D1", "Sheet2!D1"]
+    assert reference_range("Main", "AB12") == "'Main'!AB12"
+    assert reference_range("Main", "'Other sheet'!$C$4") == "'Other sheet'!C4"
+    assert get_cell_data(["A1", "B2"], [[["x"]], []]) == {"A1": "x", "B2": ""}
+
+
+def test_references_are_resolved_once_across_columns():
+    positions = referenced_columns([" Pretext", "Comprehension"], ["comprehension", "PRETEXT", 1])
+    assert positions == [2, 1, 1]
+    cells, unique, ranges = reference_plan("Main", [['"D1"', '"D2"'], ['"D2"']])
+    assert unique == ["D1", "D2"]
+    assert ranges == ["'Main'!D1", "'Main'!D2"]
+    values = [[["one"]], [["two"]]]
+    assert referenced_values(["a", "b"], cells, unique, values) == {
+        "a": {"D1": "one", "D2": "two"},
+        "b": {"D2": "two"},
+    }
+    with pytest.raises(KeyError):
+        referenced_columns(["Pretext"], ["missing"])
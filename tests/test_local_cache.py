@@ -0,0 +1,35 @@
+from gsheet_service.local_cache import TTLCache
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache(ttl=10, timer=clock)
+    cache.set("link", {"title": "Sheet"})
+    assert cache.get("link") == {"title": "Sheet"}
+    clock.now = 11
+    assert cache.get("link") is None
+    assert cache.stats == {"hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_entries_are_bounded_by_bytes():
+    cache = TTLCache(max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "yyyy")
+    cache.set("c", "zzzz")
+    assert cache.get("a") is None
+    assert cache.bytes == 8
+    cache.set("d", "w" * 11)
+    assert cache.get("d") is None
+    assert cache.delete_where(lambda key, value: value.startswith("z")) == 1
+    assert cache.bytes == 4
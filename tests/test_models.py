@@ -1,9 +1,12 @@
+import concurrent.futures
+import threading
 from re import sub
 import sys
 sys.path.append('path')
 # import unittest
 import pytest
 import gsheet_service.models as models
+from tests.fake_sheets import LINK
 
 test_response = [3,5,6,74,3,5,7,3,2,2,5,79,6,5,4,4,3,2,5,7,8,9,7,6,5]
 page_size = 3
@@ -64,3 +67,206 @@ def test_paginate_response():
     result2_length = len(result2)
     assert result2_length == 9
 
+
+
+def test_sheet_snapshot():
+    snapshot = models.SheetSnapshot(
+        [["id", "name", "score", "id"], ["1", "Ada", "30", ""], ["2", "Bola", "", ""]]
+    )
+    assert snapshot.indexes == {"id": 1, "name": 2, "score": 3}
+    assert snapshot.row_count == 3
+    assert snapshot.row_to_write() == 4
+    assert snapshot.records()[0] == {"id": "", "name": "Ada", "score": 30}
+    assert snapshot.records() is snapshot.records()
+    assert models.SheetSnapshot([]).records() == []
+
+
+def test_a1_range():
+    assert models.a1_range(1, 1, 1, 3) == "A1:C1"
+    assert models.a1_range(5, 2, 7, 28) == "B5:AB7"
+
+
+def test_sheet_snapshot_lookup():
+    snapshot = models.SheetSnapshot(
+        [["id", "name"], ["a1", "Ada"], ["b2", "Bola"], ["a1", "Chi"]]
+    )
+    assert snapshot.lookup("id") == {"a1": [2, 4], "b2": [3]}
+    assert snapshot.find("id", ["a1", "zz", "b2"]) == [
+        {"id": "a1", "name": "Ada"},
+        {"id": "b2", "name": "Bola"},
+    ]
+    assert snapshot.find("name", ["BOLA"], case_insensitive=True)[0]["id"] == "b2"
+    snapshot.append_row(["c3", "Dayo"])
+    assert snapshot.lookup("id")["c3"] == [5]
+    snapshot.replace_row(3, ["a1", "Bola"])
+    assert snapshot.lookup("id") == {"a1": [2, 3, 4], "c3": [5]}
+    assert snapshot.plan_updates("id", [("a1", {"name": "Eno"})])[1] == [4]
+
+
+def test_column_projection():
+    heading = ["id", "name", "score", "level", "notes"]
+    names = models.resolve_columns(heading, ["level", 1, "score"])
+    assert names == ["level", "id", "score"]
+    runs = models.column_runs(heading, names)
+    assert runs == [(1, 1), (3, 4)]
+    assert models.column_range(3, 4) == "C2:D"
+    assert models.column_range(3, 4, first_row=5, last_row=9) == "C6:D10"
+    results = [[["a"], ["b"], ["c"]], [["30", "2"], [], ["12"]]]
+    assert models.merge_columns(heading, names, runs, results) == [
+        {"level": 2, "id": "a", "score": 30},
+        {"level": "", "id": "b", "score": ""},
+        {"level": "", "id": "c", "score": 12},
+    ]
+    with pytest.raises(KeyError):
+        models.resolve_columns(heading, ["missing"])
+
+
+def test_page_bounds():
+    for page in range(1, 5):
+        start, end = models.page_bounds(len(combined_array), 4, page)
+        expected = models.paginate_response(combined_array, 4)[page - 1]
+        assert combined_array[start:end] == expected
+    assert models.get_page(["a", "a", "a"], page_size=3, page=3)["first_row"] == 3
+    assert models.page_bounds(0, 20, 1) == (0, 0)
+    with pytest.raises(IndexError):
+        models.page_bounds(10, 2, 3)
+
+
+def test_cursor():
+    cursor = models.next_cursor(["id", 1], 1, 4, 23, 5)
+    assert models.page_request(["id", 1], 1, 4, cursor) == (2, 4, 23)
+    assert models.next_cursor(["id", 1], 4, 4, 23, 23) is None
+    with pytest.raises(ValueError):
+        models.page_request(["id", 2], 1, 4, cursor)
+    with pytest.raises(ValueError):
+        models.page_request(["id", 1], 1, 4, "garbage")
+
+
+def test_as_dict():
+    rows = [["id", "name"], ["a1", "Ada"], ["b2"], ["c3", "Cy", "extra"]]
+    assert models.as_dict(rows) == [
+        {"id": "a1", "name": "Ada"},
+        {"id": "b2", "name": ""},
+        {"id": "c3", "name": "Cy"},
+    ]
+    assert models.as_dict(rows[1:2], heading=["id", "name", "age"]) == [
+        {"id": "a1", "name": "Ada", "age": ""}
+    ]
+    assert models.as_dict([]) == []
+
+
+def test_batch_chunks():
+    ranges = [f"'Sheet 1'!A{i}:B{i}" for i in range(1, 8)]
+    assert models.batch_chunks(ranges, max_ranges=3) == [
+        ranges[:3],
+        ranges[3:6],
+        ranges[6:],
+    ]
+    chunks = models.batch_chunks(ranges, max_length=100)
+    assert [x for y in chunks for x in y] == ranges
+    assert all(len(x) < len(ranges) for x in chunks)
+    assert models.batch_chunks([]) == []
+
+
+def test_record_count_ignores_blank_key_cells(sheets):
+    sheets.add_sheet("Blank", [["id", "name"], ["a1", "Ada"], ["", "Bo"], ["a3", "Cy"]])
+    instance = models.GoogleSheetInterface(key_location="key.json")
+    instance.load_file(LINK, "Blank")
+    assert instance.record_count() == 3
+    # counted over the first column, the sheet is not downloaded
+    assert sheets.calls[-1] == ("batchGet", ["'Blank'!A2:A"])
+    assert instance.cached_snapshot() is None
+    assert instance.page_window(page=1, page_size=1)["end"] == 3
+    # the loaded sheet agrees
+    instance.snapshot()
+    assert instance.record_count() == 3
+
+
+def test_cold_pages_read_only_their_cells(sheets):
+    sheets.add_sheet("Wide", [["id", "a", "b"]] + [[f"r{i}", i, i] for i in range(9)])
+    instance = models.GoogleSheetInterface(key_location="key.json")
+    instance.load_file(LINK, "Wide")
+    sheets.calls.clear()
+    result = instance.read_page(page=1, page_size=3, columns=["id"])
+    assert [x["id"] for x in result["questions"]] == ["r0", "r1", "r2"]
+    assert result["total_row_count"] == 9
+    assert sheets.calls == [
+        ("batchGet", ["'Wide'!A2:A"]),
+        ("get", "'Wide'!A1:1"),
+        ("batchGet", ["'Wide'!A2:A4"]),
+    ]
+    assert instance.cached_snapshot() is None
+
+
+def test_batch_plan_and_results(sheets):
+    targets = [("Sheet1", 100), ("Sheet1", 100), ("Other", 101), None, ("Sheet1", 100)]
+    specs = [
+        {"sheet": "Sheet1", "columns": ["col1"], "first_row": 1, "last_row": 2},
+        {"sheet": "sheet1", "key": "id", "value": "r3", "columns": ["col2"]},
+        {"sheet": "Other", "range": "A1:B2"},
+        {"sheet": "Missing"},
+        {"sheet": "Sheet1", "range": "B2"},
+    ]
+    ranges, plan, pending = models.batch_plan("fake", targets, specs)
+    # both specs of Sheet1 share one read of the sheet
+    assert ranges == ["'Sheet1'", "'Other'!A1:B2", "'Sheet1'!B2"]
+    assert plan == [
+        ("pending", ("fake", 100)),
+        ("pending", ("fake", 100)),
+        ("range", 1),
+        ("error", "Missing `sheet` in spreadsheet"),
+        ("range", 2),
+    ]
+    values = [sheets.read(x).get("values", []) for x in ranges]
+    results = models.batch_results(specs, plan, pending, values)
+    assert results == [
+        {"data": [{"col1": "v1-1"}, {"col1": "v2-1"}]},
+        {"data": {"col2": "v3-2", "id": "r3"}},
+        {"data": [["a", "b"], ["1", "2"]]},
+        {"error": "Missing `sheet` in spreadsheet"},
+        {"data": [["v1-1"]]},
+    ]
+    # the sheet read is kept, the next plan answers from it
+    ranges, plan, pending = models.batch_plan("fake", targets[:1], specs[:1])
+    assert ranges == [] and pending == {}
+    assert plan[0][0] == "snapshot"
+    assert models.batch_results(specs[:1], plan, pending, []) == results[:1]
+
+
+def test_concurrent_adds_keep_the_cached_snapshot_in_step(sheets):
+    # both writers plan against the same refreshed snapshot before writing
+    ready = threading.Barrier(2)
+    request = sheets.request
+
+    def racing(method, url, **kwargs):
+        if method == "put":
+            ready.wait(timeout=5)
+        return request(method, url, **kwargs)
+
+    sheets.request = racing
+
+    def add(row):
+        instance = models.GoogleSheetInterface(key_location="key.json")
+        instance.load_file(LINK, "Sheet1")
+        return instance.update_records(row)
+
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        list(pool.map(add, [["r6", "a"], ["r7", "b"]]))
+    # both landed on the same row of the sheet, the cache holds what won
+    sheets.request = request
+    snapshot = models.snapshot_cache.get(("fake", 100))
+    assert snapshot.values == models.utils.fill_gaps(sheets.read("Sheet1")["values"])
+    assert snapshot.row_count == 7
+
+
+def test_column_reads_keep_blank_trailing_cells(sheets):
+    sheets.add_sheet("Notes", [["id", "notes"], ["a", "x"], ["b", ""], ["c", ""]])
+    instance = models.GoogleSheetInterface(key_location="key.json")
+    instance.load_file(LINK, "Notes")
+    cold = instance.read_columns(["notes"], 1, 3)
+    assert cold == [{"notes": "x"}, {"notes": ""}, {"notes": ""}]
+    assert instance.read_last_row(columns=["notes"]) == {"notes": ""}
+    assert instance.read_columns(["notes"], 2) == [{"notes": ""}, {"notes": ""}]
+    instance.snapshot()
+    assert instance.read_columns(["notes"], 1, 3) == cold
+    assert instance.read_last_row(columns=["notes"]) == {"notes": ""}
@@ -0,0 +1,64 @@
+import pytest
+
+from gsheet_service import models, service, settings
+from tests.fake_sheets import FILE_ID, LINK
+
+
+async def streamed(records):
+    return [x async for x in records]
+
+
+@pytest.mark.asyncio
+async def test_cold_streams_read_one_chunk_at_a_time(sheets, monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_CHUNK_SIZE", 2)
+    result = await service.stream_rows(LINK, "Sheet1", columns=["id", "col1"])
+    records = await streamed(result.data)
+    assert [x["id"] for x in records] == ["r1", "r2", "r3", "r4", "r5"]
+    assert [x for x in sheets.calls if x[0] != "metadata"] == [
+        ("get", "'Sheet1'!A1:1"),
+        ("batchGet", ["'Sheet1'!A2:B3", "'Sheet1'!A2:A"]),
+        ("batchGet", ["'Sheet1'!A4:B5"]),
+        ("batchGet", ["'Sheet1'!A6:B7"]),
+    ]
+    # the sheet was never downloaded whole nor kept
+    assert models.snapshot_cache.get((FILE_ID, 100)) is None
+
+
+@pytest.mark.asyncio
+async def test_streams_stop_at_the_last_row_asked_for(sheets, monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_CHUNK_SIZE", 2)
+    result = await service.stream_rows(LINK, "Sheet1", ["id"], first_row=2, last_row=4)
+    assert await streamed(result.data) == [{"id": "r2"}, {"id": "r3"}, {"id": "r4"}]
+    assert sheets.count("batchGet") == 2
+
+
+@pytest.mark.asyncio
+async def test_streamed_pages_are_counted_without_loading_the_sheet(
+    sheets, monkeypatch
+):
+    monkeypatch.setattr(settings, "STREAM_CHUNK_SIZE", 1)
+    result = await service.stream_page(LINK, "Sheet1", 1, 2, columns=["col2"])
+    assert result.data["total_row_count"] == 5
+    records = await streamed(result.data["questions"])
+    assert records == [{"col2": "v1-2"}, {"col2": "v2-2"}]
+    assert models.snapshot_cache.get((FILE_ID, 100)) is None
+
+
+@pytest.mark.asyncio
+async def test_bad_batch_specs_only_fail_themselves(sheets):
+    specs = [
+        {"sheet": "Sheet1", "range": "B2:C2"},
+        {"sheet": "Sheet1", "range": "not a range!"},
+        "Sheet1",
+        {"sheet": "Other", "range": ["A2"]},
+        {"sheet": "Other", "range": "$A$2"},
+    ]
+    result = await service.batch_read(LINK, specs)
+    assert result.data == [
+        {"data": [["v1-1", "v1-2"]]},
+        {"error": "Wrong `range` passed"},
+        {"error": "Wrong spec passed, expected an object"},
+        {"error": "Wrong `range` passed"},
+        {"data": [["1"]]},
+    ]
+    assert sheets.count("batchGet") == 1
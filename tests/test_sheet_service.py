@@ -0,0 +1,176 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from gsheet_service import app_models, cache_backends, settings, sheet_service
+from gsheet_service.local_cache import TTLCache
+from tests.fake_sheets import LINK
+
+
+@pytest.mark.asyncio
+async def test_names_of_the_same_worksheet_share_cache_tags(sheets, request_cache):
+    read = {"link": LINK, "sheet": "Sheet", "key": "id", "value": "r2"}
+    result = await sheet_service.read_row(**read)
+    assert result.data["col1"] == "v2-1"
+    assert sheet_service.sheet_tags(LINK, "sheet1") == ("fake", "100")
+    assert await sheet_service.invalidate(LINK, "Sheet1") == 1
+    assert await sheet_service.invalidate(LINK, "Sheet") == 0
+
+
+async def refreshed():
+    await asyncio.gather(*sheet_service.refresh_tasks)
+    # let the refreshed entry go stale again
+    await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_edits_are_served_once_the_revision_changes(
+    sheets, request_cache, monkeypatch
+):
+    # every entry is stale right away and revalidated in the background
+    monkeypatch.setattr(settings, "CACHE_FRESH_TTL", 0.001)
+    read = {"link": LINK, "sheet": "Sheet1", "key": "id", "value": "r2"}
+    assert (await sheet_service.read_row(**read)).data["col1"] == "v2-1"
+    # a read of another request keeps the sheet values cached in `models`
+    await sheet_service.read_row(**{**read, "value": "r3"})
+    sheets.write("'Sheet1'!B3", [["edited"]])
+    sheet_service.revisions.clear()
+    await asyncio.sleep(0.01)
+
+    assert (await sheet_service.read_row(**read)).data["col1"] == "v2-1"
+    await refreshed()
+    assert (await sheet_service.read_row(**read)).data["col1"] == "edited"
+    await refreshed()
+    assert (await sheet_service.read_row(**read)).data["col1"] == "edited"
+
+
+@pytest.mark.asyncio
+async def test_requests_missing_the_same_parts_share_one_read(
+    sheets, request_cache, monkeypatch
+):
+    reads = []
+    fetch_groups = sheet_service.service.fetch_groups
+
+    async def counted(link, sheet, segments):
+        reads.append(segments)
+        await asyncio.sleep(0.01)
+        return await fetch_groups(link, sheet, segments)
+
+    monkeypatch.setattr(sheet_service.service, "fetch_groups", counted)
+    first = {"cell_range": "A2:B2", "heading": ["id", "col1"]}
+    second = {"cell_range": "A3:B3", "heading": ["id", "col1"]}
+    read = {"link": LINK, "sheet": "Sheet1"}
+    results = await asyncio.gather(
+        sheet_service.fetch_groups(**read, segments=[first, second]),
+        sheet_service.fetch_groups(**read, segments=[second, first]),
+    )
+    assert len(reads) == 1
+    assert [x[0]["id"] for x in results[0].data] == ["r1", "r2"]
+    assert [x[0]["id"] for x in results[1].data] == ["r2", "r1"]
+
+
+@pytest.mark.asyncio
+async def test_stale_parts_are_kept_while_the_revision_is_unchanged(
+    sheets, request_cache, monkeypatch
+):
+    monkeypatch.setattr(settings, "CACHE_FRESH_TTL", 0.001)
+    specs = [{"sheet": "Sheet1", "range": "B2"}, {"sheet": "Other", "range": "A2"}]
+    read = {"link": LINK, "specs": specs}
+    assert (await sheet_service.batch_read(**read)).data["0"]["data"] == [["v1-1"]]
+    reads = sheets.count("batchGet")
+    await asyncio.sleep(0.01)
+
+    await sheet_service.batch_read(**read)
+    await refreshed()
+    assert sheets.count("batchGet") == reads
+
+    sheets.write("'Sheet1'!B2", [["edited"]])
+    sheet_service.revisions.clear()
+    await sheet_service.batch_read(**read)
+    await refreshed()
+    result = await sheet_service.batch_read(**read)
+    assert result.data["0"]["data"] == [["edited"]]
+    assert sheets.count("batchGet") == reads + 1
+
+
+@pytest.mark.asyncio
+async def test_batch_read_names_its_results(sheets, request_cache):
+    specs = [
+        {"name": "first", "sheet": "Sheet1", "key": "id", "value": "r1"},
+        {"sheet": "Nope"},
+        {"name": "cell", "sheet": "Other", "range": "B2"},
+    ]
+    result = await sheet_service.batch_read(link=LINK, specs=specs)
+    assert result.data == {
+        "first": {
+            "status": True,
+            "data": {"id": "r1", "col1": "v1-1", "col2": "v1-2", "col3": "v1-3"},
+        },
+        "1": {"status": False, "msg": "Missing `sheet` in spreadsheet"},
+        "cell": {"status": True, "data": [["2"]]},
+    }
+    result = await sheet_service.batch_read(link=LINK, specs=["Sheet1"])
+    assert result.data == {
+        "0": {"status": False, "msg": "Wrong spec passed, expected an object"}
+    }
+    specs = [{"name": "a", "sheet": "Sheet1"}, {"name": "a", "sheet": "Other"}]
+    result = await sheet_service.batch_read(link=LINK, specs=specs)
+    assert result.error == "Duplicate `name` in `specs`"
+
+
+@pytest.mark.asyncio
+async def test_invalidations_of_other_workers_reach_every_cache_tier(
+    sheets, request_cache, monkeypatch
+):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    def worker():
+        backend = cache_backends.RedisBackend("redis://fake", client=client)
+        return app_models.TieredCache(TTLCache(max_size=10, ttl=300), backend)
+
+    monkeypatch.setattr(sheet_service, "request_cache", worker())
+    read = {"link": LINK, "sheet": "Sheet1", "key": "id", "value": "r2"}
+    assert (await sheet_service.read_row(**read)).data["col1"] == "v2-1"
+    sheets.write("'Sheet1'!B3", [["edited"]])
+    # the worker that made the write drops the shared entries
+    await worker().delete_tagged("fake", "100")
+
+    # seen once the generation is checked again
+    assert (await sheet_service.read_row(**read)).data["col1"] == "v2-1"
+    sheet_service.generations.clear()
+    # neither the local entry nor the worksheet values cached in `models`
+    assert (await sheet_service.read_row(**read)).data["col1"] == "edited"
+
+
+@pytest.mark.asyncio
+async def test_max_age_also_rules_out_older_worksheet_values(sheets, request_cache):
+    read = {"link": LINK, "sheet": "Sheet1", "key": "id", "value": "r2"}
+    assert (await sheet_service.read_row(**read)).data["col1"] == "v2-1"
+    # a read of another request keeps the sheet values cached in `models`
+    await sheet_service.read_row(**{**read, "value": "r3"})
+    sheets.write("'Sheet1'!B3", [["edited"]])
+    await asyncio.sleep(0.02)
+
+    result = await sheet_service.read_row(**read, max_age=0.01)
+    assert result.data["col1"] == "edited"
+    calls = len(sheets.calls)
+    # the values read since then are young enough
+    other = await sheet_service.read_row(**{**read, "value": "r4"}, max_age=1)
+    assert other.data["col1"] == "v4-1"
+    assert len(sheets.calls) == calls
+
+
+@pytest.mark.asyncio
+async def test_referenced_cells_follow_writes_to_the_sheet_they_point_to(
+    sheets, request_cache
+):
+    sheets.write("'Sheet1'!B2", [['=HYPERLINK("#", "\'Other\'!B2")']])
+    read = {"link": LINK, "sheet": "Sheet1", "options": {"columns": ["col1"]}}
+    result = await sheet_service.read_referenced_cell(**read)
+    assert result.data == {"col1": {"'Other'!B2": "2"}}
+
+    sheets.write("'Other'!B2", [["edited"]])
+    await sheet_service.invalidate(LINK, "Other")
+    result = await sheet_service.read_referenced_cell(**read)
+    assert result.data == {"col1": {"'Other'!B2": "edited"}}
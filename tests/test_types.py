@@ -0,0 +1,53 @@
+import pytest
+
+from gsheet_service import models, types
+from tests.fake_sheets import LINK
+
+
+@pytest.fixture
+def registry(clock):
+    return types.ProviderRegistry(ttl=60, max_size=2, timer=clock)
+
+
+@pytest.mark.asyncio
+async def test_lookup_is_case_insensitive(sheets, registry):
+    found = await registry.lookup(LINK, "SHEET1", "R2")
+    assert found == {"id": "r2", "col1": "v2-1", "col2": "v2-2", "col3": "v2-3"}
+    assert await registry.lookup(LINK, "sheet1", "v3-1", key="col1") is not None
+    assert await registry.lookup(LINK, "Sheet1", "missing") is None
+    assert registry.stats["loads"] == 1
+
+
+@pytest.mark.asyncio
+async def test_loaded_sheets_expire(sheets, registry, clock):
+    await registry.lookup(LINK, "Sheet1", "r1")
+    sheets.write("'Sheet1'!B2", [["edited"]])
+    models.forget_spreadsheet("fake")
+    clock.now = 59
+    assert (await registry.lookup(LINK, "Sheet1", "r1"))["col1"] == "v1-1"
+    clock.now = 61
+    assert (await registry.lookup(LINK, "Sheet1", "r1"))["col1"] == "edited"
+    assert registry.stats["loads"] == 2
+
+
+@pytest.mark.asyncio
+async def test_reload_forgets_the_given_sheet(sheets, registry):
+    await registry.lookup(LINK, "Sheet1", "r1")
+    await registry.lookup(LINK, "Other", "1", key="a")
+    assert registry.reload(LINK, "OTHER") == 1
+    assert registry.reload("https://example.com") == 0
+    await registry.lookup(LINK, "Sheet1", "r1")
+    assert registry.stats["loads"] == 2
+    await registry.lookup(LINK, "Other", "1", key="a")
+    assert registry.stats["loads"] == 3
+    assert registry.reload() == 2
+
+
+@pytest.mark.asyncio
+async def test_loaded_sheets_are_bounded(sheets, registry):
+    sheets.add_sheet("Third", [["id"], ["t1"]])
+    for sheet in ("Sheet1", "Other", "Third"):
+        await registry.entry(LINK, sheet)
+    assert len(registry.sheets) == 2
+    await registry.entry(LINK, "Sheet1")
+    assert registry.stats["loads"] == 4
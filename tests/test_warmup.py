@@ -0,0 +1,59 @@
+import httpx
+import pytest
+
+from gsheet_service import models, settings, types, views, warmup
+from tests.fake_sheets import FILE_ID, LINK
+
+
+@pytest.fixture
+def warmer(sheets, monkeypatch):
+    warmer = warmup.Warmup(
+        [(LINK, "Sheet1"), (LINK, None), (LINK, "Missing")], [(LINK, "Other")]
+    )
+    monkeypatch.setattr(warmup, "warmer", warmer)
+    yield warmer
+    types.provider_registry.reload()
+
+
+def test_warmup_targets(monkeypatch):
+    sheets = [" link1 | Sheet1 ", "link1|Sheet1", "link2", "|Sheet1", "link3|"]
+    monkeypatch.setattr(settings, "WARMUP_SHEETS", sheets)
+    assert warmup.warmup_targets() == [
+        ("link1", "Sheet1"),
+        ("link2", None),
+        ("link3", None),
+    ]
+
+
+def test_provider_targets(monkeypatch):
+    monkeypatch.setattr(settings, "MEDIA_SPREADSHEET", "media")
+    monkeypatch.setattr(settings, "MEDIA_SHEET_NAME", "Sheet1")
+    monkeypatch.setattr(settings, "SCHEDULER_SPREADSHEET", "")
+    monkeypatch.setattr(settings, "OAUTH_SPREADSHEET", "media")
+    monkeypatch.setattr(settings, "OAUTH_SHEET_NAME", "Sheet1")
+    assert warmup.provider_targets() == [("media", "Sheet1")]
+
+
+@pytest.mark.asyncio
+async def test_ready_after_the_first_run(warmer):
+    assert not warmer.ready
+    await warmer.run()
+    assert warmer.ready
+    assert warmer.runs == 1
+    # a sheet that can not be loaded does not hold the others back
+    assert list(warmer.failures) == [f"{LINK}|Missing"]
+    assert models.metadata_cache.get(FILE_ID)
+    assert models.snapshot_cache.get((FILE_ID, 100))
+    assert len(types.provider_registry.sheets) == 1
+
+
+@pytest.mark.asyncio
+async def test_health_waits_for_the_warmup(warmer):
+    async with httpx.AsyncClient(app=views.app, base_url="http://test") as client:
+        response = await client.get("/health")
+        assert response.status_code == 503
+        assert response.json()["data"]["ready"] is False
+        await warmer.run()
+        response = await client.get("/health")
+        assert response.status_code == 200
+        assert response.json()["data"]["warmup"]["targets"] == 4
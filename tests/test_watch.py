@@ -0,0 +1,51 @@
+import httpx
+import pytest
+import pytest_asyncio
+
+from gsheet_service import models, settings, sheet_service, types, views
+from gsheet_service import watch_service
+from tests.fake_sheets import FILE_ID, LINK
+
+
+@pytest_asyncio.fixture
+async def notifier(monkeypatch):
+    monkeypatch.setattr(settings, "HOST_PROVIDER", "http://test")
+    monkeypatch.setattr(settings, "WATCH_SCHEDULER", None)
+    async with httpx.AsyncClient(app=views.app, base_url="http://test") as client:
+        notifier = watch_service.LocalNotifier(client=client)
+        monkeypatch.setattr(watch_service, "notifier", notifier)
+        yield notifier
+    watch_service.channels.clear()
+    types.provider_registry.reload()
+
+
+@pytest.mark.asyncio
+async def test_notifications_drop_the_cached_spreadsheet(
+    sheets, request_cache, notifier
+):
+    read = {"link": LINK, "sheet": "Sheet1", "key": "id", "value": "r2"}
+    await sheet_service.read_row(**read)
+    await types.provider_registry.entry(LINK, "Sheet1")
+    key = sheet_service.encode_obj({**read, "method": "read_row"})
+    assert await request_cache.get_entry(key)
+    assert models.metadata_cache.get(FILE_ID)
+    assert models.snapshot_cache.get((FILE_ID, 100))
+    assert len(types.provider_registry.sheets) == 1
+
+    result = await watch_service.watch_spreadsheet(LINK)
+    assert result.data["resource_id"] == f"local-{FILE_ID}"
+    await notifier.notify(FILE_ID)
+
+    assert await request_cache.get_entry(key) is None
+    assert models.metadata_cache.get(FILE_ID) is None
+    assert models.snapshot_cache.get((FILE_ID, 100)) is None
+    assert len(types.provider_registry.sheets) == 0
+
+
+@pytest.mark.asyncio
+async def test_notifications_need_a_channel_token(notifier):
+    response = await notifier.client.post(
+        "/watch/notify", headers={"X-Goog-Channel-Token": f"{FILE_ID}:forged"}
+    )
+    assert response.status_code == 400
+    assert response.json()["msg"] == "Invalid channel token"